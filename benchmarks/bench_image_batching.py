@@ -0,0 +1,97 @@
+"""
+Compares image throughput of single submission against cross-user batching.
+
+Forge is simulated with a cost model: every submission pays a fixed overhead (queue join,
+SSE setup, VAE/model warmup) plus a per-image sampling cost that shrinks with batch size as
+the GPU is better utilised. Only jobs with the same prompt share a batch. By default every job
+has its own prompt, as LLM-written image prompts do; --prompts N makes users draw from a pool of
+N distinct ones instead (e.g. shared presets), the best case for batching. Run with:
+
+    python -m benchmarks.bench_image_batching --users 8 --jobs-per-user 4
+"""
+import argparse
+import threading
+import time
+
+from src.image_batcher import ImageBatcher
+
+
+def make_simulated_forge(overhead_s, per_image_s, batch_efficiency):
+    submissions = []
+
+    def generate_batch(prompts, params, traces=None, settings=None, cancel_token=None):
+        n = len(prompts)
+        submissions.append(n)
+        # Sampling n images together costs n ** batch_efficiency image-times
+        time.sleep(overhead_s + per_image_s * (n ** batch_efficiency))
+        return [f"/tmp/{prompt}-{i}.png" for i, prompt in enumerate(prompts)]
+
+    return generate_batch, submissions
+
+
+def run(max_batch_size, max_wait_ms, users, jobs_per_user, distinct_prompts, think_time_s, forge_args):
+    generate_batch, submissions = make_simulated_forge(*forge_args)
+    batcher = ImageBatcher(generate_batch=generate_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batcher.start()
+    latencies = []
+    lock = threading.Lock()
+
+    def user(index):
+        for job in range(jobs_per_user):
+            started = time.perf_counter()
+            prompt = f"prompt{(index + job) % distinct_prompts}" if distinct_prompts else f"user{index}-prompt{job}"
+            result = batcher.generate(prompt)
+            elapsed = time.perf_counter() - started
+            assert result.startswith(f"/tmp/{prompt}-")
+            with lock:
+                latencies.append(elapsed)
+            time.sleep(think_time_s)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    batcher.stop()
+
+    latencies.sort()
+    total = users * jobs_per_user
+    return {
+        "images_per_s": total / wall,
+        "wall_s": wall,
+        "submissions": len(submissions),
+        "mean_batch": total / len(submissions),
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--jobs-per-user", type=int, default=4)
+    parser.add_argument("--prompts", type=int, default=0, help="distinct prompts users choose from (0: every job unique)")
+    parser.add_argument("--think-time", type=float, default=0.05, help="seconds between a user's requests")
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--max-wait-ms", type=int, default=250)
+    parser.add_argument("--overhead", type=float, default=0.15, help="simulated fixed cost per Forge submission (s)")
+    parser.add_argument("--per-image", type=float, default=0.2, help="simulated sampling cost of one image (s)")
+    parser.add_argument("--batch-efficiency", type=float, default=0.7, help="exponent applied to batch size for sampling cost")
+    args = parser.parse_args()
+
+    forge_args = (args.overhead, args.per_image, args.batch_efficiency)
+    results = {
+        "single": run(1, 0, args.users, args.jobs_per_user, args.prompts, args.think_time, forge_args),
+        "batched": run(args.max_batch_size, args.max_wait_ms, args.users, args.jobs_per_user, args.prompts, args.think_time, forge_args),
+    }
+
+    print(f"{'mode':<10}{'img/s':>8}{'wall s':>9}{'submits':>9}{'avg batch':>11}{'p50 s':>8}{'p95 s':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<10}{r['images_per_s']:>8.2f}{r['wall_s']:>9.2f}{r['submissions']:>9}{r['mean_batch']:>11.2f}{r['p50_s']:>8.2f}{r['p95_s']:>8.2f}")
+    print(f"speedup: {results['batched']['images_per_s'] / results['single']['images_per_s']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
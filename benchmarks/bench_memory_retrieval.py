@@ -0,0 +1,74 @@
+"""
+Measures the cost of long-term memory retrieval as a conversation's index grows.
+
+Random unit vectors stand in for embeddings (the search cost does not depend on their content).
+For each index size it times one query, a batch of queries scored in a single matrix product,
+and a save/load round trip of the index file. Run with:
+
+    python -m benchmarks.bench_memory_retrieval --sizes 1000 10000 50000 --dim 768
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.memory import VectorIndex
+
+
+def timed(func, repeat):
+    """Returns the median wall time of func() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def run(size, dim, k, batch, repeat, rng):
+    index = VectorIndex(dim)
+    chunk = 4096
+    started = time.perf_counter()
+    for offset in range(0, size, chunk):
+        n = min(chunk, size - offset)
+        index.add(rng.standard_normal((n, dim), dtype=np.float32), [f"turn {offset + i}" for i in range(n)])
+    build_ms = (time.perf_counter() - started) * 1000
+
+    query = rng.standard_normal(dim, dtype=np.float32)
+    queries = rng.standard_normal((batch, dim), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.npz")
+        save_ms = timed(lambda: index.save(path), max(1, repeat // 5))
+        load_ms = timed(lambda: VectorIndex.load(path), max(1, repeat // 5))
+        file_mb = os.path.getsize(path) / 1e6
+    return {
+        "build_ms": build_ms,
+        "query_ms": timed(lambda: index.search(query, k), repeat),
+        "batch_ms": timed(lambda: index.search(queries, k), repeat) / batch,
+        "save_ms": save_ms,
+        "load_ms": load_ms,
+        "file_mb": file_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="turns stored in the index")
+    parser.add_argument("--dim", type=int, default=768, help="embedding dimension (768 for nomic-embed-text)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=32, help="queries scored together in the batched case")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'turns':>8}{'build ms':>10}{'query ms':>10}{'batched ms/q':>14}{'save ms':>9}{'load ms':>9}{'file MB':>9}")
+    for size in args.sizes:
+        r = run(size, args.dim, args.k, args.batch, args.repeat, rng)
+        print(f"{size:>8}{r['build_ms']:>10.1f}{r['query_ms']:>10.2f}{r['batch_ms']:>14.3f}{r['save_ms']:>9.1f}{r['load_ms']:>9.1f}{r['file_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Local stand-ins for signal-cli, LM Studio and Forge used by the benchmarks."""
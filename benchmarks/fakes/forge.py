@@ -0,0 +1,223 @@
+"""
+Fake Stable Diffusion Forge WebUI for the gradio queue endpoints used by image_generator.
+
+/queue/join enqueues a job on a single simulated GPU; /queue/data streams the gradio SSE events
+(estimation, process_starts, process_completed) for the session. Sampling takes
+`per_image_s * batch_size ** batch_efficiency`, so batched submissions are cheaper per image.
+Like gradio, a job whose stream is closed while it is still queued is dropped;
+/sdapi/v1/interrupt stops the job that is sampling. As with gradio's Textbox, the prompt is
+stringified, so every image of a batch is drawn from the same prompt; the generation info of
+the result lists it per image in all_prompts.
+"""
+import base64
+import itertools
+import json
+import queue
+import select
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 1x1 transparent PNG
+PNG_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+class _Job:
+    def __init__(self, session_hash, prompts):
+        self.session_hash = session_hash
+        self.prompts = prompts
+        self.started = threading.Event()
+        self.completed = threading.Event()
+        self.cancelled = False
+        self.dropped = False
+        self.image_urls = []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        fake = self.server.fake
+        path = urlparse(self.path).path
+        request = self._read_json()
+        if path == "/internal/progress":
+            self._send_json(200, {"active": False, "queued": False, "completed": False, "progress": None, "eta": None,
+                                  "live_preview": None, "id_live_preview": -1, "textinfo": None})
+        elif path == "/sdapi/v1/interrupt":
+            fake.interrupt()
+            self._send_json(200, {})
+        elif path == "/queue/join":
+            data = request.get("data", [])
+            prompt = data[1] if len(data) > 1 else ""
+            batch_size = data[5] if len(data) > 5 and isinstance(data[5], int) else 1
+            prompts = [prompt if isinstance(prompt, str) else str(prompt)] * max(1, batch_size)
+            event_id = fake.submit(request.get("session_hash"), prompts)
+            self._send_json(200, {"event_id": event_id})
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_GET(self):
+        fake = self.server.fake
+        parsed = urlparse(self.path)
+        if parsed.path == "/queue/data":
+            session_hash = parse_qs(parsed.query).get("session_hash", [""])[0]
+            self._stream_session(fake, session_hash)
+        elif parsed.path.startswith("/file="):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(PNG_BYTES)))
+            self.end_headers()
+            self.wfile.write(PNG_BYTES)
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def _event(self, payload):
+        # One HTTP chunk per event, as uvicorn streams them, so clients see each event as it happens
+        data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _client_gone(self):
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        try:
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _wait_or_disconnect(self, event):
+        """Waits for `event`; returns False if the client closes the stream first."""
+        while not event.wait(0.05):
+            if self._client_gone():
+                return False
+        return True
+
+    def _stream_session(self, fake, session_hash):
+        job = fake.job_for(session_hash)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            if job is None:
+                self._event({"msg": "close_stream", "event_id": None})
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            self._event({"msg": "estimation", "event_id": session_hash, "rank": fake.queue_depth(), "queue_size": fake.queue_depth()})
+            if not self._wait_or_disconnect(job.started):
+                job.dropped = True
+                fake.closed_streams += 1
+                fake.forget(session_hash)
+                return
+            self._event({"msg": "process_starts", "event_id": session_hash})
+            if not self._wait_or_disconnect(job.completed):
+                fake.closed_streams += 1
+                fake.forget(session_hash)
+                return
+            if job.cancelled:
+                self._event({"msg": "process_completed", "event_id": session_hash, "output": {"error": "Interrupted"}, "success": False})
+            else:
+                gallery = [{"image": {"path": url, "url": url}, "caption": None} for url in job.image_urls]
+                info = json.dumps({"prompt": job.prompts[0], "all_prompts": job.prompts})
+                self._event({"msg": "process_completed", "event_id": session_hash, "output": {"data": [gallery, info, "", ""]}, "success": True})
+            self._event({"msg": "close_stream", "event_id": None})
+            self.wfile.write(b"0\r\n\r\n")
+            fake.forget(session_hash)
+        except (BrokenPipeError, ConnectionResetError):
+            fake.closed_streams += 1
+
+
+class FakeForgeServer:
+    def __init__(self, host="127.0.0.1", port=0, per_image_s=0.5, batch_efficiency=0.7):
+        self.per_image_s = per_image_s
+        self.batch_efficiency = batch_efficiency
+        self.batch_sizes = []
+        self.prompts = []  # The prompt of each submission, as gradio's Textbox hands it on
+        self.closed_streams = 0
+        self.interrupts = 0
+        self.dropped_jobs = 0
+        self._interrupt = threading.Event()
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._file_ids = itertools.count()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._running = False
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def submit(self, session_hash, prompts):
+        job = _Job(session_hash, prompts)
+        with self._lock:
+            self._jobs[session_hash] = job
+            self.prompts.append(prompts[0])
+        self._queue.put(job)
+        return session_hash
+
+    def job_for(self, session_hash):
+        with self._lock:
+            return self._jobs.get(session_hash)
+
+    def forget(self, session_hash):
+        with self._lock:
+            self._jobs.pop(session_hash, None)
+
+    def interrupt(self):
+        self.interrupts += 1
+        self._interrupt.set()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _gpu_loop(self):
+        while self._running:
+            try:
+                job = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if job.dropped:
+                self.dropped_jobs += 1
+                continue
+            self._interrupt.clear()
+            job.started.set()
+            batch_size = len(job.prompts)
+            self.batch_sizes.append(batch_size)
+            job.cancelled = self._interrupt.wait(self.per_image_s * (batch_size ** self.batch_efficiency))
+            job.image_urls = [f"{self.url}/file=outputs/fake-{next(self._file_ids)}.png" for _ in job.prompts]
+            job.completed.set()
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._server.serve_forever, name="FakeForgeServer", daemon=True).start()
+        threading.Thread(target=self._gpu_loop, name="FakeForgeGPU", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,167 @@
+"""
+Fake OpenAI-compatible server (LM Studio stand-in) for /v1/models, /v1/chat/completions and /v1/embeddings.
+
+Latency is modelled as `prompt_latency_s` plus `prompt_s_per_word` for every prompt word not already
+in the prompt cache (prompt processing), plus `completion_tokens / tokens_per_s` for generation. The
+cache keeps the message lists of the last `cache_slots` requests; a request reuses the longest run of
+leading messages it shares with one of them, like llama.cpp's prompt cache. Streaming responses emit one SSE chunk per token at that rate. Embeddings are
+deterministic hashed bag-of-words vectors, so texts sharing words score as similar.
+"""
+import json
+import math
+import zlib
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, dim=64):
+    vector = [0.0] * dim
+    for word in text.lower().split():
+        vector[zlib.crc32(word.strip(".,;:!?").encode("utf-8")) % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": fake.model_id, "object": "model", "owned_by": "fake"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") == "/v1/embeddings":
+            fake.record_embedding(request)
+            texts = request.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            self._send_json(200, {"object": "list", "model": request.get("model"),
+                                  "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t)} for i, t in enumerate(texts)]})
+            return
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        fake.record(request)
+        prompt_s = fake.prompt_seconds(request.get("messages") or [])
+        max_tokens = request.get("max_tokens") or fake.completion_tokens
+        tokens = min(max_tokens, fake.completion_tokens)
+        words = [f"word{i}" for i in range(tokens)]
+
+        if not request.get("stream"):
+            time.sleep(prompt_s + tokens / fake.tokens_per_s)
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": fake.model_id,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": tokens},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        # Headers go out before prompt processing, so a client can give up on a slow prompt
+        time.sleep(prompt_s)
+        try:
+            for index, word in enumerate(words):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "model": fake.model_id,
+                    "choices": [{"index": 0, "delta": {"content": word if index == 0 else f" {word}"}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(1.0 / fake.tokens_per_s)
+            done = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            fake.cancelled_streams += 1
+        self.close_connection = True
+
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, model_id="fake-model", prompt_latency_s=0.05, tokens_per_s=200.0, completion_tokens=40,
+                 prompt_s_per_word=0.0, cache_slots=0):
+        self.model_id = model_id
+        self.prompt_latency_s = prompt_latency_s
+        self.prompt_s_per_word = prompt_s_per_word
+        self.cache_slots = cache_slots
+        self.cached_words = 0  # Prompt words served from the cache
+        self._cache = OrderedDict()  # hashes of a request's leading messages -> None, least recently used first
+        self.tokens_per_s = tokens_per_s
+        self.completion_tokens = completion_tokens
+        self.requests = []
+        self.embedding_requests = []
+        self.cancelled_streams = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def record(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def prompt_seconds(self, messages):
+        """Prompt processing time for `messages`, which are added to the prompt cache."""
+        prefixes, words, running = [], [], 0
+        for message in messages:
+            running = zlib.crc32(json.dumps(message, sort_keys=True).encode("utf-8"), running)
+            prefixes.append(running)
+            words.append(len(str(message.get("content", "")).split()))
+        with self._lock:
+            reused = 0
+            for cached in self._cache:
+                shared = next((i for i, (a, b) in enumerate(zip(cached, prefixes)) if a != b), min(len(cached), len(prefixes)))
+                reused = max(reused, shared)
+            self.cached_words += sum(words[:reused])
+            if self.cache_slots > 0:
+                key = tuple(prefixes)
+                self._cache.pop(key, None)
+                self._cache[key] = None
+                while len(self._cache) > self.cache_slots:
+                    self._cache.popitem(last=False)
+        return self.prompt_latency_s + sum(words[reused:]) * self.prompt_s_per_word
+
+    def record_embedding(self, request):
+        with self._lock:
+            self.embedding_requests.append(request)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="FakeOpenAIServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,143 @@
+"""
+Fake signal-cli daemon speaking the newline-delimited JSON-RPC protocol used by `daemon --tcp`.
+
+Tests push inbound messages with `push_message`; every `send` request written by the backend is
+acknowledged like signal-cli does and reported to the `on_send` callback.
+"""
+import itertools
+import json
+import socketserver
+import threading
+import time
+
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.fake_daemon
+        daemon._register(self.wfile)
+        try:
+            for raw_line in self.rfile:
+                line = raw_line.strip()
+                if not line:
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                daemon._handle_request(request, self.wfile)
+        except ConnectionResetError:
+            pass  # The backend closed its socket with acknowledgements still unread
+        finally:
+            daemon._unregister(self.wfile)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeSignalDaemon:
+    def __init__(self, host="127.0.0.1", port=0, account="+15550000000", on_send=None, ack_delay_s=0.0):
+        self.account = account
+        self.on_send = on_send
+        self.ack_delay_s = ack_delay_s
+        self.sent = []
+        self._clients = []
+        self._lock = threading.Lock()
+        self._timestamps = itertools.count(int(time.time() * 1000))
+        self._server = _Server((host, port), _ClientHandler)
+        self._server.fake_daemon = self
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address
+        return host, port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="FakeSignalDaemon", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait_for_client(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._clients:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def push_message(self, source_uuid, source_number, body, timestamp=None):
+        """Delivers a dataMessage from another user to every connected client. Returns the envelope timestamp."""
+        timestamp = timestamp if timestamp is not None else next(self._timestamps)
+        envelope = {
+            "source": source_number,
+            "sourceNumber": source_number,
+            "sourceUuid": source_uuid,
+            "sourceName": source_uuid,
+            "sourceDevice": 1,
+            "timestamp": timestamp,
+            "dataMessage": {"timestamp": timestamp, "message": body, "expiresInSeconds": 0, "viewOnce": False},
+        }
+        self.push_envelope(envelope)
+        return timestamp
+
+    def push_typing(self, source_uuid, source_number, action="STARTED"):
+        """Delivers a typing indicator from another user to every connected client."""
+        timestamp = next(self._timestamps)
+        self.push_envelope({
+            "source": source_number,
+            "sourceNumber": source_number,
+            "sourceUuid": source_uuid,
+            "sourceName": source_uuid,
+            "sourceDevice": 1,
+            "timestamp": timestamp,
+            "typingMessage": {"action": action, "timestamp": timestamp},
+        })
+
+    def push_envelope(self, envelope):
+        self.push_frame({"jsonrpc": "2.0", "method": "receive", "params": {"envelope": envelope, "account": self.account}})
+
+    def push_frame(self, frame):
+        line = (json.dumps(frame) + "\n").encode("utf-8")
+        with self._lock:
+            clients = list(self._clients)
+        for wfile in clients:
+            self._write(wfile, line)
+
+    def _register(self, wfile):
+        with self._lock:
+            self._clients.append(wfile)
+
+    def _unregister(self, wfile):
+        with self._lock:
+            if wfile in self._clients:
+                self._clients.remove(wfile)
+
+    def _write(self, wfile, line):
+        try:
+            with self._lock:
+                wfile.write(line)
+                wfile.flush()
+        except OSError:
+            self._unregister(wfile)
+
+    def _handle_request(self, request, wfile):
+        method = request.get("method")
+        if method == "send":
+            params = request.get("params", {})
+            self.sent.append(params)
+            if self.on_send:
+                self.on_send(params)
+            if self.ack_delay_s:
+                time.sleep(self.ack_delay_s)
+            result = {"timestamp": next(self._timestamps), "results": [{"type": "SUCCESS"}]}
+            response = {"jsonrpc": "2.0", "result": result, "id": request.get("id")}
+        else:
+            response = {"jsonrpc": "2.0", "error": {"code": -32601, "message": f"Method not implemented: {method}"}, "id": request.get("id")}
+        self._write(wfile, (json.dumps(response) + "\n").encode("utf-8"))
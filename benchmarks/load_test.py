@@ -0,0 +1,208 @@
+"""
+Offline end-to-end load test.
+
+Starts local stand-ins for signal-cli, LM Studio and Forge, points the backend at them and drives
+N simulated users through start_listener_thread. Each user sends a message, waits for the reply,
+thinks, and repeats. Reports throughput and p50/p95/p99 reply latency per message type.
+
+    python -m benchmarks.load_test --users 8 --messages-per-user 10
+
+Backend settings (DISPATCH_WORKERS, WORKER_PROCESSES, IMAGE_BATCH_MAX_SIZE, COALESCE_WINDOW_MS, ...) are read
+from the environment as usual, so capacity changes can be compared by re-running with different values.
+With --accounts N, N fake daemons each serve one account and users are spread across them.
+With --typing-time S, users send a typing indicator S seconds before each message; combined with
+--llm-prompt-s-per-word and --llm-cache-slots this shows the effect of PREWARM_ENABLED on latency.
+"""
+import argparse
+import os
+import queue
+import random
+import threading
+import time
+
+from benchmarks.fakes.forge import FakeForgeServer
+from benchmarks.fakes.openai_server import FakeOpenAIServer
+from benchmarks.fakes.signal_cli import FakeSignalDaemon
+
+ACCOUNT_NUMBER = "+15550000000"
+
+MESSAGE_TYPES = {
+    "chat": lambda i: f"tell me more about that, part {i}",
+    "image_llm": lambda i: f"show me what that looks like; {i}",
+    "image_direct": lambda i: f"xx a lighthouse at dusk, variation {i}",
+    "reset": lambda i: "/reset",
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in MESSAGE_TYPES:
+            raise SystemExit(f"Unknown message type '{name}'. Choose from: {', '.join(MESSAGE_TYPES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def configure_backend_environment(signal_daemon, llm_server, forge_server, extra_daemons=()):
+    """Points the backend at the stand-ins. Must run before any `src` module is imported."""
+    host, port = signal_daemon.address
+    os.environ.update({
+        "SIGNAL_EXTRA_ACCOUNTS": ",".join(f"{d.account}@{d.address[0]}:{d.address[1]}" for d in extra_daemons),
+        "API_URL": llm_server.url,
+        "FORGE_API_URL": forge_server.url,
+        "YOUR_SIGNAL_NUMBER": ACCOUNT_NUMBER,
+        "SIGNAL_DAEMON_HOST": host,
+        "JSON_RPC_PORT": str(port),
+        "SIGNAL_CLI_MANAGE_DAEMON": "False",
+        "METRICS_PORT": os.environ.get("METRICS_PORT", "0"),
+        "DEDUP_SNAPSHOT_PATH": "",
+    })
+
+
+class SimulatedUser:
+    def __init__(self, index, signal_daemon, mix, messages, think_time_s, seed, reply_timeout_s, typing_time_s=0.0):
+        self.uuid = f"00000000-0000-4000-8000-{index:012d}"
+        self.number = f"+1666{index:07d}"
+        self.signal_daemon = signal_daemon
+        self.messages = messages
+        self.think_time_s = think_time_s
+        self.typing_time_s = typing_time_s
+        self.reply_timeout_s = reply_timeout_s
+        self.replies = queue.Queue()
+        self.results = []  # (message type, latency seconds or None on timeout)
+        self._random = random.Random(seed)
+        self._mix_names = list(mix)
+        self._mix_weights = [mix[name] for name in self._mix_names]
+
+    def run(self):
+        for i in range(self.messages):
+            kind = self._random.choices(self._mix_names, weights=self._mix_weights)[0]
+            if self.typing_time_s > 0:
+                self.signal_daemon.push_typing(self.uuid, self.number)
+                time.sleep(self.typing_time_s)
+            sent_at = time.perf_counter()
+            self.signal_daemon.push_message(self.uuid, self.number, MESSAGE_TYPES[kind](i))
+            try:
+                replied_at, _ = self.replies.get(timeout=self.reply_timeout_s)
+                self.results.append((kind, replied_at - sent_at))
+            except queue.Empty:
+                self.results.append((kind, None))
+            time.sleep(self.think_time_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--messages-per-user", type=int, default=10)
+    parser.add_argument("--mix", default="chat=6,image_llm=2,image_direct=1,reset=1", help="weighted message types")
+    parser.add_argument("--think-time", type=float, default=0.2, help="seconds a user waits after a reply")
+    parser.add_argument("--reply-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--accounts", type=int, default=1, help="signal accounts (one fake daemon each) users are spread across")
+    parser.add_argument("--typing-time", type=float, default=0.0, help="seconds between a typing indicator and each message")
+    parser.add_argument("--llm-prompt-latency", type=float, default=0.05)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--llm-completion-tokens", type=int, default=40)
+    parser.add_argument("--llm-prompt-s-per-word", type=float, default=0.0, help="prompt processing time per uncached word")
+    parser.add_argument("--llm-cache-slots", type=int, default=0, help="requests whose prompts the fake LLM keeps cached")
+    parser.add_argument("--forge-per-image", type=float, default=0.5)
+    parser.add_argument("--forge-batch-efficiency", type=float, default=0.7)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    users_by_recipient = {}
+    misrouted = []
+
+    def on_send(params, account=ACCOUNT_NUMBER):
+        user = users_by_recipient.get(params.get("recipient") or params.get("number"))
+        if user:
+            user.replies.put((time.perf_counter(), params))
+            if user.signal_daemon.account != account:
+                misrouted.append(params)
+        for attachment in params.get("attachments", []):
+            try:
+                os.remove(attachment)
+            except OSError:
+                pass
+
+    signal_daemon = FakeSignalDaemon(account=ACCOUNT_NUMBER, on_send=on_send).start()
+    extra_daemons = []
+    for i in range(1, args.accounts):
+        account = f"+1555000{i:04d}"
+        extra_daemons.append(FakeSignalDaemon(account=account, on_send=lambda params, account=account: on_send(params, account)).start())
+    llm_server = FakeOpenAIServer(prompt_latency_s=args.llm_prompt_latency, tokens_per_s=args.llm_tokens_per_s,
+                                  completion_tokens=args.llm_completion_tokens, prompt_s_per_word=args.llm_prompt_s_per_word,
+                                  cache_slots=args.llm_cache_slots).start()
+    forge_server = FakeForgeServer(per_image_s=args.forge_per_image, batch_efficiency=args.forge_batch_efficiency).start()
+    configure_backend_environment(signal_daemon, llm_server, forge_server, extra_daemons)
+
+    from src import config
+    from src import signal_handler
+    from src.llm_client import LLMClient
+
+    if config.API_URL != llm_server.url or config.SIGNAL_DAEMON_HOST != signal_daemon.address[0]:
+        raise SystemExit("Settings in .env override the load test environment; move .env aside and re-run.")
+
+    daemons = [signal_daemon] + extra_daemons
+    users = [SimulatedUser(i, daemons[i % len(daemons)], mix, args.messages_per_user, args.think_time, args.seed + i, args.reply_timeout,
+                           args.typing_time)
+             for i in range(args.users)]
+    for user in users:
+        users_by_recipient[user.uuid] = user
+
+    # Worker processes create their own clients
+    signal_handler.start_listener_thread(LLMClient(config.API_URL) if not config.WORKER_PROCESSES else None)
+    if not all(daemon.wait_for_client() for daemon in daemons):
+        signal_handler.stop_listener()
+        raise SystemExit("Backend did not connect to the fake signal-cli daemon.")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user.run, name=f"SimulatedUser-{i}") for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    signal_handler.stop_listener()
+    for server in (*daemons, llm_server, forge_server):
+        server.stop()
+
+    by_kind = {}
+    timeouts = 0
+    for user in users:
+        for kind, latency in user.results:
+            if latency is None:
+                timeouts += 1
+            else:
+                by_kind.setdefault(kind, []).append(latency)
+    answered = sum(len(v) for v in by_kind.values())
+
+    print(f"\n{args.users} users x {args.messages_per_user} messages in {wall:.2f}s: "
+          f"{answered / wall:.2f} replies/s, {timeouts} timeouts")
+    print(f"{'type':<14}{'count':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for kind in MESSAGE_TYPES:
+        latencies = sorted(by_kind.get(kind, []))
+        if latencies:
+            print(f"{kind:<14}{len(latencies):>7}{percentile(latencies, 0.5):>9.3f}"
+                  f"{percentile(latencies, 0.95):>9.3f}{percentile(latencies, 0.99):>9.3f}")
+    if forge_server.batch_sizes:
+        print(f"Forge submissions: {len(forge_server.batch_sizes)}, "
+              f"mean batch size {sum(forge_server.batch_sizes) / len(forge_server.batch_sizes):.2f}")
+    print(f"LLM requests: {len(llm_server.requests)}")
+    if llm_server.cache_slots:
+        print(f"LLM prompt words served from cache: {llm_server.cached_words}")
+    if misrouted:
+        print(f"Replies sent from the wrong account: {len(misrouted)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Replays a traffic capture (see TRAFFIC_CAPTURE_PATH) against the backend and local stand-ins.
+
+Captured 'receive' frames are pushed through the fake signal-cli daemon with their original
+spacing divided by --speed (0 replays as fast as possible), so they take the real socket ->
+dispatch path. Hashed or redacted bodies are replaced with synthesized text of the same type
+and length. Reports reply latency per message type.
+
+    python -m benchmarks.replay capture.jsonl.gz --speed 10
+"""
+import argparse
+import collections
+import os
+import threading
+import time
+
+from benchmarks.fakes.forge import FakeForgeServer
+from benchmarks.fakes.openai_server import FakeOpenAIServer
+from benchmarks.fakes.signal_cli import FakeSignalDaemon
+from benchmarks.load_test import ACCOUNT_NUMBER, configure_backend_environment, percentile
+
+
+def rewrite_account(value, old_account, new_account):
+    """Replaces every occurrence of the captured account number so Note to Self traffic still matches."""
+    if isinstance(value, dict):
+        return {k: rewrite_account(v, old_account, new_account) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rewrite_account(v, old_account, new_account) for v in value]
+    return new_account if old_account and value == old_account else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="gzip JSONL capture written by the traffic recorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale: 1 = real time, 10 = ten times faster, 0 = as fast as possible")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="max seconds to wait for outstanding replies after the last frame")
+    parser.add_argument("--drain-idle", type=float, default=15.0, help="stop draining after this many seconds without a reply")
+    parser.add_argument("--llm-prompt-latency", type=float, default=0.05)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--llm-completion-tokens", type=int, default=40)
+    parser.add_argument("--forge-per-image", type=float, default=0.5)
+    parser.add_argument("--forge-batch-efficiency", type=float, default=0.7)
+    args = parser.parse_args()
+
+    outstanding = collections.defaultdict(collections.deque)  # recipient -> deque of (sent_at, kind)
+    latencies = collections.defaultdict(list)
+    lock = threading.Lock()
+    replies = 0
+    last_reply_at = time.perf_counter()
+
+    def on_send(params):
+        nonlocal replies, last_reply_at
+        recipient = params.get("recipient") or params.get("number")
+        now = time.perf_counter()
+        with lock:
+            replies += 1
+            last_reply_at = now
+            if outstanding[recipient]:
+                sent_at, kind = outstanding[recipient].popleft()
+                latencies[kind].append(now - sent_at)
+        for attachment in params.get("attachments", []):
+            try:
+                os.remove(attachment)
+            except OSError:
+                pass
+
+    signal_daemon = FakeSignalDaemon(account=ACCOUNT_NUMBER, on_send=on_send).start()
+    llm_server = FakeOpenAIServer(prompt_latency_s=args.llm_prompt_latency, tokens_per_s=args.llm_tokens_per_s,
+                                  completion_tokens=args.llm_completion_tokens).start()
+    forge_server = FakeForgeServer(per_image_s=args.forge_per_image, batch_efficiency=args.forge_batch_efficiency).start()
+    configure_backend_environment(signal_daemon, llm_server, forge_server)
+
+    from src import config
+    from src import signal_handler
+    from src.llm_client import LLMClient
+    from src.message_types import message_kind
+    from src.traffic_capture import read_capture, restore_bodies
+
+    if config.API_URL != llm_server.url:
+        raise SystemExit("Settings in .env override the replay environment; move .env aside and re-run.")
+
+    # Worker processes create their own clients
+    signal_handler.start_listener_thread(LLMClient(config.API_URL) if not config.WORKER_PROCESSES else None)
+    if not signal_daemon.wait_for_client():
+        signal_handler.stop_listener()
+        raise SystemExit("Backend did not connect to the fake signal-cli daemon.")
+
+    frames = 0
+    first_capture_time = None
+    started = time.perf_counter()
+    for captured_at, frame in read_capture(args.capture):
+        if first_capture_time is None:
+            first_capture_time = captured_at
+        if args.speed > 0:
+            delay = (captured_at - first_capture_time) / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+        params = frame.get("params") or {}
+        frame = rewrite_account(restore_bodies(frame), params.get("account"), ACCOUNT_NUMBER)
+        envelope = frame.get("params", {}).get("envelope", {})
+        message = signal_handler.parse_incoming_message(frame)
+        if message:
+            with lock:
+                outstanding[message["sender"]].append((time.perf_counter(), message_kind(message["body"])))
+        signal_daemon.push_envelope(envelope)
+        frames += 1
+    replay_duration = time.perf_counter() - started
+
+    # Coalesced or deduplicated messages never get their own reply, so also stop once replies dry up
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        with lock:
+            if not any(outstanding.values()) or time.perf_counter() - max(last_reply_at, started + replay_duration) > args.drain_idle:
+                break
+        time.sleep(0.1)
+    total_duration = time.perf_counter() - started
+
+    signal_handler.stop_listener()
+    for server in (signal_daemon, llm_server, forge_server):
+        server.stop()
+
+    unanswered = sum(len(v) for v in outstanding.values())
+    speed = "max" if args.speed <= 0 else f"{args.speed:g}x"
+    print(f"\nReplayed {frames} frames at {speed} in {replay_duration:.2f}s, drained in {total_duration:.2f}s: "
+          f"{replies} replies, {unanswered} messages without a reply (coalesced, deduplicated or timed out)")
+    print(f"{'type':<14}{'count':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        print(f"{kind:<14}{len(values):>7}{percentile(values, 0.5):>9.3f}{percentile(values, 0.95):>9.3f}{percentile(values, 0.99):>9.3f}")
+    if forge_server.batch_sizes:
+        print(f"Forge submissions: {len(forge_server.batch_sizes)}, "
+              f"mean batch size {sum(forge_server.batch_sizes) / len(forge_server.batch_sizes):.2f}")
+    print(f"LLM requests: {len(llm_server.requests)}")
+
+
+if __name__ == '__main__':
+    main()
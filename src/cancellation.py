@@ -0,0 +1,233 @@
+import socket
+import threading
+import time
+
+from . import metrics
+
+
+class Cancelled(Exception):
+    """Raised inside work whose CancelToken was cancelled or whose deadline passed."""
+
+    def __init__(self, reason):
+        super().__init__(f"cancelled ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Deadline and cancellation flag carried by one message's work through the LLM and Forge calls.
+
+    Blocking calls register on_cancel() callbacks that close their HTTP stream, so cancel() wakes
+    them up instead of letting them run to completion. commit() marks the point after which the
+    work's result is delivered anyway, e.g. once a reply has been added to the conversation history.
+    """
+
+    def __init__(self, deadline_s=None):
+        self.created_at = time.monotonic()
+        self.deadline = self.created_at + deadline_s if deadline_s else None
+        self.started_at = None
+        self.reason = None
+        self._committed = False
+        self._callbacks = []
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    @property
+    def pending(self):
+        """Neither cancelled nor committed yet."""
+        return self.reason is None and not self._committed
+
+    def start(self):
+        """Marks the moment work begins, as opposed to waiting in a queue."""
+        self.started_at = time.monotonic()
+
+    def cancel(self, reason="cancel"):
+        """Cancels the work unless it already committed or was cancelled. Returns True if this call cancelled it."""
+        with self._lock:
+            if self.reason is not None or self._committed:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        self._event.set()
+        for callback in callbacks:
+            try:
+                callback(reason)
+            except Exception as e:
+                metrics.record_error("cancel", e)
+        return True
+
+    def commit(self):
+        """Returns False if the work was cancelled; otherwise later cancel() calls have no effect."""
+        with self._lock:
+            if self.reason is None:
+                self._committed = True
+            return self.reason is None
+
+    def expired(self, now=None):
+        return self.deadline is not None and (now or time.monotonic()) >= self.deadline
+
+    def check(self):
+        """Raises Cancelled if the work was cancelled or its deadline has passed."""
+        if self.reason is None and self.expired():
+            self.cancel("deadline")
+        if self.reason is not None:
+            raise Cancelled(self.reason)
+
+    def remaining(self, cap=None):
+        """Seconds until the deadline, at most `cap`; None if there is neither. Used as HTTP timeouts."""
+        if self.deadline is None:
+            return cap
+        left = max(0.001, self.deadline - time.monotonic())
+        return left if cap is None else min(left, cap)
+
+    def wait(self, seconds):
+        """Sleeps up to `seconds`, returning early (True) if the work is cancelled meanwhile."""
+        return self._event.wait(seconds)
+
+    def on_cancel(self, callback):
+        """Calls callback(reason) on cancellation (right away if already cancelled); returns a function that unregisters it."""
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback(self.reason)
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @classmethod
+    def all_of(cls, tokens):
+        """A token cancelled once every one of `tokens` is, e.g. for a Forge batch shared by several messages."""
+        deadlines = [token.deadline for token in tokens]
+        combined = cls()
+        combined.deadline = None if None in deadlines else max(deadlines)
+        remaining = [len(tokens)]
+        lock = threading.Lock()
+
+        def one_cancelled(reason):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                combined.cancel(reason)
+
+        for token in tokens:
+            token.on_cancel(one_cancelled)
+        return combined
+
+
+def close_stream(response):
+    """
+    Closes a streaming requests response from another thread. Shutting the socket down wakes a
+    read blocked on it, and the server sees the client go away and stops generating.
+    """
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    if sock is None:
+        # http.client detaches the socket from a connection that closes after this response
+        reader = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(reader, "raw", None), "_sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class CancellationRegistry:
+    """
+    Tracks the cancel tokens of every conversation's queued and running messages, so /cancel and
+    newer messages can cancel them, and cancels tokens whose deadline passes.
+
+    Reclaimed time is estimated per message type as the mean duration of completed work minus how
+    long the cancelled work had already been running.
+    """
+
+    def __init__(self):
+        self._active = {}  # conversation -> [(kind, token, message)] in arrival order
+        self._durations = {}  # kind -> [completed count, total seconds]
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="DeadlineWatchdogThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def register(self, conversation, kind, message, deadline_s=None):
+        """Creates the token for a message of type `kind`; finish() must be called once it is handled."""
+        token = CancelToken(deadline_s)
+        token.on_cancel(lambda reason: self._record(kind, token, reason))
+        with self._cond:
+            self._active.setdefault(conversation, []).append((kind, token, message))
+            if token.deadline is not None:
+                self._cond.notify_all()
+        return token
+
+    def finish(self, conversation, token):
+        """Forgets a handled message's token; work that ran to completion updates its type's mean duration."""
+        with self._cond:
+            entries = self._active.get(conversation, [])
+            for entry in entries:
+                if entry[1] is token:
+                    entries.remove(entry)
+                    if not token.cancelled and token.started_at is not None:
+                        totals = self._durations.setdefault(entry[0], [0, 0.0])
+                        totals[0] += 1
+                        totals[1] += time.monotonic() - token.started_at
+                    break
+            if not entries:
+                self._active.pop(conversation, None)
+
+    def cancel(self, conversation, kinds=None, reason="cancel"):
+        """Cancels the conversation's queued and running work of the given types (default: all); returns the cancelled entries."""
+        with self._cond:
+            entries = [entry for entry in self._active.get(conversation, []) if kinds is None or entry[0] in kinds]
+        return [entry for entry in entries if entry[1].cancel(reason)]
+
+    def busy(self, conversation):
+        """True while the conversation has queued or running work."""
+        with self._cond:
+            return any(token.pending for _, token, _ in self._active.get(conversation, []))
+
+    def _record(self, kind, token, reason):
+        with self._cond:
+            count, total = self._durations.get(kind, (0, 0.0))
+        metrics.cancelled_total.inc(kind=kind, reason=reason, state="running" if token.started_at else "queued")
+        if count:
+            elapsed = time.monotonic() - token.started_at if token.started_at else 0.0
+            metrics.reclaimed_seconds_total.inc(max(0.0, total / count - elapsed), kind=kind)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                expired = [token for entries in self._active.values() for _, token, _ in entries
+                           if token.pending and token.expired(now)]
+                if not expired:
+                    deadlines = [token.deadline for entries in self._active.values() for _, token, _ in entries
+                                 if token.deadline is not None and token.pending]
+                    self._cond.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+                    continue
+            for token in expired:
+                token.cancel("deadline")
@@ -0,0 +1,140 @@
+import threading
+import time
+
+from .config import COALESCE_WINDOW_MS, COALESCE_MAX_HOLD_MS
+
+
+def is_plain_text(body: str) -> bool:
+    """True for ordinary chat messages; commands and image requests are never merged."""
+    stripped = body.strip().lower()
+    return bool(stripped) and not stripped.startswith("/") and not stripped.startswith("xx") and ";" not in stripped
+
+
+def _conversation(message):
+    # Each account keeps its own conversation with a sender, so their messages are never merged
+    return message.get("conversation", message["sender"])
+
+
+class MessageCoalescer:
+    """
+    Per-conversation debounce for bursts of short chat messages.
+
+    A plain text message is held for window_ms. Further plain text messages of the same conversation
+    (one sender talking to one account) that arrive within window_ms of the previous one are appended
+    to it, as are messages that arrive while the merged turn is still waiting in the dispatch queue.
+    A turn is never held for longer than max_hold_ms. Any command in the conversation flushes the
+    held turn first, so order is kept.
+    """
+
+    def __init__(self, dispatch, window_ms=COALESCE_WINDOW_MS, max_hold_ms=COALESCE_MAX_HOLD_MS):
+        self.dispatch = dispatch
+        self.window = max(0, window_ms) / 1000.0
+        self.max_hold = max(self.window, max_hold_ms / 1000.0)
+        self.stats = {"messages": 0, "coalesced": 0, "turns": 0}
+        self._held = {}    # conversation -> message still inside its debounce window
+        self._queued = {}  # conversation -> message handed to dispatch but not picked up by a worker yet
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="MessageCoalescerThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the timer thread and dispatches anything still held."""
+        with self._cond:
+            self._running = False
+            held = list(self._held.values())
+            self._held.clear()
+            self._cond.notify_all()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._thread = None
+        for message in held:
+            self._dispatch(message)
+
+    def submit(self, message):
+        """Routes a parsed incoming message through the debounce window."""
+        with self._cond:
+            running = self._running
+        if not running:
+            self.dispatch(message)
+            return
+
+        conversation = _conversation(message)
+        now = time.monotonic()
+        to_dispatch = []
+
+        with self._cond:
+            self.stats["messages"] += 1
+            held = self._held.get(conversation)
+            queued = self._queued.get(conversation)
+
+            if not is_plain_text(message["body"]):
+                if held:
+                    to_dispatch.append(self._held.pop(conversation))
+                to_dispatch.append(message)
+            elif held and now - held["last_arrival"] <= self.window:
+                self._merge(held, message, now)
+            elif not held and queued:
+                # The previous turn hasn't been picked up by a worker yet, so its reply is still pending
+                self._merge(queued, message, now)
+            else:
+                if held:
+                    to_dispatch.append(self._held.pop(conversation))
+                message["first_arrival"] = message["last_arrival"] = now
+                self._held[conversation] = message
+                self.stats["turns"] += 1
+                self._cond.notify_all()
+
+        for pending in to_dispatch:
+            self._dispatch(pending)
+
+    def begin(self, message):
+        """Called by a dispatch worker right before it handles a message; nothing is merged into it afterwards."""
+        with self._cond:
+            if self._queued.get(_conversation(message)) is message:
+                del self._queued[_conversation(message)]
+
+    def _merge(self, target, message, now):
+        target["body"] = f"{target['body']}\n{message['body']}"
+        target["last_arrival"] = now
+        self.stats["coalesced"] += 1
+
+    def _dispatch(self, message):
+        with self._cond:
+            if is_plain_text(message["body"]):
+                self._queued[_conversation(message)] = message
+            else:
+                # Later text must not jump ahead of a command by merging into an earlier turn
+                self._queued.pop(_conversation(message), None)
+        self.dispatch(message)
+
+    def _deadline(self, message):
+        return min(message["last_arrival"] + self.window, message["first_arrival"] + self.max_hold)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                expired = [conversation for conversation, message in self._held.items() if self._deadline(message) <= now]
+                ready = [self._held.pop(conversation) for conversation in expired]
+                if not ready:
+                    next_deadline = min((self._deadline(m) for m in self._held.values()), default=None)
+                    self._cond.wait(None if next_deadline is None else max(0.0, next_deadline - now))
+                    continue
+            for message in ready:
+                self._dispatch(message)
@@ -1,5 +1,8 @@
 import os
-from dotenv import load_dotenv
+import json
+import threading
+from dataclasses import dataclass, fields
+from dotenv import dotenv_values
 from pathlib import Path # Import pathlib
 
 # Construct the path to the project root directory (one level up from src)
@@ -7,52 +10,288 @@ from pathlib import Path # Import pathlib
 project_root = Path(__file__).resolve().parent.parent
 dotenv_path = project_root / '.env'
 
-# Load the .env file from the explicit path
-print(f"Attempting to load .env file from: {dotenv_path}")
-# Add override=True
-found_dotenv = load_dotenv(dotenv_path=dotenv_path, override=True)
-if not found_dotenv:
-    print("Warning: .env file not found or failed to load.")
-else:
-    print(".env file loaded successfully.")
-
-
-# Configuration settings
-API_URL = os.getenv("API_URL", "http://127.0.0.1:1234")
-MODEL_IDENTIFIER = os.getenv("MODEL_IDENTIFIER", "cydonia-24b-v2.1")
-FORGE_API_URL = os.getenv("FORGE_API_URL", "http://127.0.0.1:7860") # New
-
-# --- Image Generation Settings ---
-DEFAULT_NEGATIVE_PROMPT = os.getenv("DEFAULT_NEGATIVE_PROMPT", "")
-DEFAULT_IMAGE_WIDTH = int(os.getenv("DEFAULT_IMAGE_WIDTH", "1440"))
-DEFAULT_IMAGE_HEIGHT = int(os.getenv("DEFAULT_IMAGE_HEIGHT", "1280"))
-DEFAULT_CFG_SCALE = float(os.getenv("DEFAULT_CFG_SCALE", "1.4"))
-DEFAULT_SAMPLING_STEPS = int(os.getenv("DEFAULT_SAMPLING_STEPS", "20"))
-DEFAULT_SAMPLER_NAME = os.getenv("DEFAULT_SAMPLER_NAME", "Euler a")
-DEFAULT_SCHEDULER = os.getenv("DEFAULT_SCHEDULER", "LCM")
-DEFAULT_SEED = int(os.getenv("DEFAULT_SEED", "-1")) # -1 for random
-
-# Hires Fix Settings (example, based on your payload)
-DEFAULT_HIRES_FIX_ENABLED = os.getenv("DEFAULT_HIRES_FIX_ENABLED", "False").lower() == 'true'
-DEFAULT_HIRES_DENOISING_STRENGTH = float(os.getenv("DEFAULT_HIRES_DENOISING_STRENGTH", "0.7"))
-DEFAULT_HIRES_UPSCALER = os.getenv("DEFAULT_HIRES_UPSCALER", "Latent")
-DEFAULT_HIRES_UPSCALE_BY = float(os.getenv("DEFAULT_HIRES_UPSCALE_BY", "2.0")) # Assuming index 12 (value 2) is upscale factor
-DEFAULT_HIRES_STEPS = int(os.getenv("DEFAULT_HIRES_STEPS", "0")) # Assuming index 14 (value 0) is hires steps
-
-# Add other configurations as needed
-SIGNAL_CLI_PATH = os.getenv("SIGNAL_CLI_PATH", "signal-cli")
-YOUR_SIGNAL_NUMBER = os.getenv("YOUR_SIGNAL_NUMBER")
-
-# --- Add JSON_RPC_PORT and SIGNAL_DAEMON_ADDRESS ---
-JSON_RPC_PORT = int(os.getenv("JSON_RPC_PORT", "7583")) # Default to 7583 if not in .env
-SIGNAL_DAEMON_HOST = os.getenv("SIGNAL_DAEMON_HOST", "127.0.0.1")
-SIGNAL_DAEMON_ADDRESS = f"{SIGNAL_DAEMON_HOST}:{JSON_RPC_PORT}"
-# --- End Add ---
-
-# Add a check for debugging
-if YOUR_SIGNAL_NUMBER is None:
-    print("Error: YOUR_SIGNAL_NUMBER is None after attempting to load .env. Check .env file content and location.")
-else:
-    print(f"Successfully loaded YOUR_SIGNAL_NUMBER: {YOUR_SIGNAL_NUMBER}")
-
-print(f"Signal Daemon Address configured to: {SIGNAL_DAEMON_ADDRESS}") # For verification
\ No newline at end of file
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Immutable snapshot of every setting. Each field is read from .env (which takes precedence)
+    or the environment variable of the same name, falling back to the default given here.
+
+    Use current() to get the active snapshot; reload() swaps in a new one atomically, so work
+    that captured a snapshot keeps consistent values while new work sees the reloaded ones.
+    """
+
+    # Configuration settings
+    API_URL: str = "http://127.0.0.1:1234"
+    MODEL_IDENTIFIER: str = "cydonia-24b-v2.1"
+    FORGE_API_URL: str = "http://127.0.0.1:7860" # New
+    # Chat and ';' messages wait this long for model detection to finish before failing
+    LLM_READY_TIMEOUT_S: float = 60.0
+
+    # --- Image Generation Settings ---
+    DEFAULT_NEGATIVE_PROMPT: str = ""
+    DEFAULT_IMAGE_WIDTH: int = 1440
+    DEFAULT_IMAGE_HEIGHT: int = 1280
+    DEFAULT_CFG_SCALE: float = 1.4
+    DEFAULT_SAMPLING_STEPS: int = 20
+    DEFAULT_SAMPLER_NAME: str = "Euler a"
+    DEFAULT_SCHEDULER: str = "LCM"
+    DEFAULT_SEED: int = -1 # -1 for random
+
+    # Hires Fix Settings (example, based on your payload)
+    DEFAULT_HIRES_FIX_ENABLED: bool = False
+    DEFAULT_HIRES_DENOISING_STRENGTH: float = 0.7
+    DEFAULT_HIRES_UPSCALER: str = "Latent"
+    DEFAULT_HIRES_UPSCALE_BY: float = 2.0 # Assuming index 12 (value 2) is upscale factor
+    DEFAULT_HIRES_STEPS: int = 0 # Assuming index 14 (value 0) is hires steps
+
+    # Extra or replacement presets as JSON, e.g. IMAGE_PRESETS={"square": {"width": 1024, "height": 1024}}
+    IMAGE_PRESETS: str = "{}"
+
+    # --- Image Batching Settings ---
+    # Jobs with identical generation parameters that arrive within the wait window are sent to Forge as one batch
+    IMAGE_BATCH_MAX_SIZE: int = 4 # 1 disables batching
+    IMAGE_BATCH_MAX_WAIT_MS: int = 250
+
+    # --- Dispatch Settings ---
+    # Number of worker threads processing incoming messages; a sender is always handled by the same worker
+    DISPATCH_WORKERS: int = 4
+    # Consecutive chat messages from one sender arriving within this window are merged into one LLM turn (0 disables)
+    COALESCE_WINDOW_MS: int = 0
+    COALESCE_MAX_HOLD_MS: int = 3000 # Upper bound on how long a turn is held back
+    # 0 handles messages in this process. N > 0 starts N worker processes, each with its own LLMClient, image batcher
+    # and DISPATCH_WORKERS threads; senders are sharded across them so a conversation always lives in one worker
+    WORKER_PROCESSES: int = 0
+
+    # --- Deadlines and Cancellation ---
+    # Work not finished this long after its message arrived is cancelled: its LLM stream is closed and its
+    # Forge render interrupted (0 disables). Image deadlines cover ';' requests, LLM prompt included
+    CHAT_DEADLINE_S: float = 300.0
+    IMAGE_DEADLINE_S: float = 600.0
+    # Queued or running work of a conversation that a newer message of the same conversation cancels, as
+    # <message type>=<types> pairs separated by ';'. Types: chat, image_llm (';'), image_direct (xx), reset.
+    # A superseded chat message is folded into the new one; /cancel always cancels everything
+    SUPERSEDE_POLICY: str = "chat=chat;reset=chat,image_llm,image_direct"
+
+    # --- Prompt Cache Prewarming ---
+    # When a user starts typing in an idle conversation, its history is sent to the LLM with max_tokens=1
+    # so the server's prompt cache holds the prefix by the time the message arrives. Only histories of at
+    # least PREWARM_MIN_WORDS words are prewarmed; PREWARM_BUDGET_PER_MIN caps prewarms across all workers
+    PREWARM_ENABLED: bool = False
+    PREWARM_COOLDOWN_S: float = 60.0 # Per conversation
+    PREWARM_BUDGET_PER_MIN: int = 10
+    PREWARM_MIN_WORDS: int = 1000
+
+    # Add other configurations as needed
+    SIGNAL_CLI_PATH: str = "signal-cli"
+    YOUR_SIGNAL_NUMBER: str | None = None
+
+    # --- Duplicate Envelope Suppression ---
+    # signal-cli can redeliver the same envelope after a restart or resync; keys seen within the window are dropped
+    DEDUP_CAPACITY: int = 4096
+    DEDUP_WINDOW_S: int = 86400
+    DEDUP_SNAPSHOT_PATH: str = str(project_root / '.dedup_snapshot.json') # Empty disables persistence
+    DEDUP_SNAPSHOT_INTERVAL_S: int = 30
+
+    # --- Metrics Endpoint ---
+    # Prometheus text format served at http://METRICS_HOST:METRICS_PORT/metrics (port 0 disables)
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9464
+
+    # --- Traffic Capture ---
+    # When set, inbound 'receive' frames are appended to this gzip JSONL file for replay with benchmarks/replay.py
+    TRAFFIC_CAPTURE_PATH: str = ""
+    TRAFFIC_CAPTURE_BODIES: str = "hash" # keep, hash or redact
+
+    # --- Tracing and Profiling ---
+    # Spans for every message are appended as JSONL (OpenTelemetry field names) to this rotating file when set
+    TRACE_EXPORT_PATH: str = ""
+    TRACE_EXPORT_MAX_BYTES: int = 10 * 1024 * 1024
+    TRACE_EXPORT_BACKUPS: int = 5
+    # cProfile output and stack captures requested via SIGUSR1 or the /profile command
+    PROFILE_OUTPUT_DIR: str = str(project_root / 'profiles')
+    PROFILE_SIGNAL_MESSAGES: int = 5 # Messages profiled per SIGUSR1
+
+    # --- Long-Term Memory (optional, requires numpy) ---
+    # Past turns are embedded via /v1/embeddings; each chat request then carries the most relevant
+    # past snippets plus the most recent messages instead of the whole history
+    MEMORY_ENABLED: bool = False
+    EMBEDDING_MODEL: str = "text-embedding-nomic-embed-text-v1.5"
+    MEMORY_TOP_K: int = 4
+    MEMORY_MIN_SCORE: float = 0.3 # Cosine similarity below which a snippet is not injected
+    MEMORY_RECENT_MESSAGES: int = 8 # User/assistant messages sent verbatim alongside the recalled snippets
+    MEMORY_DIR: str = str(project_root / 'memory') # Per-conversation indexes are persisted here (empty disables)
+    MEMORY_SAVE_INTERVAL_S: int = 60
+    MEMORY_MAX_PENDING_TURNS: int = 200 # Turns waiting to be embedded per conversation; the oldest are dropped beyond this
+
+    # --- Add JSON_RPC_PORT and SIGNAL_DAEMON_ADDRESS ---
+    JSON_RPC_PORT: int = 7583 # Default to 7583 if not in .env
+    SIGNAL_DAEMON_HOST: str = "127.0.0.1"
+    # Set to False to connect to a signal-cli daemon that is already running (e.g. a system service) instead of launching one
+    SIGNAL_CLI_MANAGE_DAEMON: bool = True
+    # How long to keep polling the daemon's TCP port before giving up (signal-cli can take a while to start)
+    SIGNAL_CLI_STARTUP_TIMEOUT_S: float = 60.0
+    # More accounts answered by the same workers, as comma-separated number@host:port of signal-cli daemons
+    # that are already running, e.g. SIGNAL_EXTRA_ACCOUNTS=+15551234567@127.0.0.1:7584
+    SIGNAL_EXTRA_ACCOUNTS: str = ""
+    # Replies are only taken from the send queue while less than this much is buffered for the daemon sockets
+    SEND_BUFFER_HIGH_WATER_BYTES: int = 1024 * 1024
+    # Replies waiting for the sender; threads queuing more block for up to SEND_QUEUE_PUT_TIMEOUT_S, then the reply is dropped
+    SEND_QUEUE_MAX_MESSAGES: int = 1000
+    SEND_QUEUE_PUT_TIMEOUT_S: float = 30.0
+    # --- End Add ---
+
+    def __post_init__(self):
+        # Reject malformed preset JSON, account lists and policies at load time so a bad reload keeps the previous snapshot
+        self.GENERATION_PRESETS
+        self.SIGNAL_ACCOUNTS
+        self.SUPERSEDES
+
+    @property
+    def SIGNAL_DAEMON_ADDRESS(self) -> str:
+        return f"{self.SIGNAL_DAEMON_HOST}:{self.JSON_RPC_PORT}"
+
+    @property
+    def SIGNAL_ACCOUNTS(self) -> tuple:
+        """(account, daemon address) pairs; the first is YOUR_SIGNAL_NUMBER on SIGNAL_DAEMON_ADDRESS."""
+        accounts = [(self.YOUR_SIGNAL_NUMBER, self.SIGNAL_DAEMON_ADDRESS)]
+        for entry in filter(None, (part.strip() for part in self.SIGNAL_EXTRA_ACCOUNTS.split(","))):
+            account, _, address = entry.partition("@")
+            host, _, port = address.rpartition(":")
+            if not account or not host or not port.isdigit():
+                raise ValueError(f"SIGNAL_EXTRA_ACCOUNTS entries must look like +15551234567@127.0.0.1:7584, got {entry!r}")
+            accounts.append((account, address))
+        return tuple(accounts)
+
+    @property
+    def SUPERSEDES(self) -> dict:
+        """Message type -> frozenset of the types of earlier work it cancels, parsed from SUPERSEDE_POLICY."""
+        kinds = {"chat", "image_llm", "image_direct", "reset"}
+        policy = {}
+        for entry in filter(None, (part.strip() for part in self.SUPERSEDE_POLICY.split(";"))):
+            kind, _, targets = entry.partition("=")
+            targets = frozenset(filter(None, (target.strip() for target in targets.split(","))))
+            if kind.strip() not in kinds or not targets <= kinds - {"reset"}:
+                raise ValueError(f"SUPERSEDE_POLICY entries must look like chat=chat,image_llm, got {entry!r}")
+            policy[kind.strip()] = targets
+        return policy
+
+    @property
+    def GENERATION_PRESETS(self) -> dict:
+        # --- Image Generation Presets ---
+        # Selected per message with a command prefix, e.g. "/fast xx a red fox" or "/quality show me the view;"
+        # Each preset only lists the parameters it changes relative to the defaults above.
+        presets = {
+            "fast": {
+                "steps": max(4, self.DEFAULT_SAMPLING_STEPS // 2),
+                "hires_fix_enabled": False,
+            },
+            "quality": {
+                "steps": self.DEFAULT_SAMPLING_STEPS * 2,
+                "hires_fix_enabled": True,
+                "hires_steps": self.DEFAULT_SAMPLING_STEPS,
+            },
+            "portrait": {
+                "width": min(self.DEFAULT_IMAGE_WIDTH, self.DEFAULT_IMAGE_HEIGHT),
+                "height": max(self.DEFAULT_IMAGE_WIDTH, self.DEFAULT_IMAGE_HEIGHT),
+            },
+        }
+        extra = json.loads(self.IMAGE_PRESETS)
+        if not isinstance(extra, dict):
+            raise ValueError("IMAGE_PRESETS must be a JSON object")
+        presets.update(extra)
+        return presets
+
+
+# Only read at startup; changing one of these with reload() takes effect after a restart
+RESTART_REQUIRED = frozenset({
+    "SIGNAL_CLI_PATH", "YOUR_SIGNAL_NUMBER", "JSON_RPC_PORT", "SIGNAL_DAEMON_HOST", "SIGNAL_CLI_MANAGE_DAEMON",
+    "SIGNAL_CLI_STARTUP_TIMEOUT_S", "SIGNAL_EXTRA_ACCOUNTS", "SEND_BUFFER_HIGH_WATER_BYTES", "SEND_QUEUE_MAX_MESSAGES", "DISPATCH_WORKERS", "WORKER_PROCESSES",
+    "COALESCE_WINDOW_MS", "COALESCE_MAX_HOLD_MS",
+    "DEDUP_CAPACITY", "DEDUP_WINDOW_S", "DEDUP_SNAPSHOT_PATH", "DEDUP_SNAPSHOT_INTERVAL_S",
+    "METRICS_HOST", "METRICS_PORT", "TRAFFIC_CAPTURE_PATH", "TRAFFIC_CAPTURE_BODIES",
+    "TRACE_EXPORT_PATH", "TRACE_EXPORT_MAX_BYTES", "TRACE_EXPORT_BACKUPS", "PROFILE_OUTPUT_DIR",
+    "MEMORY_ENABLED", "MEMORY_DIR", "MEMORY_SAVE_INTERVAL_S", "MEMORY_MAX_PENDING_TURNS",
+})
+
+
+def _convert(name, field_type, raw):
+    if field_type is bool:
+        return raw.lower() == 'true'
+    if field_type in (int, float):
+        try:
+            return field_type(raw)
+        except ValueError:
+            raise ValueError(f"{name} must be {field_type.__name__}, got {raw!r}") from None
+    return raw
+
+
+def load_settings(path=dotenv_path, environ=None) -> Settings:
+    """
+    Builds a snapshot from .env and the environment without modifying os.environ.
+    Values in .env take precedence. Raises ValueError if a value can't be parsed.
+    """
+    environ = os.environ if environ is None else environ
+    dotenv = dotenv_values(path) if Path(path).is_file() else {}
+    values = {}
+    for field in fields(Settings):
+        raw = dotenv.get(field.name)
+        if raw is None:
+            raw = environ.get(field.name)
+        if raw is not None:
+            field_type = str if field.type == (str | None) else field.type
+            values[field.name] = _convert(field.name, field_type, raw)
+    return Settings(**values)
+
+
+_current = load_settings()
+_reload_lock = threading.Lock()
+_reload_callbacks = []
+
+def current() -> Settings:
+    """Returns the active settings snapshot. Capture it once per request for consistent values."""
+    return _current
+
+def on_reload(callback):
+    """Registers callback(old, new), called after each successful reload."""
+    _reload_callbacks.append(callback)
+
+def reload(path=dotenv_path) -> list:
+    """
+    Re-reads .env and the environment and atomically replaces the active snapshot.
+    Returns the names of the settings that changed. On a parse error the previous
+    snapshot stays active and the ValueError propagates.
+    """
+    global _current
+    with _reload_lock:
+        new = load_settings(path)
+        old = _current
+        _current = new
+        changed = [field.name for field in fields(Settings) if getattr(old, field.name) != getattr(new, field.name)]
+        for callback in list(_reload_callbacks):
+            try:
+                callback(old, new)
+            except Exception as e:
+                print(f"Error applying reloaded settings: {e}", flush=True)
+    return changed
+
+
+# Module-level names hold the values loaded at import. Components that are only configured at
+# startup (ports, paths, worker counts) use these; per-request code uses current() instead.
+globals().update({field.name: getattr(_current, field.name) for field in fields(Settings)})
+SIGNAL_DAEMON_ADDRESS = _current.SIGNAL_DAEMON_ADDRESS
+SIGNAL_ACCOUNTS = _current.SIGNAL_ACCOUNTS
+GENERATION_PRESETS = _current.GENERATION_PRESETS
+
+
+def report():
+    """Prints where settings came from; called once at startup instead of at import."""
+    if dotenv_path.is_file():
+        print(f"Loaded .env file from: {dotenv_path}", flush=True)
+    else:
+        print(f"Warning: .env file not found at {dotenv_path}; using environment variables.", flush=True)
+    if YOUR_SIGNAL_NUMBER is None:
+        print("Error: YOUR_SIGNAL_NUMBER is not set. Check .env file content and location.", flush=True)
+    else:
+        print(f"Successfully loaded YOUR_SIGNAL_NUMBER: {YOUR_SIGNAL_NUMBER}", flush=True)
+    print(f"Signal Daemon Address configured to: {SIGNAL_DAEMON_ADDRESS}", flush=True)
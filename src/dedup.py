@@ -0,0 +1,103 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from .config import DEDUP_CAPACITY, DEDUP_WINDOW_S, DEDUP_SNAPSHOT_PATH, DEDUP_SNAPSHOT_INTERVAL_S
+
+
+class EnvelopeDeduplicator:
+    """
+    Bounded, time-windowed index of recently seen (source, envelope timestamp) keys.
+
+    A ring buffer keeps keys in arrival order so the oldest can be evicted when capacity is
+    reached or they fall out of the window; a set alongside it gives O(1) lookups. Memory is
+    constant at `capacity` entries. The index is snapshotted to disk so duplicates redelivered
+    by signal-cli after a restart of this process are still caught.
+    """
+
+    def __init__(self, capacity=DEDUP_CAPACITY, window_s=DEDUP_WINDOW_S, snapshot_path=DEDUP_SNAPSHOT_PATH,
+                 snapshot_interval_s=DEDUP_SNAPSHOT_INTERVAL_S):
+        self.capacity = max(1, capacity)
+        self.window_s = window_s
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval_s = snapshot_interval_s
+        self.stats = {"checked": 0, "suppressed": 0}
+        self._ring = collections.deque()  # (key, seen_at) in arrival order
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_snapshot = time.time()
+
+    def is_duplicate(self, source, timestamp):
+        """Records the key and returns True if it was already seen inside the window."""
+        if source is None or timestamp is None:
+            return False
+        key = (source, timestamp)
+        now = time.time()
+        with self._lock:
+            self.stats["checked"] += 1
+            self._expire(now)
+            if key in self._keys:
+                self.stats["suppressed"] += 1
+                return True
+            if len(self._ring) >= self.capacity:
+                old_key, _ = self._ring.popleft()
+                self._keys.discard(old_key)
+            self._ring.append((key, now))
+            self._keys.add(key)
+            self._dirty = True
+            snapshot_due = self.snapshot_path and now - self._last_snapshot >= self.snapshot_interval_s
+        if snapshot_due:
+            self.save()
+        return False
+
+    def _expire(self, now):
+        while self._ring and now - self._ring[0][1] > self.window_s:
+            old_key, _ = self._ring.popleft()
+            self._keys.discard(old_key)
+
+    def load(self):
+        """Restores the index from the snapshot file, dropping entries that have expired."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load dedup snapshot {self.snapshot_path}: {e}", flush=True)
+            return
+
+        now = time.time()
+        with self._lock:
+            self._ring.clear()
+            self._keys.clear()
+            for source, timestamp, seen_at in entries[-self.capacity:]:
+                if now - seen_at > self.window_s:
+                    continue
+                key = (source, timestamp)
+                if key not in self._keys:
+                    self._ring.append((key, seen_at))
+                    self._keys.add(key)
+
+    def save(self):
+        """Writes the index to the snapshot file (atomically, via a temp file)."""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[source, timestamp, seen_at] for (source, timestamp), seen_at in self._ring]
+            self._dirty = False
+            self._last_snapshot = time.time()
+        temp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"Warning: could not save dedup snapshot {self.snapshot_path}: {e}", flush=True)
+
+    def __len__(self):
+        return len(self._ring)
@@ -0,0 +1,204 @@
+import threading
+import time
+
+from . import config as app_config
+from .cancellation import Cancelled, CancelToken
+from .config import IMAGE_BATCH_MAX_SIZE, IMAGE_BATCH_MAX_WAIT_MS
+from .image_generator import generate_images, default_generation_params
+
+
+def batch_key(prompt: str, params: dict) -> tuple:
+    """
+    Jobs can share a Forge batch only if their prompt and every generation parameter match:
+    the txt2img UI call renders batch_size images of one prompt string.
+    """
+    return (prompt.strip(), tuple(sorted(params.items())))
+
+
+class ImageJob:
+    def __init__(self, prompt, params, trace=None, settings=None, cancel_token=None):
+        self.prompt = prompt
+        self.params = params
+        self.trace = trace
+        self.cancel_token = cancel_token
+        self.settings = settings or app_config.current()
+        # Jobs started before and after a config reload may target different Forge servers
+        self.key = (batch_key(prompt, params), self.settings.FORGE_API_URL)
+        self.enqueued_at = time.monotonic()
+        self.result = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.result
+
+
+class ImageBatcher:
+    """
+    Collects image jobs from concurrent callers and submits compatible ones (same prompt and
+    settings, e.g. several users sending the same preset request) to Forge together.
+
+    A job with no compatible job pending is submitted at once, so unique prompts never wait.
+    Otherwise its batch is flushed when it reaches max_batch_size or when its oldest job has
+    waited max_wait_ms; partners mostly gather while Forge is busy with the previous batch.
+    Outputs are fanned back out to the job that asked for them. Jobs cancelled
+    while waiting are dropped; a batch is only cancelled once all of its jobs are.
+    """
+
+    def __init__(self, generate_batch=generate_images, max_batch_size=IMAGE_BATCH_MAX_SIZE, max_wait_ms=IMAGE_BATCH_MAX_WAIT_MS):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.stats = {"jobs": 0, "batches": 0, "batched_jobs": 0, "fallback_jobs": 0, "cancelled_jobs": 0}
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="ImageBatcherThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._thread = None
+        for job in pending:
+            job.done.set()
+
+    def configure(self, max_batch_size, max_wait_ms):
+        """Applies new limits to batches formed from now on (used on config reload)."""
+        with self._cond:
+            self.max_batch_size = max(1, max_batch_size)
+            self.max_wait = max(0, max_wait_ms) / 1000.0
+            self._cond.notify_all()
+
+    def submit(self, prompt, params=None, trace=None, settings=None, cancel_token=None):
+        settings = settings or app_config.current()
+        gen_params = default_generation_params(settings)
+        if params:
+            gen_params.update(params)
+        job = ImageJob(prompt, gen_params, trace, settings, cancel_token)
+
+        with self._cond:
+            self.stats["jobs"] += 1
+            if self._running:
+                self._pending.append(job)
+                self._cond.notify_all()
+                return job
+
+        # Batcher not running: submit on the caller's thread
+        self._run_batch([job])
+        return job
+
+    def generate(self, prompt, params=None, timeout=None, trace=None, settings=None, cancel_token=None):
+        """
+        Blocking equivalent of image_generator.generate_image that goes through the batcher.
+        Returns None as soon as `cancel_token` is cancelled or its deadline passes, even while the
+        job is still queued or its batch is still rendering for other jobs.
+        """
+        job = self.submit(prompt, params, trace, settings, cancel_token)
+        if cancel_token is None:
+            return job.wait(timeout)
+        unregister = cancel_token.on_cancel(lambda reason: self._abandon(job))
+        end = None if timeout is None else time.monotonic() + timeout
+        try:
+            while not job.done.is_set():
+                left = None if end is None else end - time.monotonic()
+                if left is not None and left <= 0:
+                    break
+                if job.done.wait(cancel_token.remaining(left)):
+                    break
+                if cancel_token.expired():
+                    cancel_token.cancel("deadline")
+                    break
+        finally:
+            unregister()
+        return job.result
+
+    def _abandon(self, job):
+        """Drops a cancelled job that is still queued and wakes its caller; a running batch goes on for its other jobs."""
+        with self._cond:
+            if job in self._pending:
+                self._pending.remove(job)
+                self.stats["cancelled_jobs"] += 1
+        job.done.set()
+
+    def _take_batch(self):
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            if not self._running:
+                return []
+            self._drop_cancelled()
+            if not self._pending:
+                return []
+
+            oldest = self._pending[0]
+            deadline = oldest.enqueued_at + self.max_wait
+            while self._running:
+                group_size = sum(1 for job in self._pending if job.key == oldest.key)
+                remaining = deadline - time.monotonic()
+                if group_size == 1 or group_size >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [job for job in self._pending if job.key == oldest.key][:self.max_batch_size]
+            self._pending = [job for job in self._pending if job not in batch]
+            return batch
+
+    def _drop_cancelled(self):
+        cancelled = [job for job in self._pending if job.cancel_token is not None and job.cancel_token.cancelled]
+        if cancelled:
+            self.stats["cancelled_jobs"] += len(cancelled)
+            self._pending = [job for job in self._pending if job not in cancelled]
+            for job in cancelled:
+                job.done.set()
+
+    def _run(self):
+        while self._running:
+            batch = self._take_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        params = batch[0].params
+        settings = batch[0].settings
+        tokens = [job.cancel_token for job in batch]
+        cancel_token = None if None in tokens else tokens[0] if len(tokens) == 1 else CancelToken.all_of(tokens)
+        try:
+            results = self.generate_batch([job.prompt for job in batch], params, [job.trace for job in batch], settings,
+                                          cancel_token=cancel_token)
+        except Cancelled:
+            results = []
+        except Exception as e:
+            print(f"Error generating image batch: {e}", flush=True)
+            results = []
+        results = list(results) + [None] * (len(batch) - len(results))
+
+        with self._cond:
+            self.stats["batches"] += 1
+            if len(batch) > 1:
+                self.stats["batched_jobs"] += len(batch)
+
+        for job, result in zip(batch, results):
+            # Retry jobs the batch did not produce an image for on their own
+            if result is None and len(batch) > 1 and not (job.cancel_token and job.cancel_token.cancelled):
+                with self._cond:
+                    self.stats["fallback_jobs"] += 1
+                try:
+                    result = self.generate_batch([job.prompt], params, [job.trace], settings, cancel_token=job.cancel_token)[0]
+                except Cancelled:
+                    pass
+                except Exception as e:
+                    print(f"Error generating image: {e}", flush=True)
+            job.result = result
+            job.done.set()
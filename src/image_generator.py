@@ -5,8 +5,16 @@ import tempfile
 import random
 import string
 import time
+import functools
+import threading
 import orjson
 
+from . import metrics
+from . import tracing
+from .readiness import tracker as readiness
+from .cancellation import Cancelled, close_stream
+from . import config as app_config
+
 from .config import (
     FORGE_API_URL,
     DEFAULT_NEGATIVE_PROMPT,
@@ -21,25 +29,250 @@ from .config import (
     DEFAULT_HIRES_DENOISING_STRENGTH,
     DEFAULT_HIRES_UPSCALER,
     DEFAULT_HIRES_UPSCALE_BY,
-    DEFAULT_HIRES_STEPS
+    DEFAULT_HIRES_STEPS,
 )
 
 TEMP_IMAGE_DIR = os.path.join(os.path.dirname(__file__), '..', 'temp_images')
-os.makedirs(TEMP_IMAGE_DIR, exist_ok=True)
 
 def generate_random_string(length=15):
     return ''.join(random.choice(string.ascii_lowercase + string.digits) for _ in range(length))
 
-def generate_image(prompt: str) -> str | None:
-    if not FORGE_API_URL:
-        print("Error: FORGE_API_URL is not configured.")
+# --- Forge txt2img payload (fn_index: 256) ---
+# Named-field schema of the positional data array. Order and types must match exactly what the UI
+# expects. Fields named None are fixed and never patched per request.
+_PAYLOAD_SCHEMA = [
+    ("task_id", ""),
+    ("prompt", ""),
+    ("negative_prompt", DEFAULT_NEGATIVE_PROMPT),
+    (None, []),
+    ("batch_count", 1),
+    ("batch_size", 1),
+    (None, 1.3),
+    (None, 3.5),
+    ("width", DEFAULT_IMAGE_WIDTH),
+    ("height", DEFAULT_IMAGE_HEIGHT),
+    ("hires_fix_enabled", DEFAULT_HIRES_FIX_ENABLED),
+    ("hires_denoising_strength", DEFAULT_HIRES_DENOISING_STRENGTH),
+    ("hires_upscale_by", DEFAULT_HIRES_UPSCALE_BY),
+    ("hires_upscaler", DEFAULT_HIRES_UPSCALER),
+    ("hires_steps", DEFAULT_HIRES_STEPS),
+    ("hires_target_width", 0),
+    ("hires_target_height", 0),
+    ("hires_checkpoint", "Use same checkpoint"),
+    (None, ["Use same choices"]),
+    ("hires_sampler", "Use same sampler"),
+    ("hires_scheduler", "Use same scheduler"),
+    ("script_name", ""),
+    ("script_args", ""),
+    ("cfg_scale", DEFAULT_CFG_SCALE),
+    (None, 3.5),
+    (None, None),
+    ("sampler_override", "None"),
+    ("steps", DEFAULT_SAMPLING_STEPS),
+    ("sampler_name", DEFAULT_SAMPLER_NAME),
+    ("scheduler", DEFAULT_SCHEDULER),
+    ("restore_faces", False),
+    ("tiling", ""),
+    ("denoising_strength", 0.8),
+    ("seed", DEFAULT_SEED),
+    ("variation_seed_enabled", False),
+    ("variation_seed", -1),
+    ("variation_seed_strength", 0),
+    ("resize_seed_from", 0),
+    ("sigma_churn", 0),
+]
+
+_PAYLOAD_SCHEMA += [(None, value) for value in (
+    # ControlNet parameters
+    None, None, None, False, 7, 1, "Constant", 0, "Constant", 0, 1,
+
+    # ADetailer parameters
+    "enable", "MEAN", "AD", 1, False, 1.01, 1.02, 0.99, 0.95, 0, 1, False,
+    0.5, 2, 1, False, 3, 0, 0, 1, False, 3, 2, 0, 0.35, True, "bicubic", "bicubic",
+    False, 0, "anisotropic", 0, "reinhard", 100, 0, "subtract", 0, 0, "gaussian",
+    "add", 0, 100, 127, 0, "hard_clamp", 5, 0, "None", "None",
+
+    # Additional parameters
+    False, "MultiDiffusion", 768, 768, 64, 4, False, 1, False, False, False, False,
+    "positive", "comma", 0, False, False, "start", "", False,
+    "Seed", "", "", "Nothing", "", "", "Nothing", "", "",
+    True, False, False, False, False, False, False, 0, False,
+)]
+
+# Compiled once at import: the default data array and the position of every named field
+_PAYLOAD_TEMPLATE = [value for _, value in _PAYLOAD_SCHEMA]
+_FIELD_INDEX = {name: index for index, (name, _) in enumerate(_PAYLOAD_SCHEMA) if name is not None}
+
+# Fields users can change through params/presets; they also make up the image batching key
+GENERATION_PARAM_FIELDS = (
+    "width", "height", "cfg_scale", "steps", "sampler_name", "scheduler", "seed", "negative_prompt",
+    "hires_fix_enabled", "hires_denoising_strength", "hires_upscaler", "hires_upscale_by", "hires_steps",
+)
+
+# Setting that supplies the default for each generation parameter
+_PARAM_SETTINGS = {
+    "width": "DEFAULT_IMAGE_WIDTH", "height": "DEFAULT_IMAGE_HEIGHT", "cfg_scale": "DEFAULT_CFG_SCALE",
+    "steps": "DEFAULT_SAMPLING_STEPS", "sampler_name": "DEFAULT_SAMPLER_NAME", "scheduler": "DEFAULT_SCHEDULER",
+    "seed": "DEFAULT_SEED", "negative_prompt": "DEFAULT_NEGATIVE_PROMPT",
+    "hires_fix_enabled": "DEFAULT_HIRES_FIX_ENABLED", "hires_denoising_strength": "DEFAULT_HIRES_DENOISING_STRENGTH",
+    "hires_upscaler": "DEFAULT_HIRES_UPSCALER", "hires_upscale_by": "DEFAULT_HIRES_UPSCALE_BY",
+    "hires_steps": "DEFAULT_HIRES_STEPS",
+}
+
+def default_generation_params(settings=None) -> dict:
+    """Returns the generation parameters configured in the given (default: current) settings snapshot."""
+    settings = settings or app_config.current()
+    return {name: getattr(settings, _PARAM_SETTINGS[name]) for name in GENERATION_PARAM_FIELDS}
+
+def build_payload_data(fields: dict) -> list:
+    """Copies the compiled template and patches only the given named fields."""
+    data = _PAYLOAD_TEMPLATE.copy()
+    for name, value in fields.items():
+        index = _FIELD_INDEX.get(name)
+        if index is None:
+            raise KeyError(f"Unknown Forge payload field: {name}")
+        data[index] = value
+    return data
+
+# --- Generation presets ---
+@functools.lru_cache(maxsize=4)
+def _load_presets(settings) -> dict:
+    presets = {}
+    for name, overrides in settings.GENERATION_PRESETS.items():
+        unknown = [field for field in overrides if field not in GENERATION_PARAM_FIELDS]
+        if unknown:
+            print(f"Warning: ignoring unknown fields {unknown} in image preset '{name}'")
+        presets[name.lower()] = {field: value for field, value in overrides.items() if field in GENERATION_PARAM_FIELDS}
+    return presets
+
+def get_presets(settings=None) -> dict:
+    """Returns all presets of the given (default: current) settings snapshot by lowercase name."""
+    return {name: dict(overrides) for name, overrides in _load_presets(settings or app_config.current()).items()}
+
+def get_preset(name: str, settings=None) -> dict | None:
+    """Returns the parameter overrides for a named preset, or None if it doesn't exist."""
+    preset = _load_presets(settings or app_config.current()).get(name.lower())
+    return dict(preset) if preset is not None else None
+
+def check_forge_reachable(timeout=5) -> bool:
+    """Reports Forge as ready if its web server answers at all; image requests don't wait on this."""
+    forge_api_url = app_config.current().FORGE_API_URL
+    try:
+        requests.get(f"{forge_api_url}/internal/ping", timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        metrics.record_error("forge_check", e)
+        readiness.failed("forge", f"{forge_api_url} not reachable ({type(e).__name__})")
+        return False
+    readiness.ready("forge", forge_api_url)
+    return True
+
+def _apply_quality_tags(prompt: str) -> str:
+    quality_tags = "best quality, dynamic lighting"
+    user_or_llm_prompt = prompt.strip()
+    return f"{quality_tags.rstrip(', ')}, {user_or_llm_prompt.lstrip(', ')}" if user_or_llm_prompt else quality_tags
+
+def _save_image_bytes(image_data_bytes: bytes) -> str:
+    os.makedirs(TEMP_IMAGE_DIR, exist_ok=True)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png", dir=TEMP_IMAGE_DIR)
+    temp_file.write(image_data_bytes)
+    temp_file.close()
+    return temp_file.name
+
+def _fetch_gallery_item(item, forge_api_url) -> str | None:
+    """Downloads or decodes a single gallery entry from a Forge result into a temp file."""
+    if isinstance(item, str) and item.startswith('data:image/png;base64,'):
+        # Handle direct base64 fallback
+        try:
+            return _save_image_bytes(base64.b64decode(item.split(',', 1)[1]))
+        except Exception as e:
+            print(f"Error decoding base64: {e}")
+            metrics.record_error("download", e)
+            return None
+
+    if not isinstance(item, dict):
+        return None
+    image_dict = item.get('image')
+    if not image_dict or not isinstance(image_dict, dict):
+        return None
+    image_url_to_download = image_dict.get('url')
+    if not image_url_to_download or not isinstance(image_url_to_download, str):
         return None
 
+    if image_url_to_download.startswith('/file='):
+        absolute_image_url = f"{forge_api_url.rstrip('/')}{image_url_to_download}"
+    elif image_url_to_download.startswith('http'):
+        absolute_image_url = image_url_to_download
+    else:
+        return None
+
+    try:
+        image_response = requests.get(absolute_image_url, timeout=30)
+        image_response.raise_for_status()
+        return _save_image_bytes(image_response.content)
+    except Exception as e:
+        print(f"Error downloading image: {e}")
+        metrics.record_error("download", e)
+        return None
+
+def _interrupt_render(forge_api_url):
+    """Stops the render Forge is sampling right now; needs Forge to run with --api."""
+    try:
+        requests.post(f"{forge_api_url.rstrip('/')}/sdapi/v1/interrupt", timeout=5).raise_for_status()
+        metrics.upstream_cancels_total.inc(target="forge_interrupt")
+    except requests.exceptions.RequestException as e:
+        metrics.record_error("forge_interrupt", e)
+
+def generate_images(prompts: list[str], params: dict | None = None, traces: list | None = None, settings=None, cancel_token=None) -> list[str | None]:
+    """
+    Renders one image per entry of `prompts` as a single Forge batch (batch size = len(prompts)).
+    All entries must be the same prompt: the txt2img UI call takes one prompt string per batch.
+    Returns one temp file path per entry, in order; entries are None where no image came back.
+    `traces` optionally holds one parent span per prompt; each gets its own forge.* child spans.
+    `settings` is the snapshot the request started with; defaults and the Forge URL come from it.
+    Cancelling `cancel_token` closes the result stream, so gradio drops the job if it is still
+    queued, and interrupts it if it is already sampling; the call then raises Cancelled.
+    """
+    settings = settings or app_config.current()
+    if not prompts:
+        return []
+    spans = [tracing.start_span("forge.generate", parent, **{"forge.batch_size": len(prompts)})
+             for parent in (traces or []) if parent is not None]
+    try:
+        image_paths = _generate_images(prompts, params, spans, settings, cancel_token)
+    except Exception as e:
+        for span in spans:
+            span.record_error(e)
+        raise
+    finally:
+        for span in spans:
+            span.end()
+    for span, path in zip(spans, image_paths):
+        if path is None:
+            span.record_error("no_image")
+    return image_paths
+
+def _generate_images(prompts, params, spans, settings, cancel_token=None):
+    # Construct prompt with quality tags. The prompt slot is a Textbox that gradio stringifies,
+    # so a batch can only render batch_size images of the same prompt.
+    batch_prompts = [_apply_quality_tags(p) for p in prompts]
+    if len(set(batch_prompts)) > 1:
+        raise ValueError("A Forge batch renders a single prompt; got different prompts")
+    forge_api_url = settings.FORGE_API_URL
+    if not forge_api_url:
+        print("Error: FORGE_API_URL is not configured.")
+        return [None] * len(prompts)
+    if cancel_token is not None:
+        cancel_token.check()
+
+    gen_params = default_generation_params(settings)
+    if params:
+        gen_params.update(params)
+
     task_id_payload = f"task({generate_random_string()})"
     session_hash_payload = generate_random_string()
 
     # Register task with /internal/progress
-    internal_progress_endpoint = f"{FORGE_API_URL.rstrip('/')}/internal/progress"
+    internal_progress_endpoint = f"{forge_api_url.rstrip('/')}/internal/progress"
     progress_request_payload = {
         "id_task": task_id_payload,
         "id_live_preview": -1,
@@ -51,74 +284,21 @@ def generate_image(prompt: str) -> str | None:
         response_progress_init.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"Error calling initial /internal/progress: {e}")
-        return None
+        metrics.record_error("forge_progress", e)
+        return [None] * len(prompts)
 
-    # Construct prompt with quality tags
-    quality_tags = "best quality, dynamic lighting"
-    user_or_llm_prompt = prompt.strip()
-    current_prompt = f"{quality_tags.rstrip(', ')}, {user_or_llm_prompt.lstrip(', ')}" if user_or_llm_prompt else quality_tags
-    
-    # Payload array for Stable Diffusion Forge WebUI (fn_index: 256)
-    # Order and types must match exactly what the UI expects
-    data_payload_list = [
-        task_id_payload,
-        current_prompt,
-        DEFAULT_NEGATIVE_PROMPT,
-        [],
-        1,  # Batch count
-        1,  # Batch size
-        1.3,
-        3.5,
-        DEFAULT_IMAGE_WIDTH,
-        DEFAULT_IMAGE_HEIGHT,
-        DEFAULT_HIRES_FIX_ENABLED,
-        DEFAULT_HIRES_DENOISING_STRENGTH,
-        DEFAULT_HIRES_UPSCALE_BY,
-        DEFAULT_HIRES_UPSCALER,
-        DEFAULT_HIRES_STEPS,
-        0,  # Hires target width
-        0,  # Hires target height
-        "Use same checkpoint",
-        ["Use same choices"],
-        "Use same sampler",
-        "Use same scheduler",
-        "",  # Script name
-        "",  # Script arguments
-        DEFAULT_CFG_SCALE,
-        3.5,
-        None,
-        "None",  # Sampler override
-        DEFAULT_SAMPLING_STEPS,
-        DEFAULT_SAMPLER_NAME,
-        DEFAULT_SCHEDULER,
-        False,  # Restore faces
-        "",     # Tiling
-        0.8,    # Denoising strength
-        DEFAULT_SEED,
-        False,  # Variation seed enabled
-        -1,     # Variation seed
-        0,      # Variation seed strength
-        0,      # Resize seed from H/W
-        0,      # Sigma churn
-        
-        # ControlNet parameters
-        None, None, None, False, 7, 1, "Constant", 0, "Constant", 0, 1,
-        
-        # ADetailer parameters
-        "enable", "MEAN", "AD", 1, False, 1.01, 1.02, 0.99, 0.95, 0, 1, False,
-        0.5, 2, 1, False, 3, 0, 0, 1, False, 3, 2, 0, 0.35, True, "bicubic", "bicubic",
-        False, 0, "anisotropic", 0, "reinhard", 100, 0, "subtract", 0, 0, "gaussian",
-        "add", 0, 100, 127, 0, "hard_clamp", 5, 0, "None", "None",
-        
-        # Additional parameters
-        False, "MultiDiffusion", 768, 768, 64, 4, False, 1, False, False, False, False,
-        "positive", "comma", 0, False, False, "start", "", False,
-        "Seed", "", "", "Nothing", "", "", "Nothing", "", "",
-        True, False, False, False, False, False, False, 0, False
-    ]
+    fields = {name: value for name, value in gen_params.items() if name in GENERATION_PARAM_FIELDS}
+    fields.update({
+        "task_id": task_id_payload,
+        "prompt": batch_prompts[0],
+        "batch_size": len(batch_prompts),
+    })
+    data_payload_list = build_payload_data(fields)
+    if cancel_token is not None:
+        cancel_token.check()
 
     # Submit job to queue
-    queue_join_endpoint = f"{FORGE_API_URL.rstrip('/')}/queue/join"
+    queue_join_endpoint = f"{forge_api_url.rstrip('/')}/queue/join"
     queue_join_payload = {
         "data": data_payload_list,
         "event_data": None,
@@ -127,22 +307,48 @@ def generate_image(prompt: str) -> str | None:
         "session_hash": session_hash_payload
     }
 
+    render = {"started": False, "stream": None}
+
+    def cancel_render(reason):
+        # The interrupt stops whatever Forge is sampling, so only send it while that is this batch
+        if render["started"]:
+            threading.Thread(target=_interrupt_render, args=(forge_api_url,), name="ForgeInterruptThread", daemon=True).start()
+        if render["stream"] is not None:
+            metrics.upstream_cancels_total.inc(target="forge_stream")
+            close_stream(render["stream"])
+
+    unregister = None
     try:
         response_join = requests.post(queue_join_endpoint, json=queue_join_payload, timeout=30)
         response_join.raise_for_status()
+        joined_at = time.perf_counter()
+        joined_ns = time.time_ns()
+        started_at = None
+        started_ns = None
         
         # Connect to SSE stream for results
-        queue_data_endpoint = f"{FORGE_API_URL.rstrip('/')}/queue/data"
+        queue_data_endpoint = f"{forge_api_url.rstrip('/')}/queue/data"
         queue_data_params = {"session_hash": session_hash_payload}
         
-        time.sleep(1)
-        image_path_from_sse = None
+        if cancel_token is not None:
+            unregister = cancel_token.on_cancel(cancel_render)
+            # Still connect when cancelled meanwhile: gradio only drops a queued job whose stream closes
+            cancel_token.wait(1)
+        else:
+            time.sleep(1)
+        gallery_items = None
 
         try:
-            response_sse = requests.get(queue_data_endpoint, params=queue_data_params, timeout=180, stream=True)
+            response_sse = requests.get(queue_data_endpoint, params=queue_data_params,
+                                        timeout=cancel_token.remaining(180) if cancel_token else 180, stream=True)
+            render["stream"] = response_sse
+            if cancel_token is not None and cancel_token.cancelled:
+                cancel_render(cancel_token.reason)
             response_sse.raise_for_status()
 
             for line in response_sse.iter_lines(decode_unicode=True):
+                if cancel_token is not None:
+                    cancel_token.check()
                 if not line or not line.startswith('data: '):
                     continue
                     
@@ -150,77 +356,83 @@ def generate_image(prompt: str) -> str | None:
                 try:
                     event_data = orjson.loads(event_data_str)
                     msg_type = event_data.get("msg")
+                    if msg_type == "process_starts" and started_at is None:
+                        started_at = time.perf_counter()
+                        started_ns = time.time_ns()
+                        render["started"] = True
+                        metrics.observe_stage("forge_queue", started_at - joined_at)
+                        for span in spans:
+                            tracing.record_span("forge.queue", span, joined_ns, started_ns)
+                    if msg_type != "process_completed":
+                        continue
 
-                    if msg_type == "process_completed":
-                        output_data = event_data.get("output", {}).get("data")
-                        if output_data and isinstance(output_data, list) and output_data:
-                            image_results_container = output_data[0]
-                            if isinstance(image_results_container, list) and image_results_container:
-                                first_image_data_item = image_results_container[0]
-
-                                image_url_to_download = None
-                                if isinstance(first_image_data_item, dict):
-                                    image_dict = first_image_data_item.get('image')
-                                    if image_dict and isinstance(image_dict, dict):
-                                        image_url_to_download = image_dict.get('url')
-
-                                # Handle direct base64 fallback
-                                elif isinstance(first_image_data_item, str) and first_image_data_item.startswith('data:image/png;base64,'):
-                                    img_b64_str = first_image_data_item.split(',', 1)[1]
-                                    try:
-                                        image_data_bytes = base64.b64decode(img_b64_str)
-                                        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png", dir=TEMP_IMAGE_DIR)
-                                        temp_file.write(image_data_bytes)
-                                        temp_file.close()
-                                        response_sse.close()
-                                        image_path_from_sse = temp_file.name
-                                        break
-                                    except Exception as e:
-                                        print(f"Error decoding base64: {e}")
-
-                                # Download image from URL
-                                if image_url_to_download and isinstance(image_url_to_download, str) and image_url_to_download.startswith('http'):
-                                    try:
-                                        if image_url_to_download.startswith('/file='):
-                                            absolute_image_url = f"{FORGE_API_URL.rstrip('/')}{image_url_to_download}"
-                                        else:
-                                            absolute_image_url = image_url_to_download
-
-                                        image_response = requests.get(absolute_image_url, timeout=30)
-                                        image_response.raise_for_status()
-                                        
-                                        image_data_bytes = image_response.content
-                                        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png", dir=TEMP_IMAGE_DIR)
-                                        temp_file.write(image_data_bytes)
-                                        temp_file.close()
-                                        response_sse.close()
-                                        image_path_from_sse = temp_file.name
-                                        break
-                                    except Exception as e:
-                                        print(f"Error downloading image: {e}")
-
-                        if image_path_from_sse:
-                            break
-                            
+                    render["started"] = False
+                    completed_at = time.perf_counter()
+                    completed_ns = time.time_ns()
+                    if started_at is None:
+                        metrics.observe_stage("forge_queue", completed_at - joined_at)
+                        for span in spans:
+                            tracing.record_span("forge.queue", span, joined_ns, completed_ns)
+                    else:
+                        metrics.observe_stage("forge_sampling", completed_at - started_at)
+                        for span in spans:
+                            tracing.record_span("forge.sampling", span, started_ns, completed_ns)
+
+                    output_data = event_data.get("output", {}).get("data")
+                    if output_data and isinstance(output_data, list):
+                        image_results_container = output_data[0]
+                        if isinstance(image_results_container, list) and image_results_container:
+                            gallery_items = image_results_container
+                    break
                 except Exception as e:
                     print(f"Error parsing SSE event: {e}")
+                    metrics.record_error("forge_sse", e)
                     continue
 
-            if image_path_from_sse:
-                return image_path_from_sse
-
         except requests.exceptions.RequestException as e:
-            print(f"Error during SSE connection: {e}")
+            if cancel_token is None or not cancel_token.cancelled:
+                print(f"Error during SSE connection: {e}")
+                metrics.record_error("forge_sse", e)
+        if cancel_token is not None:
+            # A stream closed on cancel can end without an error
+            cancel_token.check()
 
+    except Cancelled:
+        raise
     except requests.exceptions.RequestException as e:
         print(f"Error during API call: {e}")
-        return None
+        metrics.record_error("forge_queue", e)
+        return [None] * len(prompts)
     except Exception as e:
         print(f"Unexpected error: {e}")
-        return None
-    
-    print("Image generation failed")
-    return None
+        metrics.record_error("forge_queue", e)
+        return [None] * len(prompts)
+    finally:
+        if unregister:
+            unregister()
+        if render["stream"] is not None:
+            render["stream"].close()
+
+    if not gallery_items:
+        print("Image generation failed")
+        metrics.record_error("forge_queue", "no_images")
+        return [None] * len(prompts)
+
+    # With batch size > 1 Forge prepends a grid image to the gallery when "return grid" is on
+    if len(batch_prompts) > 1 and len(gallery_items) == len(batch_prompts) + 1:
+        gallery_items = gallery_items[1:]
+
+    download_started_ns = time.time_ns()
+    with metrics.time_stage("download"):
+        image_paths = [_fetch_gallery_item(item, forge_api_url) for item in gallery_items[:len(batch_prompts)]]
+    download_ended_ns = time.time_ns()
+    for span in spans:
+        tracing.record_span("forge.download", span, download_started_ns, download_ended_ns, **{"forge.images": len(image_paths)})
+    image_paths.extend([None] * (len(batch_prompts) - len(image_paths)))
+    return image_paths
+
+def generate_image(prompt: str, params: dict | None = None, trace=None, settings=None, cancel_token=None) -> str | None:
+    return generate_images([prompt], params, [trace], settings, cancel_token)[0]
 
 def cleanup_image(file_path: str):
     """Deletes the temporary image file."""
@@ -1,6 +1,13 @@
 import requests
 import json
+import threading
+import time
 from . import config as app_config
+from . import metrics
+from . import tracing
+from .readiness import tracker as readiness
+from .memory import create_memory
+from .cancellation import Cancelled, close_stream
 
 class LLMClient:
     DEFAULT_SYSTEM_PROMPT = "roleplay: You are a roleplay assistant. you are a human woman. Invent a completely new and unique female persona for each conversation, ensuring the name and backstory are different each time. Maintain the same persona throughout our conversation unless you specifically ask me to create a new one. Your name is not Olivia, Sophia, or Chloe.You have a randomly generated appearance. You are humorous. Keep your responses concise and to the point, ideally in 3-4 sentences unless more detail is specifically requested. do not use asterisks in your responses. speak only from your perspective."
@@ -9,15 +16,45 @@ class LLMClient:
     SUMMARY_TARGET_WORD_COUNT = 1000 # Target word count for conversation summaries
     IMAGE_PROMPT_GENERATION_INSTRUCTION_PREFIX = "Based on the following user request, generate a detailed and effective prompt suitable for an AI image generator."
 
-    def __init__(self, api_url):
+    def __init__(self, api_url, detect_in_background=True):
+        self.conversations = {}
+        self.model_ready = threading.Event()
+        self.memory = create_memory(self._embed)  # None unless MEMORY_ENABLED
+        self._configure(api_url, detect_in_background)
+
+    def _configure(self, api_url, detect_in_background):
         self.base_api_url = api_url.rstrip('/')
         self.chat_endpoint = f"{self.base_api_url}/v1/chat/completions"
         self.models_endpoint = f"{self.base_api_url}/v1/models"
         self.model_identifier = None
-        self.conversations = {}
-        self._detect_model_identifier()
+        self.model_ready.clear()
+        if detect_in_background:
+            # Requests that need the model wait on model_ready instead of blocking startup
+            threading.Thread(target=self._detect_model_identifier, name="ModelDetectionThread", daemon=True).start()
+        else:
+            self._detect_model_identifier()
+
+    def reconfigure(self, api_url):
+        """Points the client at a new server after a config reload; conversations are kept."""
+        print(f"LLM API URL set to {api_url}; detecting model again.", flush=True)
+        self._configure(api_url, detect_in_background=True)
+
+    def wait_until_ready(self, timeout=None):
+        """Blocks until model detection has finished; returns True if a model identifier is known."""
+        self.model_ready.wait(timeout)
+        return bool(self.model_identifier)
 
     def _detect_model_identifier(self):
+        try:
+            self._query_model_identifier()
+        finally:
+            if self.model_identifier:
+                readiness.ready("llm_model", self.model_identifier)
+            else:
+                readiness.failed("llm_model", "Could not determine model identifier")
+            self.model_ready.set()
+
+    def _query_model_identifier(self):
         try:
             response = requests.get(self.models_endpoint, timeout=10)
             response.raise_for_status()
@@ -30,14 +67,102 @@ class LLMClient:
             else:
                 raise ValueError("No model data found")
 
-        except (requests.exceptions.RequestException, ValueError, KeyError, json.JSONDecodeError):
+        except (requests.exceptions.RequestException, ValueError, KeyError, json.JSONDecodeError) as e:
+            metrics.record_error("model_detection", e)
             if not self.model_identifier:
-                fallback_model = app_config.MODEL_IDENTIFIER
+                fallback_model = app_config.current().MODEL_IDENTIFIER
                 if fallback_model:
                     self.model_identifier = fallback_model
                 else:
                     print("Error: Could not determine model identifier.")
 
+    def _embed(self, texts):
+        """Returns one embedding per text from the server's /v1/embeddings endpoint."""
+        payload = {"model": app_config.current().EMBEDDING_MODEL, "input": texts}
+        response = requests.post(f"{self.base_api_url}/v1/embeddings", json=payload, timeout=30)
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    def _post_chat(self, chat_endpoint, payload, cancel_token=None, timeout=None, on_first_token=None):
+        """
+        Streams a chat completion and returns its text. Cancelling `cancel_token` closes the stream,
+        which makes the server stop generating, and raises Cancelled; its deadline bounds the timeout.
+        on_first_token(seconds) is called when the first content arrives.
+        """
+        if cancel_token is not None:
+            cancel_token.check()
+            timeout = cancel_token.remaining(timeout)
+        started = time.monotonic()
+        response = requests.post(chat_endpoint, headers={"Content-Type": "application/json"},
+                                 json=dict(payload, stream=True), timeout=timeout, stream=True)
+        unregister = cancel_token.on_cancel(lambda reason: close_stream(response)) if cancel_token else None
+        try:
+            response.raise_for_status()
+            parts = []
+            for line in response.iter_lines(decode_unicode=True):
+                if cancel_token is not None:
+                    cancel_token.check()
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data.strip() == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices")
+                if choices:
+                    content = (choices[0].get("delta") or {}).get("content") or ""
+                    if content and on_first_token is not None and not any(parts):
+                        on_first_token(time.monotonic() - started)
+                    parts.append(content)
+            if cancel_token is not None:
+                # A stream closed on cancel can end like a complete one
+                cancel_token.check()
+            return "".join(parts)
+        except Exception as e:
+            if cancel_token is not None and cancel_token.cancelled:
+                metrics.upstream_cancels_total.inc(target="llm_stream")
+                raise Cancelled(cancel_token.reason) from e
+            raise
+        finally:
+            if unregister:
+                unregister()
+            response.close()
+
+    def _build_messages(self, user_id, prompt, trace=None, memory_query=None):
+        """
+        Full history plus the new prompt, or with long-term memory enabled: the system messages,
+        the most relevant past turns and only the most recent messages, so prompt size stays flat.
+        Past turns are recalled by similarity to `memory_query` (default: the prompt). Without a
+        recall, e.g. while the embeddings endpoint is down, the full (summarized) history is sent.
+        """
+        history = self.conversations[user_id]
+        full_prompt = history + [{"role": "user", "content": prompt}]
+        if not self.memory:
+            return full_prompt
+
+        settings = app_config.current()
+        system_messages = [msg for msg in history if msg["role"] == "system"]
+        dialogue = [msg for msg in history if msg["role"] != "system"]
+        recent = dialogue[-settings.MEMORY_RECENT_MESSAGES:] if settings.MEMORY_RECENT_MESSAGES > 0 else []
+        snippets = []
+        if memory_query is None and prompt.startswith(LLMClient.IMAGE_PROMPT_GENERATION_INSTRUCTION_PREFIX):
+            # The fixed instruction text says nothing about which past turns matter
+            return full_prompt
+        with tracing.start_span("llm.memory_recall", trace) as span:
+            try:
+                with metrics.time_stage("memory_recall"):
+                    snippets = self.memory.recall(user_id, memory_query or prompt, settings.MEMORY_TOP_K, settings.MEMORY_MIN_SCORE,
+                                                  exclude_recent=len(recent) // 2)
+                span.set_attribute("memory.snippets", len(snippets))
+            except Exception as e:
+                # Answer from the whole history rather than failing the message or losing context
+                metrics.record_error("memory", e)
+                span.record_error(e)
+                return full_prompt
+        if snippets:
+            system_messages.append({"role": "system", "content": "Relevant earlier parts of this conversation:\n" + "\n---\n".join(snippets)})
+        return system_messages + recent + [{"role": "user", "content": prompt}]
+
     def _count_tokens_in_conversation(self, conversation_history):
         total_tokens = 0
         for message in conversation_history:
@@ -54,7 +179,9 @@ class LLMClient:
                 text_parts.append(f"{msg['role']}: {msg['content']}")
         return "\n".join(text_parts)
 
-    def _summarize_conversation_if_needed(self, user_id):
+    def _summarize_conversation_if_needed(self, user_id, trace=None):
+        # Not bound to the message's deadline or cancellation: an interrupted summary would be
+        # redone, and time out again, on every later message of the conversation
         if user_id not in self.conversations or not self.conversations[user_id]:
             return
 
@@ -122,86 +249,140 @@ class LLMClient:
                 "max_tokens": summary_max_tokens,
                 "temperature": 0.4,
             }
-            headers = {"Content-Type": "application/json"}
 
+            span = tracing.start_span("llm.summarize", trace, **{"llm.model": self.model_identifier, "llm.history_words": current_token_count})
             try:
-                response = requests.post(self.chat_endpoint, headers=headers, json=summary_payload, timeout=600)
-                response.raise_for_status()
-                response_data = response.json()
-
-                if response_data.get('choices') and len(response_data['choices']) > 0:
-                    message = response_data['choices'][0].get('message')
-                    if message and message.get('content'):
-                        summary_text = message['content'].strip()
-                        persona_prompt_content = LLMClient.DEFAULT_SYSTEM_PROMPT
-                        
-                        self.conversations[user_id] = [] 
-                        self.add_system_message(user_id, persona_prompt_content) 
-                        
-                        self.conversations[user_id].append({
-                            "role": "system", 
-                            "content": f"The following is a summary of the previous part of our conversation: {summary_text}"
-                        })
-                        return
-            except Exception:
-                pass
-
-    def send_request(self, prompt, user_id=None):
-        if not self.model_identifier:
+                with metrics.time_stage("summarization"):
+                    summary_text = self._post_chat(self.chat_endpoint, summary_payload, timeout=600).strip()
+
+                if summary_text:
+                    persona_prompt_content = LLMClient.DEFAULT_SYSTEM_PROMPT
+                    
+                    self.conversations[user_id] = [] 
+                    self.add_system_message(user_id, persona_prompt_content) 
+                    
+                    self.conversations[user_id].append({
+                        "role": "system", 
+                        "content": f"The following is a summary of the previous part of our conversation: {summary_text}"
+                    })
+                    return
+            except Exception as e:
+                metrics.record_error("summarization", e)
+                span.record_error(e)
+            finally:
+                span.end()
+
+    def send_request(self, prompt, user_id=None, trace=None, cancel_token=None, prewarmed=False, memory_query=None):
+        """
+        Sends the prompt with the user's history and returns the reply. `cancel_token` carries the
+        message's deadline and cancellation; the history is only updated if it is still valid then.
+        `prewarmed` only labels the time-to-first-token metric. `memory_query` is what long-term memory
+        recall searches with when the prompt wraps the user's words, e.g. an image prompt instruction.
+        """
+        if not self.wait_until_ready(app_config.current().LLM_READY_TIMEOUT_S):
              raise RuntimeError("LLMClient cannot send request: Model identifier is not set.")
+        # A config reload may repoint the client; this request stays on the server it started with
+        chat_endpoint, model_identifier = self.chat_endpoint, self.model_identifier
 
         if user_id not in self.conversations:
             self.conversations[user_id] = []
             self.add_system_message(user_id, LLMClient.DEFAULT_SYSTEM_PROMPT)
         
-        self._summarize_conversation_if_needed(user_id)
+        # A summary is kept even if the message is cancelled or runs out of time meanwhile
+        self._summarize_conversation_if_needed(user_id, trace)
 
-        messages = self.conversations[user_id].copy()
-        messages.append({"role": "user", "content": prompt})
+        messages = self._build_messages(user_id, prompt, trace, memory_query)
 
         payload = {
-            "model": self.model_identifier,
+            "model": model_identifier,
             "messages": messages,
             "max_tokens": 300, 
             "temperature": 0.8,
             "repetition_penalty": 1.05,
             "min_p": 0.025
         }
-        headers = {"Content-Type": "application/json"}
+
+        span = tracing.start_span("llm.chat_completion", trace, **{"llm.model": model_identifier, "llm.messages": len(messages),
+                                                                     "llm.prewarmed": prewarmed})
+
+        def first_token(seconds):
+            metrics.first_token_seconds.observe(seconds, prewarmed="true" if prewarmed else "false")
+            span.set_attribute("llm.first_token_seconds", round(seconds, 4))
 
         try:
-            response = requests.post(self.chat_endpoint, headers=headers, json=payload)
-            response.raise_for_status()
-            response_data = response.json()
-
-            if response_data.get('choices') and len(response_data['choices']) > 0:
-                message = response_data['choices'][0].get('message')
-                if message and message.get('content'):
-                    assistant_response = message['content'].strip()
-
-                    # Check if this is an image prompt generation call
-                    is_image_prompt_gen_call = prompt.startswith(LLMClient.IMAGE_PROMPT_GENERATION_INSTRUCTION_PREFIX)
-
-                    if not is_image_prompt_gen_call:
-                        if not self.conversations[user_id] or \
-                           self.conversations[user_id][-1].get("role") != "user" or \
-                           self.conversations[user_id][-1].get("content") != prompt:
-                            self.conversations[user_id].append({"role": "user", "content": prompt})
-                        
-                        self.conversations[user_id].append({"role": "assistant", "content": assistant_response})
+            with metrics.time_stage("llm_request"):
+                assistant_response = self._post_chat(chat_endpoint, payload, cancel_token, on_first_token=first_token).strip()
+
+            if assistant_response:
+                # Check if this is an image prompt generation call
+                is_image_prompt_gen_call = prompt.startswith(LLMClient.IMAGE_PROMPT_GENERATION_INSTRUCTION_PREFIX)
+
+                if not is_image_prompt_gen_call:
+                    if cancel_token is not None and not cancel_token.commit():
+                        raise Cancelled(cancel_token.reason)
+                    if not self.conversations[user_id] or \
+                       self.conversations[user_id][-1].get("role") != "user" or \
+                       self.conversations[user_id][-1].get("content") != prompt:
+                        self.conversations[user_id].append({"role": "user", "content": prompt})
                     
-                    return assistant_response
-                else:
-                    raise Exception("Error: Response format unexpected. 'message' or 'content' missing.")
+                    self.conversations[user_id].append({"role": "assistant", "content": assistant_response})
+                    if self.memory:
+                        self.memory.add_turn(user_id, prompt, assistant_response)
+                
+                return assistant_response
             else:
-                raise Exception("Error: Response format unexpected. 'choices' array missing or empty.")
+                raise Exception("Error: Response format unexpected. The streamed response had no content.")
 
+        except Cancelled as e:
+            span.record_error(e)
+            raise
         except requests.exceptions.RequestException as e:
+            metrics.record_error("llm_request", e)
+            span.record_error(e)
             raise Exception(f"Network error sending request to LLM: {e}")
         except Exception as e:
+            metrics.record_error("llm_request", e)
+            span.record_error(e)
             raise Exception(f"Error processing LLM response: {e}")
+        finally:
+            span.end()
     
+    def prewarm(self, user_id, min_words=0):
+        """
+        Sends the user's history with max_tokens=1 so the LLM server caches the prompt prefix the next
+        send_request() starts with. Returns False without sending anything when needs_prewarm() is False.
+        """
+        request = self._prewarm_request(user_id, min_words)
+        if request is None:
+            return False
+        chat_endpoint, payload = request
+        with metrics.time_stage("prewarm"):
+            self._post_chat(chat_endpoint, payload, timeout=120)
+        return True
+
+    def needs_prewarm(self, user_id, min_words=0):
+        """
+        Whether prewarm() would send anything. It wouldn't for a short or new history, one about to be
+        summarized, or while long-term memory is enabled (its prompts depend on the message that hasn't
+        arrived yet).
+        """
+        return self._prewarm_request(user_id, min_words) is not None
+
+    def _prewarm_request(self, user_id, min_words):
+        history = list(self.conversations.get(user_id) or [])
+        if self.memory or not any(message.get("role") != "system" for message in history):
+            return None
+        words = self._count_tokens_in_conversation(history)
+        if words < min_words or words > LLMClient.SUMMARY_THRESHOLD_TOKENS:
+            return None
+        chat_endpoint, model_identifier = self.chat_endpoint, self.model_identifier
+        if not model_identifier:
+            return None
+        return chat_endpoint, {"model": model_identifier, "messages": history, "max_tokens": 1, "temperature": 0.8}
+
     def reset_conversation(self, user_id):
+        if self.memory:
+            self.memory.forget(user_id)
         if user_id in self.conversations:
             self.conversations[user_id] = []
             self.add_system_message(user_id, LLMClient.DEFAULT_SYSTEM_PROMPT)
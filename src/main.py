@@ -1,10 +1,15 @@
 import time
+import threading
 import signal as signal_module # Renamed to avoid potential conflicts
 
 # Import necessary components from your project
-from .config import API_URL, MODEL_IDENTIFIER
+from . import config
+from .config import API_URL, MODEL_IDENTIFIER, METRICS_HOST, METRICS_PORT, PROFILE_SIGNAL_MESSAGES, SIGNAL_ACCOUNTS, WORKER_PROCESSES
+from .metrics import start_metrics_server, stop_metrics_server
 from .llm_client import LLMClient
-from .signal_handler import start_listener_thread, stop_listener # 'running' flag is managed within signal_handler
+from .image_generator import check_forge_reachable
+from .readiness import tracker as readiness
+from .signal_handler import start_listener_thread, stop_listener, reload_config, start_profiling # 'running' flag is managed within signal_handler
 
 # Global variable to hold the LLM client instance
 llm_client = None
@@ -13,18 +18,39 @@ def shutdown_handler(signum, frame):
     """Handles shutdown signals gracefully."""
     print(f"\nReceived signal {signum}. Initiating shutdown...")
     stop_listener() # This will now also handle terminating signal-cli
+    stop_metrics_server()
     # The main loop (if any) or script will exit after this
 
+def profile_handler(signum, frame):
+    """Dumps all thread stacks and profiles the next few messages (kill -USR1 <pid>), in worker processes too."""
+    stacks_path = start_profiling(PROFILE_SIGNAL_MESSAGES)
+    print(f"\nReceived signal {signum}. Profiling the next {PROFILE_SIGNAL_MESSAGES} messages; thread stacks written to {stacks_path}", flush=True)
+
+def reload_handler(signum, frame):
+    """Reloads settings in place (kill -HUP <pid>); signal-cli, sockets and conversations are kept."""
+    print(f"\nReceived signal {signum}. Reloading configuration...", flush=True)
+    reload_config()
+
 if __name__ == '__main__':
     print("Starting Signal LMStudio Backend...")
+    config.report()
+    # Model detection, the Forge check and signal-cli startup run concurrently; each reports its own readiness
+    readiness.begin("signal_cli", *(f"signal_cli:{account}" for account, _ in SIGNAL_ACCOUNTS[1:]), "llm_model", "forge")
 
-    # Initialize the LLM Client
+    # Serve latency histograms and error counters for Prometheus
+    if METRICS_PORT and start_metrics_server(METRICS_HOST, METRICS_PORT):
+        print(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    # Initialize the LLM Client; the model is detected in the background and chat requests wait for it.
+    # With WORKER_PROCESSES each worker process creates its own instead.
     try:
-        llm_client = LLMClient(API_URL) # Corrected: Removed MODEL_IDENTIFIER
+        llm_client = LLMClient(API_URL) if not WORKER_PROCESSES else None # Corrected: Removed MODEL_IDENTIFIER
     except Exception as e:
         print(f"Failed to initialize LLM Client: {e}")
         exit(1) # Exit if LLM client fails
 
+    threading.Thread(target=check_forge_reachable, name="ForgeCheckThread", daemon=True).start()
+
     # Start the Signal listener thread (which also starts signal-cli)
     listener_thread = start_listener_thread(llm_client)
     if not listener_thread or not listener_thread.is_alive():
@@ -36,8 +62,12 @@ if __name__ == '__main__':
     # Register signal handlers for graceful shutdown
     signal_module.signal(signal_module.SIGINT, shutdown_handler)  # Handle Ctrl+C
     signal_module.signal(signal_module.SIGTERM, shutdown_handler) # Handle termination signals
+    if hasattr(signal_module, "SIGUSR1"): # Not available on Windows
+        signal_module.signal(signal_module.SIGUSR1, profile_handler)
+    if hasattr(signal_module, "SIGHUP"):
+        signal_module.signal(signal_module.SIGHUP, reload_handler)
 
-    print("Application started. Signal listener is running.")
+    print("Application started. Signal listener is running; messages are handled as soon as signal-cli is ready.")
     print("Press Ctrl+C to stop.")
 
     # Keep the main thread alive until shutdown is triggered
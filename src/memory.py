@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency: long-term memory is unavailable without it
+    np = None
+
+from . import metrics
+from .config import MEMORY_ENABLED, MEMORY_DIR, MEMORY_SAVE_INTERVAL_S, MEMORY_MAX_PENDING_TURNS
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _write_index(path, vectors, texts):
+    """Writes an index atomically as .npz; texts are stored as UTF-8 JSON to avoid pickling."""
+    tmp_path = f"{path}.tmp"
+    encoded_texts = np.frombuffer(json.dumps(texts).encode("utf-8"), dtype=np.uint8)
+    with open(tmp_path, "wb") as f:
+        np.savez(f, vectors=vectors, texts=encoded_texts)
+    os.replace(tmp_path, path)
+
+
+class VectorIndex:
+    """
+    Embeddings of one conversation's past turns in a contiguous float32 matrix.
+
+    Rows are L2-normalized on insert so cosine similarity is a single matrix product; storage
+    grows by doubling so appends are amortized O(1). search() scores a batch of queries at once
+    and selects the top k with argpartition instead of a full sort.
+    """
+
+    def __init__(self, dim, capacity=256):
+        self.dim = dim
+        self.texts = []
+        self._vectors = np.empty((max(1, capacity), dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def vectors(self):
+        return self._vectors[:len(self.texts)]
+
+    def add(self, vectors, texts):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(texts)} texts")
+        count = len(self.texts)
+        needed = count + len(vectors)
+        if needed > len(self._vectors):
+            grown = np.empty((max(needed, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:count] = self._vectors[:count]
+            self._vectors = grown
+        self._vectors[count:needed] = vectors
+        self.texts.extend(texts)
+
+    def search(self, queries, k, limit=None):
+        """
+        Returns, for each query, up to k (cosine score, row) pairs with the best score first.
+        Only the first `limit` rows are searched when given.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        rows = len(self.texts) if limit is None else max(0, min(limit, len(self.texts)))
+        if rows == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self._vectors[:rows].T
+        k = min(k, rows)
+        if k < rows:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(rows), (len(queries), rows))
+        results = []
+        for row_scores, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row_scores[candidates], kind="stable")]
+            results.append([(float(row_scores[i]), int(i)) for i in ordered])
+        return results
+
+    def save(self, path):
+        _write_index(path, self.vectors, self.texts)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            texts = json.loads(data["texts"].tobytes().decode("utf-8"))
+        if len(vectors) != len(texts):
+            raise ValueError(f"{path} holds {len(vectors)} vectors for {len(texts)} texts")
+        index = cls(vectors.shape[1], capacity=max(256, len(texts)))
+        # Saved rows are already normalized
+        index._vectors[:len(texts)] = vectors
+        index.texts = texts
+        return index
+
+
+class ConversationMemory:
+    """
+    Long-term memory for LLMClient: one VectorIndex per conversation, loaded lazily from `directory`.
+
+    Finished turns are queued and embedded together with the next query in a single embeddings
+    request, so each chat message costs one extra round trip. Dirty indexes are written every
+    save_interval_s by a background thread (see start()) and on save(), never during a recall.
+    While embedding fails, at most max_pending_turns turns per conversation stay queued; older
+    ones are dropped and counted.
+    """
+
+    def __init__(self, embed, directory=MEMORY_DIR, save_interval_s=MEMORY_SAVE_INTERVAL_S,
+                 max_pending_turns=MEMORY_MAX_PENDING_TURNS):
+        self.embed = embed  # callable(list of texts) -> list of vectors, in order
+        self.directory = directory
+        self.save_interval_s = save_interval_s
+        self.max_pending_turns = max(1, max_pending_turns)
+        self.stats = {"recalls": 0, "recalled_snippets": 0, "embedded_turns": 0, "dropped_turns": 0}
+        self._indexes = {}
+        self._pending = {}  # user_id -> turns not embedded yet
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop_saving = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the thread that periodically writes changed indexes to `directory`."""
+        if not self.directory or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_saving.clear()
+        self._thread = threading.Thread(target=self._run, name="MemorySaveThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the save thread and writes whatever changed since its last save."""
+        self._stop_saving.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=30)
+        self._thread = None
+        self.save()
+
+    def _run(self):
+        while not self._stop_saving.wait(max(1, self.save_interval_s)):
+            self.save()
+
+    def _path(self, user_id):
+        name = hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def _index(self, user_id, dim=None):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None and self.directory and os.path.exists(self._path(user_id)):
+                try:
+                    index = self._indexes[user_id] = VectorIndex.load(self._path(user_id))
+                except (OSError, ValueError, KeyError) as e:
+                    metrics.record_error("memory", e)
+                    print(f"Warning: could not load memory index for {user_id}: {e}", flush=True)
+            if index is not None and dim is not None and index.dim != dim:
+                # EMBEDDING_MODEL changed; old vectors can't be compared with new ones
+                print(f"Warning: discarding memory index for {user_id} built with {index.dim}-dim embeddings", flush=True)
+                index = None
+            if index is None and dim is not None:
+                index = self._indexes[user_id] = VectorIndex(dim)
+            return index
+
+    def add_turn(self, user_id, user_text, assistant_text):
+        """Queues a finished exchange; it is embedded with the conversation's next query."""
+        with self._lock:
+            self._queue_turns(user_id, [f"User: {user_text}\nAssistant: {assistant_text}"])
+
+    def _queue_turns(self, user_id, turns):
+        # Caller holds self._lock
+        pending = self._pending.get(user_id, []) + turns
+        dropped = len(pending) - self.max_pending_turns
+        if dropped > 0:
+            self.stats["dropped_turns"] += dropped
+            pending = pending[dropped:]
+        self._pending[user_id] = pending
+
+    def recall(self, user_id, query, k, min_score=0.0, exclude_recent=0):
+        """
+        Returns the texts of up to k past turns most similar to `query`, best first. The newest
+        `exclude_recent` turns are skipped because they are already sent verbatim.
+        """
+        with self._lock:
+            pending = self._pending.pop(user_id, [])
+        try:
+            vectors = np.asarray(self.embed(pending + [query]), dtype=np.float32)
+        except Exception:
+            with self._lock:
+                # Turns queued meanwhile are newer than the ones taken for this attempt
+                newer = self._pending.pop(user_id, [])
+                self._queue_turns(user_id, pending + newer)
+            raise
+
+        index = self._index(user_id, dim=vectors.shape[1])
+        with self._lock:
+            if pending:
+                index.add(vectors[:-1], pending)
+                self._dirty.add(user_id)
+                self.stats["embedded_turns"] += len(pending)
+            limit = len(index) - exclude_recent
+        # Rows below `limit` are never modified, so searching them needs no lock
+        hits = index.search(vectors[-1], k, limit=limit)[0]
+        snippets = [index.texts[row] for score, row in hits if score >= min_score]
+        with self._lock:
+            self.stats["recalls"] += 1
+            self.stats["recalled_snippets"] += len(snippets)
+        return snippets
+
+    def forget(self, user_id):
+        """Drops a conversation's memory, including its file on disk."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            self._pending.pop(user_id, None)
+            self._dirty.discard(user_id)
+        if self.directory:
+            try:
+                os.remove(self._path(user_id))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                metrics.record_error("memory", e)
+
+    def save(self):
+        """Writes every index changed since the last save."""
+        if not self.directory:
+            return
+        with self._lock:
+            # Copy under the lock so concurrent appends can't tear the snapshot being written
+            dirty = [(user_id, self._indexes[user_id].vectors.copy(), list(self._indexes[user_id].texts))
+                     for user_id in self._dirty if user_id in self._indexes]
+            self._dirty.clear()
+        if not dirty:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for user_id, vectors, texts in dirty:
+                _write_index(self._path(user_id), vectors, texts)
+        except OSError as e:
+            metrics.record_error("memory", e)
+            print(f"Warning: could not save memory indexes to {self.directory}: {e}", flush=True)
+
+
+def create_memory(embed, enabled=MEMORY_ENABLED):
+    """Returns a ConversationMemory if long-term memory is enabled and numpy is installed, else None."""
+    if not enabled:
+        return None
+    if np is None:
+        print("Warning: MEMORY_ENABLED is set but numpy is not installed; long-term memory is disabled.", flush=True)
+        return None
+    memory = ConversationMemory(embed)
+    metrics.register_stats("memory", memory.stats)
+    return memory
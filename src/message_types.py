@@ -0,0 +1,24 @@
+from .image_generator import get_preset
+
+
+def split_preset(body, settings=None):
+    """Splits an image preset prefix off a message, e.g. "/fast xx a cat" -> ("fast", "xx a cat"); (None, body) without one."""
+    text = body.strip()
+    first_word, _, remainder = text.partition(" ")
+    if first_word.startswith("/") and get_preset(first_word[1:], settings) is not None:
+        return first_word[1:].lower(), remainder.strip()
+    return None, text
+
+
+def message_kind(body, settings=None):
+    """The kind of work a message asks for: chat, image_llm, image_direct, reset, cancel or command."""
+    _, text = split_preset(body, settings)
+    first_word = text.partition(" ")[0]
+    lower = text.lower()
+    if lower in ("/cancel", "/reset"):
+        return lower[1:]
+    if not text or lower in ("/presets", "/reload") or first_word.lower() == "/profile":
+        return "command"
+    if lower.startswith("xx"):
+        return "image_direct"
+    return "image_llm" if ";" in lower else "chat"
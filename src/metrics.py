@@ -0,0 +1,267 @@
+import contextlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "signal_backend"
+
+# Seconds; covers socket hops (ms) up to long summarizations and hires renders (minutes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []
+_stats_sources = []
+_remote_snapshots = {}  # source -> latest snapshot() from another process
+_registry_lock = threading.Lock()
+_metrics_server = None
+_metrics_server_thread = None
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, remote=()):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        values = self.values()
+        for other in remote:
+            for key, value in other.items():
+                values[key] = values.get(key, 0) + value
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes the wall time spent inside the with-block, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            return series[-1] if series else 0
+
+    def values(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def render(self, remote=()):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        values = self.values()
+        for other in remote:
+            for key, series in other.items():
+                # Bucket counts aren't cumulative until rendered, so series from other processes add element-wise
+                values[key] = [a + b for a, b in zip(values[key], series)] if key in values else list(series)
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+def register_stats(component, stats):
+    """Exports an existing `stats` dict of monotonically increasing counts as <component>_<key>_total."""
+    with _registry_lock:
+        _stats_sources.append((component, stats))
+
+
+def _stats_totals(stats_sources):
+    totals = {}
+    for component, stats in stats_sources:
+        merged = totals.setdefault(component, {})
+        for key, value in list(stats.items()):
+            merged[key] = merged.get(key, 0) + value
+    return totals
+
+
+def snapshot():
+    """Returns this process's metric values in a picklable form, for merge_remote() in another process."""
+    with _registry_lock:
+        metrics = list(_registry)
+        stats_sources = list(_stats_sources)
+    return {"metrics": {metric.name: metric.values() for metric in metrics}, "stats": _stats_totals(stats_sources)}
+
+
+def merge_remote(source, remote_snapshot):
+    """Adds another process's latest snapshot() to what render() reports, e.g. from worker processes."""
+    with _registry_lock:
+        _remote_snapshots[source] = remote_snapshot
+
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+        stats_sources = list(_stats_sources)
+        remote = list(_remote_snapshots.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render([snap["metrics"].get(metric.name, {}) for snap in remote]))
+    stats_sources.extend((component, stats) for snap in remote for component, stats in snap["stats"].items())
+    for component, stats in _stats_totals(stats_sources).items():
+        for key, value in sorted(stats.items()):
+            name = f"{METRIC_PREFIX}_{component}_{key}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics used across the backend ---
+stage_seconds = Histogram(
+    "message_stage_seconds",
+    "Time spent in each stage of handling a message.",
+    label_names=("stage",),
+)
+errors_total = Counter(
+    "errors_total",
+    "Errors by pipeline stage and exception type.",
+    label_names=("stage", "type"),
+)
+messages_total = Counter(
+    "messages_total",
+    "Messages handled, by message type.",
+    label_names=("kind",),
+)
+cancelled_total = Counter(
+    "cancelled_total",
+    "Messages whose work was cancelled, by message type, reason and whether it was queued or running.",
+    label_names=("kind", "reason", "state"),
+)
+reclaimed_seconds_total = Counter(
+    "reclaimed_seconds_total",
+    "Estimated LLM and Forge time freed by cancelling work, by message type.",
+    label_names=("kind",),
+)
+upstream_cancels_total = Counter(
+    "upstream_cancels_total",
+    "LLM and Forge streams closed and Forge renders interrupted for cancelled work.",
+    label_names=("target",),
+)
+
+first_token_seconds = Histogram(
+    "llm_first_token_seconds",
+    "Time from sending a chat request to its first streamed token, by whether the prompt cache was prewarmed.",
+    label_names=("prewarmed",),
+)
+
+
+def observe_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+
+
+def time_stage(stage):
+    """Context manager recording the duration of a pipeline stage."""
+    return stage_seconds.time(stage=stage)
+
+
+def record_error(stage, error):
+    """Counts an error; `error` is an exception instance or a short type string."""
+    error_type = error if isinstance(error, str) else type(error).__name__
+    errors_total.inc(stage=stage, type=error_type)
+
+
+# --- HTTP endpoint ---
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host, port):
+    """Serves /metrics on its own daemon thread. Returns False if the port can't be bound."""
+    global _metrics_server, _metrics_server_thread
+    if _metrics_server:
+        return True
+    try:
+        _metrics_server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    except OSError as e:
+        print(f"Warning: could not start metrics endpoint on {host}:{port}: {e}", flush=True)
+        return False
+    _metrics_server.daemon_threads = True
+    _metrics_server_thread = threading.Thread(target=_metrics_server.serve_forever, name="MetricsServerThread", daemon=True)
+    _metrics_server_thread.start()
+    return True
+
+
+def stop_metrics_server():
+    global _metrics_server, _metrics_server_thread
+    if _metrics_server:
+        _metrics_server.shutdown()
+        _metrics_server.server_close()
+        _metrics_server = None
+    if _metrics_server_thread and _metrics_server_thread.is_alive():
+        _metrics_server_thread.join(timeout=5)
+    _metrics_server_thread = None
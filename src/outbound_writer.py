@@ -0,0 +1,57 @@
+import collections
+
+import orjson
+
+
+class OutboundWriter:
+    """
+    Write buffer for one non-blocking signal-cli JSON-RPC socket.
+
+    Frames are serialized with orjson straight into a single bytearray, so frames queued while the
+    socket is busy go out together in one send() call. A partial send leaves the remainder
+    buffered, to be resumed with flush() once select() reports the socket writable again.
+    """
+
+    def __init__(self, sock, stats=None):
+        self.sock = sock
+        self.stats = stats if stats is not None else {"frames": 0, "writes": 0, "partial_writes": 0, "bytes": 0}
+        self._buffer = bytearray()
+        self._appended = 0  # bytes ever appended
+        self._written = 0  # bytes ever accepted by the socket
+        self._callbacks = collections.deque()  # (end offset, callable) of frames not fully written yet
+
+    @property
+    def pending(self):
+        """Bytes waiting to be written."""
+        return len(self._buffer)
+
+    def append(self, frame, on_written=None):
+        """Serializes a JSON-RPC frame into the buffer; on_written() is called once its last byte is sent."""
+        data = orjson.dumps(frame)
+        self._buffer += data
+        self._buffer += b"\n"
+        self._appended += len(data) + 1
+        self.stats["frames"] += 1
+        if on_written is not None:
+            self._callbacks.append((self._appended, on_written))
+
+    def flush(self):
+        """
+        Sends as much of the buffer as the socket accepts without blocking. Returns True once the
+        buffer is empty. Connection errors such as BrokenPipeError propagate to the caller.
+        """
+        if not self._buffer:
+            return True
+        try:
+            sent = self.sock.send(self._buffer)
+        except (BlockingIOError, InterruptedError):
+            return False
+        del self._buffer[:sent]
+        self._written += sent
+        self.stats["writes"] += 1
+        self.stats["bytes"] += sent
+        if self._buffer:
+            self.stats["partial_writes"] += 1
+        while self._callbacks and self._callbacks[0][0] <= self._written:
+            self._callbacks.popleft()[1]()
+        return not self._buffer
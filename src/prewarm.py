@@ -0,0 +1,139 @@
+import queue
+import threading
+import time
+
+from . import config as app_config
+from . import metrics
+
+WAIT_FOR_PREWARM_S = 30.0  # A request waits at most this long for its conversation's prewarm to finish
+
+
+class PromptPrewarmer:
+    """
+    Warms the LLM server's prompt cache when a user starts typing: prewarm(conversation) sends the
+    conversation so far with max_tokens=1, so the prefix is cached by the time the message arrives.
+
+    Prewarms run one at a time on a background thread. A conversation is skipped while it has
+    queued or running requests, within PREWARM_COOLDOWN_S of its last prewarm, while it is still
+    warm from a prewarm no request has used yet, or when `needed` says there is nothing worth
+    warming. Only then is a prewarm charged to the budget of PREWARM_BUDGET_PER_MIN prewarms
+    (shared by `budget_share` worker processes), so skipped ones don't use it up.
+    """
+
+    def __init__(self, prewarm, needed=None):
+        self.prewarm = prewarm  # callable(conversation) -> False if there was nothing worth warming
+        self.needed = needed  # callable(conversation) -> False if prewarm() would send nothing
+        self.budget_share = 1
+        self.stats = {"typing_events": 0, "prewarms": 0, "skipped_busy": 0, "skipped_cooldown": 0,
+                      "skipped_budget": 0, "skipped_small": 0, "skipped_warm": 0, "failed": 0}
+        self._last_prewarm = {}  # conversation -> monotonic time its last prewarm was started
+        self._warm = set()  # conversations prewarmed since their last request
+        self._in_flight = {}  # conversation -> Event set once its prewarm has finished
+        self._budget = None
+        self._budget_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="PromptPrewarmThread", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        self._thread = None
+        with self._lock:
+            # Prewarms still queued never run; don't keep requests waiting for them
+            for done in self._in_flight.values():
+                done.set()
+            self._in_flight.clear()
+
+    def submit(self, conversation, busy=False):
+        """Handles a typing-started event; returns True if a prewarm was queued."""
+        settings = app_config.current()
+        if not settings.PREWARM_ENABLED or self._thread is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self.stats["typing_events"] += 1
+            if busy or conversation in self._in_flight:
+                self.stats["skipped_busy"] += 1
+                return False
+            if now - self._last_prewarm.get(conversation, float("-inf")) < settings.PREWARM_COOLDOWN_S:
+                self.stats["skipped_cooldown"] += 1
+                return False
+            if conversation in self._warm:
+                # Nothing was sent since the last prewarm, so its prefix is what the server has cached
+                self.stats["skipped_warm"] += 1
+                return False
+        if self.needed is not None and not self.needed(conversation):
+            with self._lock:
+                self.stats["skipped_small"] += 1
+            return False
+        with self._lock:
+            if conversation in self._in_flight:
+                self.stats["skipped_busy"] += 1
+                return False
+            if not self._take_budget(now, settings.PREWARM_BUDGET_PER_MIN / max(1, self.budget_share)):
+                self.stats["skipped_budget"] += 1
+                return False
+            self._last_prewarm[conversation] = now
+            self._in_flight[conversation] = threading.Event()
+        self._queue.put(conversation)
+        return True
+
+    def before_request(self, conversation, timeout=WAIT_FOR_PREWARM_S):
+        """
+        Called right before a chat request: waits for the conversation's prewarm if one is running,
+        since the request needs the prefix it is processing. Returns True if the conversation was
+        prewarmed since its last request.
+        """
+        with self._lock:
+            done = self._in_flight.get(conversation)
+        if done is not None:
+            done.wait(timeout)
+        with self._lock:
+            if conversation in self._warm:
+                self._warm.discard(conversation)
+                return True
+            return False
+
+    def _take_budget(self, now, per_minute):
+        # Token bucket refilled continuously, holding at most one minute's budget
+        if per_minute <= 0:
+            return False
+        capacity = max(1.0, per_minute)
+        if self._budget is None:
+            self._budget = capacity
+        self._budget = min(capacity, self._budget + (now - self._budget_at) * per_minute / 60.0)
+        self._budget_at = now
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+    def _run(self):
+        while True:
+            conversation = self._queue.get()
+            if conversation is None:
+                return
+            warmed = None
+            try:
+                warmed = self.prewarm(conversation)
+            except Exception as e:
+                metrics.record_error("prewarm", e)
+                with self._lock:
+                    self.stats["failed"] += 1
+            with self._lock:
+                if warmed:
+                    self.stats["prewarms"] += 1
+                    self._warm.add(conversation)
+                elif warmed is not None:
+                    self.stats["skipped_small"] += 1
+                done = self._in_flight.pop(conversation, None)
+            if done is not None:
+                done.set()
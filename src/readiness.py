@@ -0,0 +1,76 @@
+import threading
+import time
+
+
+class ReadinessTracker:
+    """
+    Collects readiness reports from components that start concurrently (signal-cli, LLM model
+    detection, Forge) and logs how long each took, plus the total time until all were resolved.
+
+    A component is resolved once it reports ready() or failed(); failed components are logged but
+    don't hold back the overall ready message, so e.g. an unreachable Forge only disables images.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+        self._expected = []
+        self._events = {}
+        self.durations = {}  # component -> seconds from begin() until it resolved
+        self.failures = {}  # component -> error text
+        self.ready_after = None
+
+    def begin(self, *components):
+        """Starts the clock and declares the components whose readiness is awaited."""
+        with self._lock:
+            self.started_at = time.perf_counter()
+            self._expected = list(components)
+            for component in components:
+                self._events.setdefault(component, threading.Event())
+            self.durations.clear()
+            self.failures.clear()
+            self.ready_after = None
+
+    def _event(self, component):
+        with self._lock:
+            return self._events.setdefault(component, threading.Event())
+
+    def ready(self, component, detail=""):
+        self._resolve(component, None, detail)
+
+    def failed(self, component, error):
+        self._resolve(component, str(error), "")
+
+    def _resolve(self, component, error, detail):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started_at
+            self.durations.setdefault(component, elapsed)
+            if error is not None:
+                self.failures[component] = error
+            event = self._events.setdefault(component, threading.Event())
+            event.set()
+            all_resolved = (self.ready_after is None and self._expected
+                            and all(self._events[name].is_set() for name in self._expected))
+            if all_resolved:
+                self.ready_after = max(self.durations[name] for name in self._expected)
+        if error is not None:
+            print(f"[startup] {component} unavailable after {elapsed:.2f}s: {error}", flush=True)
+        else:
+            print(f"[startup] {component} ready after {elapsed:.2f}s" + (f" ({detail})" if detail else ""), flush=True)
+        if all_resolved:
+            if self.failures:
+                print(f"[startup] Startup finished in {self.ready_after:.2f}s; unavailable: {', '.join(sorted(self.failures))}", flush=True)
+            else:
+                print(f"[startup] Ready in {self.ready_after:.2f}s", flush=True)
+
+    def is_ready(self, component):
+        """True once the component reported ready (not failed)."""
+        return self._event(component).is_set() and component not in self.failures
+
+    def wait(self, component, timeout=None):
+        """Blocks until the component resolves; returns True if it is ready."""
+        self._event(component).wait(timeout)
+        return self.is_ready(component)
+
+
+tracker = ReadinessTracker()
@@ -8,24 +8,122 @@ import queue
 import os
 import signal as os_signal
 
-from .config import SIGNAL_CLI_PATH, YOUR_SIGNAL_NUMBER, SIGNAL_DAEMON_ADDRESS, JSON_RPC_PORT
+from . import config as app_config
+from .config import SIGNAL_CLI_PATH, YOUR_SIGNAL_NUMBER, SIGNAL_DAEMON_ADDRESS, JSON_RPC_PORT, DISPATCH_WORKERS, SIGNAL_CLI_MANAGE_DAEMON, PROFILE_SIGNAL_MESSAGES, SIGNAL_CLI_STARTUP_TIMEOUT_S
+from .config import SIGNAL_ACCOUNTS, WORKER_PROCESSES, SEND_BUFFER_HIGH_WATER_BYTES, SEND_QUEUE_MAX_MESSAGES, SEND_QUEUE_PUT_TIMEOUT_S
 from .llm_client import LLMClient
-from .image_generator import generate_image
+from .image_batcher import ImageBatcher
+from .coalescer import MessageCoalescer
+from .dedup import EnvelopeDeduplicator
+from .traffic_capture import TrafficRecorder
+from . import metrics
+from . import tracing
+from .readiness import tracker as readiness
+from .image_generator import get_presets, get_preset, cleanup_image
+from .cancellation import Cancelled, CancellationRegistry
+from .worker_pool import WorkerPool, shard_for
+from .outbound_writer import OutboundWriter
+from .prewarm import PromptPrewarmer
+from .message_types import message_kind, split_preset
 
 # Global variables
 llm_client_global = None
 signal_cli_process = None
-signal_socket = None
+signal_socket = None  # YOUR_SIGNAL_NUMBER's daemon
+extra_sockets = {}  # account -> socket of each SIGNAL_EXTRA_ACCOUNTS daemon
+extra_account_threads = []
 listener_thread_global = None
 sender_thread_global = None
 signal_cli_stdout_thread = None
 signal_cli_stderr_thread = None
 
-send_queue = queue.Queue()
-receive_buffer = ""
+send_queue = queue.Queue(maxsize=SEND_QUEUE_MAX_MESSAGES)
+outbound_writers = {}  # socket -> OutboundWriter; only used by the sender thread
+outbound_stats = {"frames": 0, "writes": 0, "partial_writes": 0, "bytes": 0, "backpressure_waits": 0}
+dispatch_queues = []
+dispatch_threads = []
+dispatch_shard_stride = 1  # worker process count inside a worker process, see shard_for()
+worker_pool = None  # WorkerPool when WORKER_PROCESSES > 0 (signal-cli I/O process only)
+outbound_channel = None  # Queue to the I/O process (worker processes only)
+worker_index = None
+image_batcher = ImageBatcher()
+envelope_deduplicator = EnvelopeDeduplicator()
+traffic_recorder = TrafficRecorder()
+message_coalescer = MessageCoalescer(lambda message: enqueue_incoming_message(message))
+cancellations = CancellationRegistry()
+prompt_prewarmer = PromptPrewarmer(lambda conversation: llm_client_global is not None and
+                                   llm_client_global.prewarm(conversation, app_config.current().PREWARM_MIN_WORDS),
+                                   needed=lambda conversation: llm_client_global is not None and
+                                   llm_client_global.needs_prewarm(conversation, app_config.current().PREWARM_MIN_WORDS))
+receive_buffers = {}  # account -> partial JSON-RPC line
 request_id_counter = 0
+pending_send_acks = {}  # JSON-RPC request id -> (perf_counter, unix ns) when the send was written, trace span
 running = True
 
+metrics.register_stats("image_batcher", image_batcher.stats)
+metrics.register_stats("coalescer", message_coalescer.stats)
+metrics.register_stats("dedup", envelope_deduplicator.stats)
+metrics.register_stats("outbound", outbound_stats)
+metrics.register_stats("prewarm", prompt_prewarmer.stats)
+
+# Message types that get a cancel token, and the setting holding their deadline
+DEADLINE_SETTINGS = {"chat": "CHAT_DEADLINE_S", "image_llm": "IMAGE_DEADLINE_S", "image_direct": "IMAGE_DEADLINE_S"}
+DEADLINE_REPLY = "Sorry, that took too long, so I stopped working on it."
+SEND_SHUTDOWN_FLUSH_S = 2.0  # How long the sender keeps writing buffered replies out after the stop sentinel
+
+def _apply_reloaded_settings(old, new):
+    """Updates long-lived components after a config reload; conversations and the socket are untouched."""
+    image_batcher.configure(new.IMAGE_BATCH_MAX_SIZE, new.IMAGE_BATCH_MAX_WAIT_MS)
+    if llm_client_global and new.API_URL != old.API_URL:
+        llm_client_global.reconfigure(new.API_URL)
+
+app_config.on_reload(_apply_reloaded_settings)
+
+def reload_config(propagate=True):
+    """
+    Reloads settings from .env and the environment; returns a summary for the log and the /reload reply.
+    With worker processes the reload is propagated to the other processes unless `propagate` is False.
+    """
+    try:
+        changed = app_config.reload()
+    except ValueError as e:
+        metrics.record_error("config_reload", e)
+        summary = f"Config reload failed, keeping previous settings: {e}"
+    else:
+        metrics.messages_total.inc(kind="config_reload")
+        needs_restart = [name for name in changed if name in app_config.RESTART_REQUIRED]
+        summary = f"Config reloaded: {', '.join(changed)} changed." if changed else "Config reloaded: no changes."
+        if needs_restart:
+            summary += f" Restart needed for: {', '.join(needs_restart)}."
+    print(summary, flush=True)
+    if propagate:
+        _propagate("reload")
+    return summary
+
+def start_profiling(count, propagate=True):
+    """Profiles the next `count` messages and dumps all thread stacks; returns the stacks file path."""
+    tracing.profiler.arm(count)
+    stacks_path = tracing.profiler.capture_stacks()
+    if propagate:
+        _propagate("profile", count)
+    return stacks_path
+
+def _propagate(command, arg=None):
+    """Forwards an admin command from the I/O process to every worker, or from a worker to the I/O process."""
+    if worker_pool is not None:
+        worker_pool.broadcast(command, arg)
+    elif outbound_channel is not None:
+        outbound_channel.put(("control", worker_index, command, arg))
+
+def handle_control(command, arg=None, origin=None):
+    """Applies an admin command propagated from another process and passes it on to the remaining workers."""
+    if command == "reload":
+        reload_config(propagate=False)
+    elif command == "profile":
+        start_profiling(arg, propagate=False)
+    if worker_pool is not None:
+        worker_pool.broadcast(command, arg, exclude=origin)
+
 def log_stream(stream, prefix, stop_event):
     """Reads and prints lines from a stream until stop_event is set."""
     try:
@@ -86,13 +184,7 @@ def start_signal_cli_daemon():
         )
         signal_cli_stdout_thread.start()
         signal_cli_stderr_thread.start()
-
-        time.sleep(5)
-
-        if signal_cli_process.poll() is not None:
-            print(f"signal-cli failed to start. Return code: {signal_cli_process.returncode}", flush=True)
-            log_stop_event.set()
-            return False
+        # Readiness is detected by connect_socket_to_daemon polling the TCP port
         return True
     except FileNotFoundError:
         print(f"Error: signal-cli executable not found at {SIGNAL_CLI_PATH}", flush=True)
@@ -103,203 +195,707 @@ def start_signal_cli_daemon():
         running = False
         return False
 
-def connect_socket_to_daemon():
-    """Connects to the running signal-cli daemon."""
+def connect_socket_to_daemon(address=SIGNAL_DAEMON_ADDRESS, timeout=SIGNAL_CLI_STARTUP_TIMEOUT_S, account=None, report=True):
+    """
+    Connects to a signal-cli daemon, polling until it accepts connections or the timeout expires.
+    Without `account` this is YOUR_SIGNAL_NUMBER's daemon, whose failure stops the listener;
+    other accounts' sockets are kept in extra_sockets. `report` False keeps reconnection attempts
+    out of the startup readiness log.
+    """
     global signal_socket, running
-    host, port_str = SIGNAL_DAEMON_ADDRESS.split(':')
+    host, port_str = address.rsplit(':', 1)
     port = int(port_str)
-    
-    try:
-        signal_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        signal_socket.connect((host, port))
-        signal_socket.setblocking(False)
-        return True
-    except Exception as e:
-        print(f"Error connecting to signal-cli daemon: {e}", flush=True)
-        running = False
-        return False
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    component = "signal_cli" if account is None else f"signal_cli:{account}"
+
+    while True:
+        try:
+            sock = socket.create_connection((host, port), timeout=5)
+            sock.setblocking(False)
+            if account is None:
+                signal_socket = sock
+            else:
+                extra_sockets[account] = sock
+            if report:
+                readiness.ready(component, address)
+            return True
+        except OSError as e:
+            if signal_cli_process and signal_cli_process.poll() is not None and account is None:
+                error = f"signal-cli exited with return code {signal_cli_process.returncode}"
+            elif not running:
+                if account is not None:
+                    return False
+                error = "listener stopped during startup"
+            elif time.monotonic() >= deadline:
+                error = f"could not connect to {address}: {e}"
+            else:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                continue
+            print(f"Error connecting to signal-cli daemon: {error}", flush=True)
+            if report:
+                readiness.failed(component, error)
+            if account is None:
+                running = False
+            return False
+
+def maintain_extra_account(account, address):
+    """
+    Connects `account`'s daemon in the background, so an unreachable extra account never delays
+    YOUR_SIGNAL_NUMBER, and reconnects it with the same backoff whenever the connection is lost
+    or an attempt times out.
+    """
+    first_attempt = True
+    while running:
+        if account in extra_sockets:
+            time.sleep(0.5)
+            continue
+        if connect_socket_to_daemon(address, account=account, report=first_attempt) and not first_attempt:
+            print(f"Reconnected to the signal-cli daemon of {account}", flush=True)
+        first_attempt = False
+
+def parse_incoming_message(data, account=YOUR_SIGNAL_NUMBER):
+    """
+    Extracts the sender, reply recipient and text from a signal-cli 'receive' JSON received by
+    `account`, or returns None. Conversations with other accounts than YOUR_SIGNAL_NUMBER are
+    keyed by account and sender so each account keeps its own history with a sender.
+    """
+    envelope = data.get('params', {}).get('envelope', {})
+    if not envelope:
+        return None
+
+    sender_identifier = envelope.get('sourceUuid') or envelope.get('sourceNumber')
+    sender_number = envelope.get('sourceNumber')
+
+    message_body = None
+    recipient_for_reply = None
+    from_self = False
+
+    if envelope.get('dataMessage'):
+        if sender_identifier == account or sender_number == account:
+            return None
+        message_body = envelope['dataMessage'].get('message')
+        recipient_for_reply = sender_identifier
+
+    elif envelope.get('syncMessage'):
+        sync_message = envelope['syncMessage']
+        if not sync_message.get('sentMessage'):
+            return None
+        sent_message = sync_message['sentMessage']
+        destination_uuid = sent_message.get('destinationUuid')
+        destination_number = sent_message.get('destinationNumber')
+
+        if destination_uuid == account or destination_number == account:
+            message_body = sent_message.get('message')
+            recipient_for_reply = sender_identifier
+            from_self = True
+        else:
+            return None
+    else:
+        return None
+
+    if not message_body or not recipient_for_reply:
+        return None
+
+    return {
+        "sender": sender_identifier,
+        "recipient": recipient_for_reply,
+        "body": message_body,
+        "timestamp": envelope.get('timestamp'),
+        "from_self": from_self,
+        "account": account,
+        "conversation": sender_identifier if account == YOUR_SIGNAL_NUMBER else f"{account}:{sender_identifier}",
+    }
+
+def parse_typing_event(data, account=YOUR_SIGNAL_NUMBER):
+    """Returns {"sender", "conversation"} for a signal-cli typing STARTED event from someone else, or None."""
+    envelope = data.get('params', {}).get('envelope', {})
+    typing = envelope.get('typingMessage')
+    if not typing or typing.get('action') != "STARTED":
+        return None
+    sender_identifier = envelope.get('sourceUuid') or envelope.get('sourceNumber')
+    if not sender_identifier or sender_identifier == account or envelope.get('sourceNumber') == account:
+        return None
+    return {
+        "sender": sender_identifier,
+        "conversation": sender_identifier if account == YOUR_SIGNAL_NUMBER else f"{account}:{sender_identifier}",
+    }
+
+def handle_typing_event(event):
+    """Prewarms the LLM prompt cache for a conversation whose user started typing, unless it has work in flight."""
+    conversation = event["conversation"]
+    prompt_prewarmer.submit(conversation, busy=cancellations.busy(conversation))
 
 def process_incoming_message(data):
     """Processes a received message JSON from signal-cli."""
+    try:
+        message = parse_incoming_message(data)
+        if message:
+            handle_incoming_message(message)
+    except Exception as e:
+        metrics.record_error("parse", e)
+        print(f"Error processing incoming message JSON: {e}", flush=True)
+
+def handle_incoming_message(message):
+    """Runs the command, image or LLM path for a parsed incoming message."""
     global llm_client_global
-    
+
     try:
-        envelope = data.get('params', {}).get('envelope', {})
-        if not envelope:
+        conversation_id = message.get("conversation", message["sender"])
+        recipient_for_reply = message["recipient"]
+        message_body = message["body"]
+        trace = message.get("span")
+        cancel_token = message.get("cancel_token")
+
+        def reply(text, attachments=None, trace=None):
+            # Answer from the account that received the message
+            send_signal_message(recipient_for_reply, text, attachments=attachments, trace=trace, account=message.get("account"))
+
+        # Settings stay fixed for this message even if a reload happens while it is being handled
+        settings = app_config.current()
+
+        message_body_stripped = message_body.strip()
+        message_body_lower = message_body_stripped.lower()
+
+        # Image preset prefix, e.g. "/fast xx a cute cat"
+        image_params = None
+        preset, text = split_preset(message_body_stripped, settings)
+        if preset:
+            image_params = get_preset(preset, settings)
+            message_body = message_body_stripped = text
+            message_body_lower = message_body_stripped.lower()
+            if not message_body_stripped:
+                reply(f"Please add an image request after '/{preset}'. Example: /{preset} xx a cute cat")
+                return
+
+        # List image presets
+        if message_body_lower == "/presets":
+            metrics.messages_total.inc(kind="presets")
+            preset_lines = [f"/{name}: " + ", ".join(f"{k}={v}" for k, v in overrides.items()) for name, overrides in get_presets(settings).items()]
+            reply("Image presets (prefix an image request with one):\n" + "\n".join(preset_lines))
             return
 
-        sender_identifier = envelope.get('sourceUuid') or envelope.get('sourceNumber')
-        sender_number = envelope.get('sourceNumber')
-        
-        message_body = None
-        recipient_for_reply = None 
+        # Reload configuration without restarting signal-cli (admin only: Note to Self)
+        if message_body_lower == "/reload" and message.get("from_self"):
+            reply(reload_config())
+            return
 
-        if envelope.get('dataMessage'):
-            if sender_identifier == YOUR_SIGNAL_NUMBER or sender_number == YOUR_SIGNAL_NUMBER:
-                return
-            message_body = envelope['dataMessage'].get('message')
-            recipient_for_reply = sender_identifier
+        # Profile the next N messages (admin only: Note to Self)
+        if first_word.lower() == "/profile" and message.get("from_self"):
+            metrics.messages_total.inc(kind="profile")
+            count = int(remainder) if remainder.strip().isdigit() else PROFILE_SIGNAL_MESSAGES
+            stacks_path = start_profiling(count)
+            reply(f"Profiling the next {count} messages into {tracing.profiler.output_dir}. Thread stacks: {stacks_path}")
+            return
 
-        elif envelope.get('syncMessage'):
-            sync_message = envelope['syncMessage']
-            if sync_message.get('sentMessage'):
-                sent_message = sync_message['sentMessage']
-                destination_uuid = sent_message.get('destinationUuid')
-                destination_number = sent_message.get('destinationNumber')
-                
-                if destination_uuid == YOUR_SIGNAL_NUMBER or destination_number == YOUR_SIGNAL_NUMBER:
-                    message_body = sent_message.get('message')
-                    recipient_for_reply = sender_identifier
-                else:
-                    return
-            else:
-                return
-        else:
+        # Cancel this conversation's queued and running requests; they were cancelled when this message arrived
+        if message_body_lower == "/cancel":
+            metrics.messages_total.inc(kind="cancel")
+            cancelled = message.get("cancelled", 0)
+            reply(f"Cancelled {cancelled} request{'' if cancelled == 1 else 's'}." if cancelled else "Nothing to cancel.")
             return
 
-        if message_body and recipient_for_reply:
-            message_body_stripped = message_body.strip()
-            message_body_lower = message_body_stripped.lower()
+        # Reset conversation command
+        if message_body_lower == "/reset":
+            metrics.messages_total.inc(kind="reset")
+            if llm_client_global.reset_conversation(conversation_id):
+                reply("Conversation history reset.")
+            else:
+                reply("Could not find conversation to reset.")
+            return
 
-            # Reset conversation command
-            if message_body_lower == "/reset":
-                if llm_client_global.reset_conversation(sender_identifier):
-                    send_signal_message(recipient_for_reply, "Conversation history reset.")
-                else:
-                    send_signal_message(recipient_for_reply, "Could not find conversation to reset.")
+        # Direct image generation
+        elif message_body_lower.startswith("xx"):
+            metrics.messages_total.inc(kind="image_direct")
+            direct_image_prompt = message_body_stripped[2:].strip()
+            if not direct_image_prompt:
+                reply("Please provide a prompt after 'xx'. Example: xx a cute cat")
                 return
+            try:
+                image_path = image_batcher.generate(direct_image_prompt, image_params, trace=trace, settings=settings, cancel_token=cancel_token)
+                _commit_result(cancel_token, image_path)
+                if image_path:
+                    reply(f"Direct image for '{direct_image_prompt}':", attachments=[image_path], trace=trace)
+                else:
+                    reply(f"Sorry, failed to generate image directly for: '{direct_image_prompt}'")
+            except Cancelled as e:
+                _reply_cancelled(reply, e)
+            except Exception as e:
+                metrics.record_error("image_direct", e)
+                reply(f"Sorry, an error occurred during direct image generation: {e}")
+            return
 
-            # Direct image generation
-            elif message_body_lower.startswith("xx"):
-                direct_image_prompt = message_body_stripped[2:].strip()
-                if not direct_image_prompt:
-                    send_signal_message(recipient_for_reply, "Please provide a prompt after 'xx'. Example: xx a cute cat")
-                    return
+        # LLM-assisted image generation
+        elif ";" in message_body_lower:
+            metrics.messages_total.inc(kind="image_llm")
+            if llm_client_global:
                 try:
-                    image_path = generate_image(direct_image_prompt)
+                    prewarmed = prompt_prewarmer.before_request(conversation_id)
+                    image_prompt_instruction = f"Based on the following user request, generate a detailed and effective prompt suitable for an AI image generator. Avoid full sentences. It should consist mainly of single words, and two word phrases separated by commas. (example: 1girl, Brunette, sweater, thong, green eyes, bent over, nervous, realistic, best quality, dark skin, fair skin, couch, bed, penthouse, cityscape, scenic,etc). Don't forget the commas between each descriptor. include at least 20 descriptors. ALWAYS include hair color and style, eye color, skin color and any other physical description of the character portrayed by the roleplay assistant.prompt should be contextually relevant to what is currently happening in the conversation. limit prompt length to 300 characters. User request: '{message_body}'"
+                    with metrics.time_stage("image_prompt"):
+                        image_gen_prompt = llm_client_global.send_request(image_prompt_instruction, user_id=conversation_id, trace=trace,
+                                                                          cancel_token=cancel_token, prewarmed=prewarmed,
+                                                                          memory_query=message_body)
+                    if not image_gen_prompt: 
+                        raise Exception("LLM failed to generate an image prompt.")
+                    image_path = image_batcher.generate(image_gen_prompt, image_params, trace=trace, settings=settings, cancel_token=cancel_token)
+                    _commit_result(cancel_token, image_path)
                     if image_path:
-                        send_signal_message(recipient_for_reply, f"Direct image for '{direct_image_prompt}':", attachments=[image_path])
+                        reply("", attachments=[image_path], trace=trace)
                     else:
-                        send_signal_message(recipient_for_reply, f"Sorry, failed to generate image directly for: '{direct_image_prompt}'")
+                        reply("Sorry, I couldn't generate the image.")
+                except Cancelled as e:
+                    _reply_cancelled(reply, e)
                 except Exception as e:
-                     send_signal_message(recipient_for_reply, f"Sorry, an error occurred during direct image generation: {e}")
-                return
-
-            # LLM-assisted image generation
-            elif ";" in message_body_lower:
-                if llm_client_global:
-                    try:
-                        image_prompt_instruction = f"Based on the following user request, generate a detailed and effective prompt suitable for an AI image generator. Avoid full sentences. It should consist mainly of single words, and two word phrases separated by commas. (example: 1girl, Brunette, sweater, thong, green eyes, bent over, nervous, realistic, best quality, dark skin, fair skin, couch, bed, penthouse, cityscape, scenic,etc). Don't forget the commas between each descriptor. include at least 20 descriptors. ALWAYS include hair color and style, eye color, skin color and any other physical description of the character portrayed by the roleplay assistant.prompt should be contextually relevant to what is currently happening in the conversation. limit prompt length to 300 characters. User request: '{message_body}'"
-                        image_gen_prompt = llm_client_global.send_request(image_prompt_instruction, user_id=sender_identifier)
-                        if not image_gen_prompt: 
-                            raise Exception("LLM failed to generate an image prompt.")
-                        image_path = generate_image(image_gen_prompt)
-                        if image_path:
-                            send_signal_message(recipient_for_reply, "", attachments=[image_path])
-                        else:
-                            send_signal_message(recipient_for_reply, "Sorry, I couldn't generate the image.")
-                    except Exception as e:
-                        send_signal_message(recipient_for_reply, f"Sorry, an error occurred: {e}")
-                return
-            
-            # Regular text response
-            else:
-                if llm_client_global:
-                    try:
-                        llm_response = llm_client_global.send_request(message_body, user_id=sender_identifier)
-                        send_signal_message(recipient_for_reply, llm_response)
-                    except Exception as e:
-                        send_signal_message(recipient_for_reply, f"Sorry, an error occurred: {e}")
-                return
+                    metrics.record_error("image_llm", e)
+                    reply(f"Sorry, an error occurred: {e}")
+            return
+        
+        # Regular text response
+        else:
+            metrics.messages_total.inc(kind="chat")
+            if llm_client_global:
+                try:
+                    prewarmed = prompt_prewarmer.before_request(conversation_id)
+                    llm_response = llm_client_global.send_request(message_body, user_id=conversation_id, trace=trace,
+                                                                  cancel_token=cancel_token, prewarmed=prewarmed)
+                    reply(llm_response, trace=trace)
+                except Cancelled as e:
+                    _reply_cancelled(reply, e)
+                except Exception as e:
+                    metrics.record_error("chat", e)
+                    reply(f"Sorry, an error occurred: {e}")
+            return
 
     except Exception as e:
-        print(f"Error processing incoming message JSON: {e}", flush=True)
+        metrics.record_error("handle", e)
+        print(f"Error handling incoming message: {e}", flush=True)
+
+def _commit_result(cancel_token, image_path):
+    """Raises Cancelled instead of delivering an image whose message was cancelled while it rendered."""
+    if cancel_token is not None and not cancel_token.commit():
+        cleanup_image(image_path)
+        raise Cancelled(cancel_token.reason)
+
+def _reply_cancelled(reply, error):
+    # Superseded and /cancel'ed work ends silently; running out of time is worth telling the user
+    if error.reason == "deadline":
+        reply(DEADLINE_REPLY)
+
+def apply_cancellation_policy(message):
+    """
+    Runs when a message reaches the process that handles it: /cancel and superseding messages cancel
+    the conversation's earlier work (see SUPERSEDE_POLICY), and LLM or image work gets a cancel token
+    whose deadline counts from when the message was received.
+    """
+    settings = app_config.current()
+    kind = message_kind(message["body"], settings)
+    conversation = message.get("conversation", message["sender"])
+    if kind == "cancel":
+        message["cancelled"] = len(cancellations.cancel(conversation, reason="cancel"))
+    elif kind in settings.SUPERSEDES:
+        superseded = cancellations.cancel(conversation, settings.SUPERSEDES[kind], reason="superseded")
+        earlier = [entry[2]["body"] for entry in superseded if entry[0] == "chat"]
+        if kind == "chat" and earlier:
+            # The new turn answers the superseded messages too, as if they had been coalesced
+            message["body"] = "\n".join(earlier + [message["body"]])
+    if kind in DEADLINE_SETTINGS:
+        deadline_s = getattr(settings, DEADLINE_SETTINGS[kind])
+        if deadline_s > 0 and "received_at" in message:
+            deadline_s = max(0.001, deadline_s - (time.perf_counter() - message["received_at"]))
+        message["cancel_token"] = cancellations.register(conversation, kind, message, deadline_s)
+
+def dispatch_incoming_message(data, received_at=None, account=YOUR_SIGNAL_NUMBER):
+    """
+    Parses a message received by `account` and routes it through the coalescer to its dispatch worker.
+    Typing events go to the worker owning the sender when prompt cache prewarming is enabled.
+    """
+    message = parse_incoming_message(data, account)
+    if not message:
+        typing_event = parse_typing_event(data, account) if app_config.current().PREWARM_ENABLED else None
+        if typing_event and worker_pool is not None:
+            worker_pool.submit_typing(typing_event)
+        elif typing_event:
+            handle_typing_event(typing_event)
+        return
+    # The same envelope can arrive twice after a signal-cli restart or resync
+    if envelope_deduplicator.is_duplicate(message["conversation"], message["timestamp"]):
+        return
+    message["received_at"] = received_at if received_at is not None else time.perf_counter()
+    message["received_ns"] = time.time_ns() - int((time.perf_counter() - message["received_at"]) * 1e9)
+    if not dispatch_queues and worker_pool is None:
+        run_incoming_message(start_message_span(message))
+        return
+    message_coalescer.submit(message)
+
+def start_message_span(message):
+    """Starts the root span of a message's trace, backdated to when its frame was read from the socket."""
+    received_ns = message.get("received_ns") or time.time_ns()
+    message["span"] = tracing.Span("signal.message", attributes={
+        "signal.sender": message["sender"],
+        "signal.timestamp": message.get("timestamp"),
+        "signal.body_length": len(message["body"]),
+    }, start_ns=received_ns)
+    return message
+
+def run_incoming_message(message):
+    """Handles a message under its root span, profiling it if the profiler is armed. Cancelled messages are skipped."""
+    span = message.get("span")
+    cancel_token = message.get("cancel_token")
+    try:
+        if cancel_token is not None and cancel_token.cancelled:
+            if span:
+                span.set_attribute("cancelled", cancel_token.reason)
+            if cancel_token.reason == "deadline":
+                send_signal_message(message["recipient"], DEADLINE_REPLY, account=message.get("account"))
+            return
+        if cancel_token is not None:
+            cancel_token.start()
+        tracing.profiler.run(span.trace_id if span else "untraced", handle_incoming_message, message)
+    finally:
+        if cancel_token is not None:
+            cancellations.finish(message.get("conversation", message["sender"]), cancel_token)
+        if span:
+            span.end()
+
+def enqueue_incoming_message(message):
+    """Hands a parsed message to the dispatch worker (thread or process) that owns its sender."""
+    if not dispatch_queues and worker_pool is None:
+        run_incoming_message(start_message_span(message))
+        return
+    # Coalesced messages share the trace of the turn they were merged into
+    start_message_span(message)
+    message["enqueued_at"] = time.perf_counter()
+    message["enqueued_ns"] = time.time_ns()
+    if "received_at" in message:
+        metrics.observe_stage("receive_to_dispatch", message["enqueued_at"] - message["received_at"])
+        tracing.record_span("signal.receive_to_dispatch", message["span"], message["received_ns"], message["enqueued_ns"])
+    if worker_pool is not None:
+        # The worker process gets a copy, so nothing may be merged into this turn any more
+        message_coalescer.begin(message)
+        worker_pool.submit(message)
+    else:
+        route_to_dispatch_thread(message)
+
+def route_to_dispatch_thread(message):
+    """Queues an already-traced message for the dispatch thread that owns its sender."""
+    apply_cancellation_policy(message)
+    # Stable hash so a sender's messages are always processed in order by one worker
+    dispatch_queues[shard_for(message["sender"], len(dispatch_queues), dispatch_shard_stride)].put(message)
+
+def handle_dispatch_queue_loop(dispatch_queue):
+    """Processes messages for the senders assigned to this worker."""
+    while True:
+        message = dispatch_queue.get()
+        try:
+            if message is None:
+                break
+            message_coalescer.begin(message)
+            metrics.observe_stage("dispatch_queue_wait", time.perf_counter() - message["enqueued_at"])
+            tracing.record_span("signal.dispatch_queue_wait", message["span"], message["enqueued_ns"], time.time_ns(),
+                                **{"signal.worker": threading.current_thread().name})
+            run_incoming_message(message)
+        finally:
+            dispatch_queue.task_done()
+
+def start_dispatch_workers(count=DISPATCH_WORKERS, processes=WORKER_PROCESSES):
+    """
+    Starts message handling: `count` dispatch threads and the image batcher in this process, or
+    `processes` worker processes that each run their own. Also starts the message coalescer.
+    """
+    global worker_pool
+    envelope_deduplicator.load()
+    if processes > 0:
+        worker_pool = WorkerPool(processes, on_send=_enqueue_send, on_control=handle_control).start()
+        metrics.register_stats("worker_pool", worker_pool.stats)
+        print(f"Handling messages in {processes} worker processes", flush=True)
+    else:
+        start_dispatch_threads(count)
+    message_coalescer.start()
+
+def start_dispatch_threads(count=DISPATCH_WORKERS):
+    """Starts the dispatch worker threads and the image batcher."""
+    global dispatch_queues, dispatch_threads
+    image_batcher.start()
+    cancellations.start()
+    prompt_prewarmer.start()
+    if llm_client_global and llm_client_global.memory:
+        llm_client_global.memory.start()
+    dispatch_queues = [queue.Queue() for _ in range(max(1, count))]
+    dispatch_threads = []
+    for index, dispatch_queue in enumerate(dispatch_queues):
+        thread = threading.Thread(target=handle_dispatch_queue_loop, args=(dispatch_queue,), name=f"DispatchWorker-{index}", daemon=True)
+        thread.start()
+        dispatch_threads.append(thread)
+
+def attach_to_pool(index, count, channel, llm_instance):
+    """Sets up a worker process: replies and admin commands go to `channel`, messages are handled by local threads."""
+    global outbound_channel, worker_index, dispatch_shard_stride, llm_client_global
+    outbound_channel = channel
+    worker_index = index
+    dispatch_shard_stride = count
+    llm_client_global = llm_instance
+    # Each worker only warms its own conversations, so the global budget is split between them
+    prompt_prewarmer.budget_share = count
+    start_dispatch_threads()
+
+def stop_dispatch_workers():
+    """Stops the message coalescer and then the dispatch threads or worker processes."""
+    global worker_pool
+    message_coalescer.stop()
+    if message_coalescer.enabled:
+        stats = message_coalescer.stats
+        print(f"Message coalescing: {stats['messages']} messages, {stats['coalesced']} merged into {stats['turns']} turns", flush=True)
+    if worker_pool is not None:
+        worker_pool.stop()
+        worker_pool = None
+    stop_dispatch_threads()
+    envelope_deduplicator.save()
+    if envelope_deduplicator.stats["suppressed"]:
+        print(f"Suppressed {envelope_deduplicator.stats['suppressed']} duplicate envelopes", flush=True)
+
+def stop_dispatch_threads():
+    """Lets the dispatch threads finish their queued messages, then stops them and the image batcher."""
+    global dispatch_queues, dispatch_threads
+    for dispatch_queue in dispatch_queues:
+        dispatch_queue.put(None)
+    image_batcher.stop()
+    for thread in dispatch_threads:
+        if thread.is_alive():
+            thread.join(timeout=5)
+    cancellations.stop()
+    prompt_prewarmer.stop()
+    dispatch_queues = []
+    dispatch_threads = []
+    if llm_client_global and llm_client_global.memory:
+        llm_client_global.memory.stop()
 
 def handle_socket_data_loop():
-    """Reads data from socket, parses JSON, and processes messages."""
-    global receive_buffer, running, signal_socket
-    
+    """Reads data from the daemon sockets, parses JSON, and processes messages."""
+    global running, signal_socket
+
     while running:
         if not signal_socket:
             running = False
             break
-            
-        ready_to_read, _, _ = select.select([signal_socket], [], [], 0.1)
-        if ready_to_read:
+
+        accounts_by_socket = {signal_socket: YOUR_SIGNAL_NUMBER}
+        accounts_by_socket.update({sock: account for account, sock in list(extra_sockets.items())})
+        try:
+            ready_to_read, _, _ = select.select(list(accounts_by_socket), [], [], 0.1)
+        except (OSError, ValueError):
+            # A socket was closed by stop_listener or a dropped extra account; rebuild the list
+            continue
+        for sock in ready_to_read:
+            account = accounts_by_socket[sock]
             try:
-                data = signal_socket.recv(4096)
-                if data:
-                    receive_buffer += data.decode('utf-8', errors='ignore')
-                    while '\n' in receive_buffer:
-                        message_json, receive_buffer = receive_buffer.split('\n', 1)
-                        if message_json:
-                            try:
-                                message_data = json.loads(message_json)
-                                if message_data.get('method') == 'receive':
-                                    process_incoming_message(message_data)
-                            except json.JSONDecodeError:
-                                pass
-                            except Exception:
-                                pass
-                else:
-                    running = False
-                    break
-            except ConnectionResetError:
-                running = False
-                break
+                data = sock.recv(4096)
             except BlockingIOError:
-                pass
-            except Exception:
-                if running:
+                continue
+            except Exception as e:
+                metrics.record_error("receive", e)
+                data = b""
+            if not data:
+                if account == YOUR_SIGNAL_NUMBER:
                     running = False
-                break
+                    break
+                print(f"Lost connection to the signal-cli daemon of {account}, reconnecting", flush=True)
+                _close_extra_socket(account)
+                continue
+            process_received_data(data, time.perf_counter(), account)
         if not running: 
             break
         time.sleep(0.05)
 
-def handle_send_queue_loop():
-    """Sends messages from the queue over the socket."""
-    global request_id_counter, running, signal_socket, send_queue
-    
-    while running:
+def process_received_data(data, received_at, account=YOUR_SIGNAL_NUMBER):
+    """Splits bytes read from `account`'s daemon into JSON-RPC lines and handles each one."""
+    buffer = receive_buffers.get(account, "") + data.decode('utf-8', errors='ignore')
+    while '\n' in buffer:
+        message_json, buffer = buffer.split('\n', 1)
+        if message_json:
+            try:
+                message_data = json.loads(message_json)
+                if message_data.get('method') == 'receive':
+                    traffic_recorder.record(message_data)
+                    dispatch_incoming_message(message_data, received_at, account)
+                elif 'id' in message_data:
+                    handle_send_response(message_data)
+            except json.JSONDecodeError as e:
+                metrics.record_error("receive", e)
+            except Exception as e:
+                metrics.record_error("dispatch", e)
+    receive_buffers[account] = buffer
+
+def _close_extra_socket(account):
+    sock = extra_sockets.pop(account, None)
+    receive_buffers.pop(account, None)
+    if sock:
         try:
-            recipient, message, attachments = send_queue.get(timeout=0.5)
-            if recipient is None:
-                break
-
-            if not signal_socket:
-                send_queue.task_done()
-                continue
-
-            request_id_counter += 1
-            params = {("number" if recipient.startswith('+') else "recipient"): recipient, "message": message}
-            if attachments:
-                params["attachments"] = [os.path.abspath(att) for att in attachments]
+            sock.close()
+        except OSError:
+            pass
 
-            request_json = {"jsonrpc": "2.0", "method": "send", "params": params, "id": request_id_counter}
-            try:
-                json_string = json.dumps(request_json) + '\n'
-                signal_socket.sendall(json_string.encode('utf-8'))
-            except BrokenPipeError:
-                running = False
-            except Exception:
-                pass
-            finally:
-                send_queue.task_done()
+def handle_send_queue_loop():
+    """
+    Serializes queued messages into the write buffer of their daemon's socket and writes the
+    buffers out whenever the sockets accept data. Messages are only taken from the queue while
+    less than SEND_BUFFER_HIGH_WATER_BYTES is buffered, so a slow daemon fills the bounded send
+    queue and then blocks the threads queuing replies (see _enqueue_send).
+    Runs until the stop sentinel, then writes out what is still buffered.
+    """
+    blocked = False  # Above the high-water mark; backpressure_waits counts each time this starts
+    while True:
+        for sock in [sock for sock in outbound_writers if sock.fileno() == -1]:
+            del outbound_writers[sock]  # Closed by stop_listener or a lost extra account
+        busy = [writer for writer in outbound_writers.values() if writer.pending]
+        if sum(writer.pending for writer in busy) < SEND_BUFFER_HIGH_WATER_BYTES:
+            blocked = False
+            if not _buffer_queued_messages(block=not busy):
+                _drain_outbound_writers(SEND_SHUTDOWN_FLUSH_S)
+                break
+        elif not blocked:
+            blocked = True
+            outbound_stats["backpressure_waits"] += 1
+        busy = [writer for writer in outbound_writers.values() if writer.pending]
+        if not busy:
+            continue
+        try:
+            _, writable, _ = select.select([], [writer.sock for writer in busy], [], 0.5)
+        except (OSError, ValueError):
+            continue
+        for writer in busy:
+            if writer.sock in writable:
+                _flush_writer(writer)
+
+def _drain_outbound_writers(timeout):
+    """Writes out the buffered replies for up to `timeout` seconds; what is left is counted as an error."""
+    deadline = time.monotonic() + timeout
+    while True:
+        busy = [writer for writer in list(outbound_writers.values()) if writer.pending and writer.sock.fileno() != -1]
+        remaining = deadline - time.monotonic()
+        if not busy or remaining <= 0:
+            break
+        try:
+            _, writable, _ = select.select([], [writer.sock for writer in busy], [], min(remaining, 0.5))
+        except (OSError, ValueError):
+            break
+        for writer in busy:
+            if writer.sock in writable:
+                _flush_writer(writer)
+    for writer in outbound_writers.values():
+        if writer.pending:
+            metrics.record_error("send", "unflushed_at_shutdown")
+
+def _buffer_queued_messages(block):
+    """
+    Moves queued messages into write buffers until the queue is empty or the high-water mark is
+    reached, so everything queued meanwhile goes out in one write. Returns False on the stop sentinel.
+    """
+    try:
+        item = send_queue.get(timeout=0.5) if block else send_queue.get_nowait()
+    except queue.Empty:
+        return True
+    while True:
+        try:
+            if item[0] is None:
+                return False
+            _buffer_send_request(*item)
+        except Exception as e:
+            metrics.record_error("send", e)
+        finally:
+            send_queue.task_done()
+        if sum(writer.pending for writer in outbound_writers.values()) >= SEND_BUFFER_HIGH_WATER_BYTES:
+            return True
+        try:
+            item = send_queue.get_nowait()
         except queue.Empty:
-            pass
-        except Exception:
-            pass
+            return True
+
+def _buffer_send_request(recipient, message, attachments, enqueued_at, trace, account):
+    global request_id_counter
+    wait = time.perf_counter() - enqueued_at
+    metrics.observe_stage("send_queue_wait", wait)
+    now_ns = time.time_ns()
+    tracing.record_span("signal.send_queue_wait", trace, now_ns - int(wait * 1e9), now_ns)
+
+    # Replies go out through the daemon of the account that received the message
+    sock = signal_socket if account in (None, YOUR_SIGNAL_NUMBER) else extra_sockets.get(account)
+    if not sock:
+        metrics.record_error("send", "not_connected")
+        return
+    writer = outbound_writers.get(sock)
+    if writer is None:
+        writer = outbound_writers[sock] = OutboundWriter(sock, outbound_stats)
+
+    request_id_counter += 1
+    request_id = request_id_counter
+    params = {("number" if recipient.startswith('+') else "recipient"): recipient, "message": message}
+    if attachments:
+        params["attachments"] = [os.path.abspath(att) for att in attachments]
+
+    if len(pending_send_acks) > 1024:
+        # signal-cli never answered these; don't let the map grow without bound
+        pending_send_acks.pop(next(iter(pending_send_acks)), None)
+    pending_send_acks[request_id] = (time.perf_counter(), time.time_ns(), trace)
+    # Ends once the frame's last byte is handed to the socket
+    send_span = tracing.start_span("signal.send", trace, **{"rpc.id": request_id, "signal.attachments": len(attachments)})
+    writer.append({"jsonrpc": "2.0", "method": "send", "params": params, "id": request_id}, on_written=send_span.end)
+
+def _flush_writer(writer):
+    global running
+    try:
+        writer.flush()
+    except OSError as e:
+        metrics.record_error("send", e)
+        del outbound_writers[writer.sock]
+        if writer.sock is signal_socket:
+            running = False
 
-def send_signal_message(recipient, message, attachments=None):
-    """Queues a message to be sent."""
-    send_queue.put((recipient, message, attachments if attachments is not None else []))
+def handle_send_response(response):
+    """Records signal-cli's acknowledgement of a send request."""
+    pending = pending_send_acks.pop(response.get('id'), None)
+    error_code = str(response['error'].get('code', 'rpc_error')) if response.get('error') else None
+    if pending is not None:
+        sent_at, sent_ns, trace = pending
+        metrics.observe_stage("signal_cli_ack", time.perf_counter() - sent_at)
+        if trace is not None:
+            ack_span = tracing.Span("signal.ack", trace_id=trace.trace_id, parent_span_id=trace.span_id,
+                                    attributes={"rpc.id": response.get('id')}, start_ns=sent_ns)
+            if error_code:
+                ack_span.record_error(error_code)
+            ack_span.end()
+    if error_code:
+        metrics.record_error("signal_cli_send", error_code)
+
+def send_signal_message(recipient, message, attachments=None, trace=None, account=None):
+    """
+    Queues a message to be sent from `account` (default YOUR_SIGNAL_NUMBER); `trace` is the span the
+    send and its acknowledgement are recorded under. Worker processes hand it to the I/O process.
+    """
+    item = (recipient, message, attachments if attachments is not None else [], time.perf_counter(), trace, account)
+    if outbound_channel is not None:
+        outbound_channel.put(("send", item))
+    else:
+        _enqueue_send(item)
+
+def _enqueue_send(item):
+    """
+    Puts a reply on the bounded send queue. While the queue is full the caller blocks, which slows
+    message handling down to what the daemons accept; after SEND_QUEUE_PUT_TIMEOUT_S it is dropped.
+    """
+    try:
+        send_queue.put(item, timeout=SEND_QUEUE_PUT_TIMEOUT_S)
+    except queue.Full:
+        print(f"Send queue full for {SEND_QUEUE_PUT_TIMEOUT_S}s, dropping reply to {item[0]}", flush=True)
+        metrics.record_error("send", "queue_full")
 
 def listener_main_loop():
     """Main function for the listener thread."""
     global running, sender_thread_global
     
-    if not start_signal_cli_daemon():
+    if SIGNAL_CLI_MANAGE_DAEMON and not start_signal_cli_daemon():
+        readiness.failed("signal_cli", "could not launch signal-cli")
         running = False
         return
     if not connect_socket_to_daemon():
@@ -310,11 +906,29 @@ def listener_main_loop():
             else:
                 signal_cli_process.terminate()
         return
+    if traffic_recorder.enabled:
+        try:
+            traffic_recorder.open()
+            print(f"Capturing inbound traffic to {traffic_recorder.path} (bodies: {traffic_recorder.body_mode})", flush=True)
+        except OSError as e:
+            metrics.record_error("capture", e)
+            print(f"Warning: could not open traffic capture {traffic_recorder.path}: {e}", flush=True)
 
     # Start the sender thread
     sender_thread_global = threading.Thread(target=handle_send_queue_loop, daemon=True)
     sender_thread_global.start()
 
+    # Start the dispatch workers so slow LLM/image requests don't block the socket reader
+    start_dispatch_workers()
+
+    # Further accounts' daemons are already running; they join (and rejoin) while messages are served
+    extra_account_threads.clear()
+    for account, address in SIGNAL_ACCOUNTS[1:]:
+        thread = threading.Thread(target=maintain_extra_account, args=(account, address),
+                                  name=f"SignalAccountThread-{account}", daemon=True)
+        thread.start()
+        extra_account_threads.append(thread)
+
     # Handle socket data in the current thread
     handle_socket_data_loop()
 
@@ -337,11 +951,25 @@ def stop_listener():
 
     running = False
 
-    # Signal sender_thread to stop
-    if sender_thread_global and sender_thread_global.is_alive():
-        send_queue.put((None, None, None))
+    # The listener thread stops reading from the daemons
+    if listener_thread_global and listener_thread_global.is_alive():
+        listener_thread_global.join(timeout=10)
 
-    # Close socket
+    # Replies to the messages finished here still go out before the sockets are closed
+    stop_dispatch_workers()
+    traffic_recorder.close()
+
+    # Signal sender_thread to stop once it has written out everything queued and buffered
+    if sender_thread_global and sender_thread_global.is_alive():
+        try:
+            send_queue.put((None, None, None, None, None, None), timeout=SEND_SHUTDOWN_FLUSH_S + 5)
+        except queue.Full:
+            print("Send queue still full at shutdown; queued replies are dropped", flush=True)
+        sender_thread_global.join(timeout=SEND_SHUTDOWN_FLUSH_S + 5)
+
+    # Close socket; account threads finish their connection attempt first so no socket is left open
+    for thread in extra_account_threads:
+        thread.join(timeout=6)
     if signal_socket:
         try:
             signal_socket.close()
@@ -349,13 +977,8 @@ def stop_listener():
             pass
         finally:
             signal_socket = None
-
-    # Wait for threads
-    if listener_thread_global and listener_thread_global.is_alive():
-        listener_thread_global.join(timeout=10)
-
-    if sender_thread_global and sender_thread_global.is_alive():
-        sender_thread_global.join(timeout=5)
+    for account in list(extra_sockets):
+        _close_extra_socket(account)
 
     # Terminate signal-cli process
     if signal_cli_process and signal_cli_process.poll() is None:
@@ -369,8 +992,8 @@ def stop_listener():
                 except subprocess.TimeoutExpired:
                     signal_cli_process.kill()
                     signal_cli_process.wait(timeout=5)
-        except Exception:
-            pass
+        except Exception as e:
+            metrics.record_error("shutdown", e)
         finally:
             signal_cli_process = None
 
@@ -0,0 +1,210 @@
+import cProfile
+import io
+import json
+import logging
+import logging.handlers
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+import traceback
+
+from .config import TRACE_EXPORT_PATH, TRACE_EXPORT_MAX_BYTES, TRACE_EXPORT_BACKUPS, PROFILE_OUTPUT_DIR
+
+SERVICE_NAME = "signal-lmstudio-backend"
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def _get_exporter():
+    """Creates the rotating JSONL span log on first use; returns None when export is disabled."""
+    global _exporter
+    if not TRACE_EXPORT_PATH:
+        return None
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                handler = logging.handlers.RotatingFileHandler(
+                    TRACE_EXPORT_PATH, maxBytes=TRACE_EXPORT_MAX_BYTES, backupCount=TRACE_EXPORT_BACKUPS, encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger("signal_backend.spans")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                _exporter = logger
+    return _exporter
+
+
+def set_export_path(path):
+    """Exports later spans to `path` instead; each worker process gets its own file since rotation isn't multi-process safe."""
+    global TRACE_EXPORT_PATH, _exporter
+    with _exporter_lock:
+        if _exporter is not None:
+            for handler in list(_exporter.handlers):
+                _exporter.removeHandler(handler)
+                handler.close()
+        TRACE_EXPORT_PATH = path
+        _exporter = None
+
+
+class Span:
+    """
+    A timed operation within a message's trace. Exported on end() as one JSON line using
+    OpenTelemetry field names (traceId, spanId, parentSpanId, startTimeUnixNano, ...).
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "attributes", "start_ns", "end_ns", "status_code", "status_message")
+
+    def __init__(self, name, trace_id=None, parent_span_id=None, attributes=None, start_ns=None):
+        self.name = name
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.status_code = "STATUS_CODE_UNSET"
+        self.status_message = ""
+
+    def child(self, name, **attributes):
+        return Span(name, trace_id=self.trace_id, parent_span_id=self.span_id, attributes=attributes)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.status_code = "STATUS_CODE_ERROR"
+        self.status_message = str(error)
+        self.attributes["exception.type"] = type(error).__name__ if isinstance(error, BaseException) else str(error)
+
+    def end(self, end_ns=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.status_code == "STATUS_CODE_UNSET":
+            self.status_code = "STATUS_CODE_OK"
+        exporter = _get_exporter()
+        if exporter:
+            exporter.info(json.dumps(self.to_dict(), default=str))
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": self.status_code, "message": self.status_message},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+        return False
+
+
+def start_span(name, parent=None, **attributes):
+    """Starts a child of `parent`, or a new trace when parent is None. Usable as a context manager."""
+    if parent is not None:
+        return parent.child(name, **attributes)
+    return Span(name, attributes=attributes)
+
+
+def record_span(name, parent, start_ns, end_ns, **attributes):
+    """Exports an already-finished interval as a child span of `parent` (no-op without a parent)."""
+    if parent is None:
+        return None
+    span = Span(name, trace_id=parent.trace_id, parent_span_id=parent.span_id, attributes=attributes, start_ns=start_ns)
+    span.end(end_ns)
+    return span
+
+
+# --- On-demand profiling ---
+class MessageProfiler:
+    """
+    Profiles the next N handled messages with cProfile when armed (SIGUSR1 or the /profile admin command).
+
+    Each profile is written to PROFILE_OUTPUT_DIR as profile-<trace id>.prof plus a .txt summary.
+    Only one message is profiled at a time; messages that arrive while one is being profiled run normally.
+    """
+
+    def __init__(self, output_dir=PROFILE_OUTPUT_DIR):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self._lock = threading.Lock()
+        self._active = False
+
+    def arm(self, count):
+        with self._lock:
+            self.remaining = max(0, count)
+        return self.remaining
+
+    def _acquire(self):
+        with self._lock:
+            if self.remaining <= 0 or self._active:
+                return False
+            self.remaining -= 1
+            self._active = True
+            return True
+
+    def run(self, trace_id, func, *args, **kwargs):
+        """Calls func, profiling it if the profiler is armed."""
+        if not self._acquire():
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                self._write(trace_id, profiler)
+        finally:
+            with self._lock:
+                self._active = False
+
+    def _write(self, trace_id, profiler):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base_path = os.path.join(self.output_dir, f"profile-{trace_id}")
+            profiler.dump_stats(f"{base_path}.prof")
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+            with open(f"{base_path}.txt", 'w', encoding='utf-8') as f:
+                f.write(summary.getvalue())
+            print(f"Wrote profile for trace {trace_id} to {base_path}.prof", flush=True)
+        except OSError as e:
+            print(f"Error writing profile for trace {trace_id}: {e}", flush=True)
+
+    def capture_stacks(self):
+        """Writes the current stack of every thread to a file and returns its path."""
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        lines = []
+        for thread_id, frame in frames.items():
+            lines.append(f"--- Thread {names.get(thread_id, thread_id)} ---\n")
+            lines.extend(traceback.format_stack(frame))
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"stacks-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            return path
+        except OSError as e:
+            print(f"Error writing stack capture: {e}", flush=True)
+            return None
+
+
+profiler = MessageProfiler()
@@ -0,0 +1,151 @@
+import copy
+import gzip
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+from . import metrics
+from .config import TRAFFIC_CAPTURE_PATH, TRAFFIC_CAPTURE_BODIES
+from .message_types import message_kind, split_preset
+
+BODY_MODES = ("keep", "hash", "redact")
+# A sync flush ends the compressed data at a byte boundary readers can decode up to
+CAPTURE_FLUSH_RECORDS = 100
+CAPTURE_FLUSH_S = 1.0
+
+
+def _message_containers(envelope):
+    """Yields the dicts inside an envelope that carry a 'message' text."""
+    if isinstance(envelope.get('dataMessage'), dict):
+        yield envelope['dataMessage']
+    sent_message = (envelope.get('syncMessage') or {}).get('sentMessage')
+    if isinstance(sent_message, dict):
+        yield sent_message
+
+
+class TrafficRecorder:
+    """
+    Appends inbound signal-cli 'receive' frames to a gzip-compressed JSONL capture.
+
+    Each line is {"t": <unix time>, "frame": <frame>}. With body mode "hash" or "redact" the message
+    text is replaced by a digest or dropped; its type (message_kind), image preset and length are
+    kept so a replay exercises the same code paths with similarly sized prompts.
+
+    The gzip stream is sync-flushed every CAPTURE_FLUSH_RECORDS frames, and on the first frame more
+    than CAPTURE_FLUSH_S after the last flush, so a crash only loses the frames since then.
+    """
+
+    def __init__(self, path=TRAFFIC_CAPTURE_PATH, body_mode=TRAFFIC_CAPTURE_BODIES):
+        if body_mode not in BODY_MODES:
+            raise ValueError(f"Unknown capture body mode '{body_mode}', expected one of {BODY_MODES}")
+        self.path = path
+        self.body_mode = body_mode
+        self.frames = 0
+        self._file = None
+        self._unflushed = 0
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def open(self):
+        if not self.enabled or self._file:
+            return
+        # Appending creates a new gzip member per session; gzip readers handle concatenated members
+        self._file = gzip.open(self.path, 'ab')
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def record(self, frame, received_at=None):
+        """Appends one frame; failures are counted but never interrupt message handling."""
+        if not self._file:
+            return
+        try:
+            line = json.dumps({"t": received_at if received_at is not None else time.time(), "frame": self._scrub(frame)})
+            with self._lock:
+                if self._file:
+                    self._file.write((line + "\n").encode('utf-8'))
+                    self.frames += 1
+                    self._unflushed += 1
+                    now = time.monotonic()
+                    if self._unflushed >= CAPTURE_FLUSH_RECORDS or now - self._last_flush >= CAPTURE_FLUSH_S:
+                        self._file.flush(zlib.Z_SYNC_FLUSH)
+                        self._unflushed = 0
+                        self._last_flush = now
+        except (OSError, TypeError, ValueError) as e:
+            metrics.record_error("capture", e)
+
+    def _scrub(self, frame):
+        if self.body_mode == "keep":
+            return frame
+        frame = copy.deepcopy(frame)
+        envelope = (frame.get('params') or {}).get('envelope') or {}
+        for container in _message_containers(envelope):
+            body = container.get('message')
+            if not isinstance(body, str):
+                continue
+            preset, text = split_preset(body)
+            container['messageKind'] = message_kind(body)
+            container['messageLength'] = len(text)
+            if preset:
+                container['messagePreset'] = preset
+            if self.body_mode == "hash":
+                container['message'] = "sha256:" + hashlib.sha256(body.encode('utf-8')).hexdigest()
+            else:
+                container['message'] = None
+        return frame
+
+
+def read_capture(path):
+    """
+    Yields (unix time, frame) pairs from a capture file in recorded order. A capture cut short by a
+    crash ends at its last complete line instead of raising.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # Partial line at the truncated end
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield record["t"], record["frame"]
+        except (EOFError, zlib.error) as e:
+            print(f"Capture {path} is truncated, stopping after the last complete frame: {e}", flush=True)
+
+
+def synthesize_body(kind, length, preset=None):
+    """Builds a stand-in message of the given type, image preset and roughly the given length for redacted captures."""
+    filler = ("lorem ipsum dolor sit amet " * (length // 27 + 1))[:max(1, length)].strip() or "hello"
+    if kind in ("reset", "cancel"):
+        body = f"/{kind}"
+    elif kind == "image_direct":
+        body = f"xx {filler}"
+    elif kind == "image_llm":
+        body = f"{filler};"
+    elif kind == "command":
+        body = "/presets"
+    else:
+        body = filler
+    return f"/{preset} {body}" if preset else body
+
+
+def restore_bodies(frame):
+    """Replaces hashed/redacted message text in a captured frame with synthesized text, in place."""
+    envelope = (frame.get('params') or {}).get('envelope') or {}
+    for container in _message_containers(envelope):
+        kind = container.pop('messageKind', None)
+        length = container.pop('messageLength', 0)
+        preset = container.pop('messagePreset', None)
+        if kind is not None:
+            container['message'] = synthesize_body(kind, length, preset)
+    return frame
@@ -0,0 +1,200 @@
+import multiprocessing
+import os
+import queue
+import signal as os_signal
+import threading
+import time
+import zlib
+
+from . import metrics
+from .readiness import tracker as readiness
+
+METRICS_PUSH_INTERVAL_S = 2.0
+LIVENESS_CHECK_INTERVAL_S = 1.0
+RESTART_DELAY_S = 5.0  # A worker that keeps crashing is restarted at most this often
+
+
+def shard_for(sender, count, stride=1):
+    """
+    Stable shard of a sender among `count`. `stride` is the shard count of an outer level, so
+    threads inside a worker process don't all land on the few shards its own senders map to.
+    """
+    return (zlib.crc32((sender or "").encode('utf-8')) // stride) % count
+
+
+class WorkerPool:
+    """
+    Handles incoming messages in `count` worker processes so LLM calls, history manipulation and
+    image post-processing of different senders don't compete for one GIL.
+
+    The process owning the signal-cli sockets submits each message to the worker that owns its
+    sender; every worker has its own LLMClient (and so its own slice of conversations), image
+    batcher and dispatch threads. Workers send back replies, metrics snapshots, readiness and
+    admin commands over one shared outbound queue, read here by a single thread. A worker that
+    dies is restarted with the same inbound queue, losing only its in-memory conversations.
+    """
+
+    def __init__(self, count, on_send, on_control, start_method="spawn"):
+        self.count = max(1, count)
+        self.on_send = on_send  # callable(send queue item)
+        self.on_control = on_control  # callable(command, arg, origin=worker index)
+        self.stats = {"messages": 0, "replies": 0, "restarts": 0}
+        self._context = multiprocessing.get_context(start_method)
+        self._inbound = [self._context.Queue() for _ in range(self.count)]
+        self._outbound = self._context.Queue()
+        self._processes = [None] * self.count
+        self._spawned_at = [0.0] * self.count
+        self._ready = {}  # worker index -> error text, or None once its model is known
+        self._readiness_reported = False
+        self._running = False
+        self._reader = None
+
+    def start(self):
+        self._running = True
+        for index in range(self.count):
+            self._spawn(index)
+        self._reader = threading.Thread(target=self._read_outbound, name="WorkerPoolReaderThread", daemon=True)
+        self._reader.start()
+        return self
+
+    def _spawn(self, index):
+        process = self._context.Process(target=_worker_main, args=(index, self.count, self._inbound[index], self._outbound),
+                                        name=f"MessageWorker-{index}", daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._spawned_at[index] = time.monotonic()
+
+    def submit(self, message):
+        """Queues a traced message for the worker process that owns its sender."""
+        self.stats["messages"] += 1
+        self._inbound[shard_for(message["sender"], self.count)].put(("message", message))
+
+    def submit_typing(self, event):
+        """Queues a typing event for the worker process that owns its sender, behind that sender's earlier messages."""
+        self._inbound[shard_for(event["sender"], self.count)].put(("typing", event))
+
+    def broadcast(self, command, arg=None, exclude=None):
+        """Sends an admin command ('reload' or 'profile') to every worker except `exclude`."""
+        for index, inbound in enumerate(self._inbound):
+            if index != exclude:
+                inbound.put(("control", command, arg))
+
+    def stop(self, timeout=10):
+        """Lets workers finish the messages already queued, then stops them and drains their last replies."""
+        for inbound in self._inbound:
+            inbound.put(None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"Worker process {index} did not stop in time; terminating it.", flush=True)
+                process.terminate()
+                process.join(timeout=5)
+        self._running = False
+        if self._reader and self._reader.is_alive():
+            self._reader.join(timeout=5)
+        self._reader = None
+
+    def _read_outbound(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                item = self._outbound.get(timeout=0.5)
+            except queue.Empty:
+                if not self._running:
+                    return
+                item = None
+            if item is not None:
+                try:
+                    self._handle(item)
+                except Exception as e:
+                    metrics.record_error("worker_pool", e)
+            if self._running and time.monotonic() - last_check >= LIVENESS_CHECK_INTERVAL_S:
+                last_check = time.monotonic()
+                self._restart_dead_workers()
+
+    def _handle(self, item):
+        kind = item[0]
+        if kind == "send":
+            self.stats["replies"] += 1
+            self.on_send(item[1])
+        elif kind == "metrics":
+            metrics.merge_remote(f"worker-{item[1]}", item[2])
+        elif kind == "ready":
+            self._worker_ready(item[1], item[2], item[3])
+        elif kind == "control":
+            self.on_control(item[2], item[3], origin=item[1])
+
+    def _worker_ready(self, index, model_identifier, error):
+        self._ready[index] = error
+        if self._readiness_reported or len(self._ready) < self.count:
+            return
+        self._readiness_reported = True
+        errors = sorted({error for error in self._ready.values() if error})
+        if errors:
+            readiness.failed("llm_model", "; ".join(errors))
+        else:
+            readiness.ready("llm_model", f"{model_identifier} in {self.count} worker processes")
+
+    def _restart_dead_workers(self):
+        for index, process in enumerate(self._processes):
+            if process is None or process.is_alive() or not self._running:
+                continue
+            if time.monotonic() - self._spawned_at[index] >= RESTART_DELAY_S:
+                metrics.record_error("worker_pool", f"exit_{process.exitcode}")
+                print(f"Worker process {index} exited with code {process.exitcode}; restarting it. "
+                      f"Its conversations are lost.", flush=True)
+                self.stats["restarts"] += 1
+                self._spawn(index)
+
+
+def _worker_export_path(path, index):
+    if not path:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.worker-{index}{extension}"
+
+
+def _push_metrics(index, outbound, stop_event):
+    while not stop_event.wait(METRICS_PUSH_INTERVAL_S):
+        outbound.put(("metrics", index, metrics.snapshot()))
+
+
+def _report_model_ready(index, client, outbound):
+    if client.wait_until_ready():
+        outbound.put(("ready", index, client.model_identifier, None))
+    else:
+        outbound.put(("ready", index, None, f"worker {index} could not determine the model identifier"))
+
+
+def _worker_main(index, count, inbound, outbound):
+    """Entry point of worker process `index`: handles the messages of its senders until told to stop."""
+    # Ctrl+C reaches the whole process group; workers are stopped through their inbound queue instead
+    os_signal.signal(os_signal.SIGINT, os_signal.SIG_IGN)
+    from . import signal_handler, tracing
+    from .config import API_URL, TRACE_EXPORT_PATH
+    from .llm_client import LLMClient
+
+    tracing.set_export_path(_worker_export_path(TRACE_EXPORT_PATH, index))
+    signal_handler.attach_to_pool(index, count, outbound, LLMClient(API_URL))
+    threading.Thread(target=_report_model_ready, args=(index, signal_handler.llm_client_global, outbound),
+                     name="ModelReadyReporterThread", daemon=True).start()
+    stop_metrics = threading.Event()
+    threading.Thread(target=_push_metrics, args=(index, outbound, stop_metrics), name="MetricsPushThread", daemon=True).start()
+    try:
+        while True:
+            item = inbound.get()
+            if item is None:
+                break
+            if item[0] == "message":
+                signal_handler.route_to_dispatch_thread(item[1])
+            elif item[0] == "typing":
+                signal_handler.handle_typing_event(item[1])
+            elif item[0] == "control":
+                signal_handler.handle_control(item[1], item[2])
+    finally:
+        signal_handler.stop_dispatch_threads()
+        stop_metrics.set()
+        outbound.put(("metrics", index, metrics.snapshot()))
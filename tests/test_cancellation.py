@@ -0,0 +1,188 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import config as app_config
+from src import image_generator, metrics, signal_handler
+from src.cancellation import Cancelled, CancelToken, CancellationRegistry
+from src.llm_client import LLMClient
+from benchmarks.fakes.forge import FakeForgeServer
+from benchmarks.fakes.openai_server import FakeOpenAIServer
+
+
+class TestCancelToken(unittest.TestCase):
+    def test_cancel_runs_callbacks_once(self):
+        token = CancelToken()
+        reasons = []
+        token.on_cancel(reasons.append)
+        self.assertTrue(token.cancel("superseded"))
+        self.assertFalse(token.cancel("cancel"))
+        self.assertEqual(reasons, ["superseded"])
+        with self.assertRaises(Cancelled):
+            token.check()
+
+    def test_commit_makes_later_cancels_no_ops(self):
+        token = CancelToken()
+        self.assertTrue(token.commit())
+        self.assertFalse(token.cancel())
+        self.assertFalse(token.cancelled)
+        late = CancelToken()
+        late.cancel()
+        self.assertFalse(late.commit())
+
+    def test_deadline(self):
+        token = CancelToken(deadline_s=0.05)
+        self.assertLessEqual(token.remaining(cap=10), 0.05)
+        time.sleep(0.06)
+        with self.assertRaises(Cancelled) as raised:
+            token.check()
+        self.assertEqual(raised.exception.reason, "deadline")
+
+    def test_all_of_waits_for_every_token(self):
+        tokens = [CancelToken(), CancelToken()]
+        combined = CancelToken.all_of(tokens)
+        tokens[0].cancel()
+        self.assertFalse(combined.cancelled)
+        tokens[1].cancel()
+        self.assertTrue(combined.cancelled)
+
+
+class TestCancellationRegistry(unittest.TestCase):
+    def test_watchdog_cancels_expired_work(self):
+        registry = CancellationRegistry()
+        registry.start()
+        try:
+            before = metrics.cancelled_total.value(kind="chat", reason="deadline", state="running")
+            token = registry.register("conv", "chat", {"body": "hi"}, deadline_s=0.05)
+            token.start()
+            self.assertTrue(token.wait(2))
+        finally:
+            registry.stop()
+        self.assertEqual(token.reason, "deadline")
+        self.assertEqual(metrics.cancelled_total.value(kind="chat", reason="deadline", state="running"), before + 1)
+
+    def test_cancel_by_kind_and_reclaimed_time(self):
+        registry = CancellationRegistry()
+        finished = registry.register("conv", "image_direct", {})
+        finished.start()
+        registry.finish("conv", finished)
+        image = registry.register("conv", "image_direct", {})
+        chat = registry.register("conv", "chat", {})
+        other = registry.register("other", "chat", {})
+        before = metrics.reclaimed_seconds_total.value(kind="image_direct")
+        cancelled = registry.cancel("conv", {"image_direct"}, reason="superseded")
+        self.assertEqual([entry[1] for entry in cancelled], [image])
+        self.assertFalse(chat.cancelled or other.cancelled)
+        # Queued work reclaims the mean duration of completed work of its kind
+        self.assertGreaterEqual(metrics.reclaimed_seconds_total.value(kind="image_direct"), before)
+
+
+class TestStreamCancellation(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer(tokens_per_s=20, completion_tokens=200).start()
+        self.client = LLMClient(self.server.url, detect_in_background=False)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_cancel_closes_the_llm_stream_and_keeps_history(self):
+        token = CancelToken()
+        threading.Timer(0.3, token.cancel, args=("superseded",)).start()
+        started = time.monotonic()
+        with self.assertRaises(Cancelled):
+            self.client.send_request("hello", user_id="u1", cancel_token=token)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([m["role"] for m in self.client.conversations["u1"]], ["system"])
+        self.assertTrue(self.server.requests[-1]["stream"])
+        deadline = time.monotonic() + 5
+        while not self.server.cancelled_streams and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.server.cancelled_streams, 1)
+
+    def test_summary_outlives_the_message_deadline(self):
+        self.server.completion_tokens = 5
+        self.client.send_request("one two three four five six", user_id="u3")
+        self.server.prompt_latency_s = 0.5
+        token = CancelToken(deadline_s=0.2)
+        with mock.patch.object(LLMClient, "SUMMARY_THRESHOLD_TOKENS", 10):
+            with self.assertRaises(Cancelled) as raised:
+                self.client.send_request("and then?", user_id="u3", cancel_token=token)
+        self.assertEqual(raised.exception.reason, "deadline")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(self.client.conversations["u3"][-1]["content"].startswith("The following is a summary"))
+
+    def test_streamed_reply_is_assembled(self):
+        self.server.completion_tokens = 5
+        self.assertEqual(self.client.send_request("hello", user_id="u2"), "word0 word1 word2 word3 word4")
+        self.assertEqual(self.client.conversations["u2"][-1]["content"], "word0 word1 word2 word3 word4")
+
+
+class TestForgeCancellation(unittest.TestCase):
+    def test_cancel_interrupts_a_running_render(self):
+        forge = FakeForgeServer(per_image_s=10).start()
+        try:
+            settings = app_config.Settings(FORGE_API_URL=forge.url)
+            token = CancelToken()
+            threading.Timer(1.5, token.cancel).start()
+            started = time.monotonic()
+            with self.assertRaises(Cancelled):
+                image_generator.generate_image("a cat", settings=settings, cancel_token=token)
+            self.assertLess(time.monotonic() - started, 5)
+            deadline = time.monotonic() + 5
+            while not forge.interrupts and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(forge.interrupts, 1)
+        finally:
+            forge.stop()
+
+
+class TestSupersedePolicy(unittest.TestCase):
+    def message(self, body):
+        return {"sender": "s1", "conversation": "s1", "recipient": "s1", "body": body}
+
+    def tearDown(self):
+        signal_handler.cancellations = CancellationRegistry()
+
+    def test_message_kinds(self):
+        self.assertEqual(signal_handler.message_kind("/fast xx a cat"), "image_direct")
+        self.assertEqual(signal_handler.message_kind("show me; now"), "image_llm")
+        self.assertEqual(signal_handler.message_kind(" /Cancel "), "cancel")
+        self.assertEqual(signal_handler.message_kind("/presets"), "command")
+        self.assertEqual(signal_handler.message_kind("just talking"), "chat")
+
+    def test_preset_without_request_asks_for_one(self):
+        with mock.patch.object(signal_handler, "send_signal_message") as send:
+            signal_handler.handle_incoming_message(self.message(" /FAST "))
+        self.assertIn("after '/fast'", send.call_args[0][1])
+
+    def test_new_chat_supersedes_and_absorbs_earlier_chat(self):
+        signal_handler.cancellations = CancellationRegistry()
+        first = self.message("first")
+        signal_handler.apply_cancellation_policy(first)
+        image = self.message("xx a cat")
+        signal_handler.apply_cancellation_policy(image)
+        second = self.message("second")
+        signal_handler.apply_cancellation_policy(second)
+        self.assertEqual(first["cancel_token"].reason, "superseded")
+        self.assertFalse(image["cancel_token"].cancelled)
+        self.assertEqual(second["body"], "first\nsecond")
+
+        cancel = self.message("/cancel")
+        signal_handler.apply_cancellation_policy(cancel)
+        self.assertEqual(cancel["cancelled"], 2)
+        self.assertNotIn("cancel_token", cancel)
+
+    def test_policy_is_configurable(self):
+        signal_handler.cancellations = CancellationRegistry()
+        with mock.patch.object(app_config, "_current", app_config.Settings(SUPERSEDE_POLICY="image_direct=image_direct")):
+            first, second = self.message("one"), self.message("two")
+            signal_handler.apply_cancellation_policy(first)
+            signal_handler.apply_cancellation_policy(second)
+        self.assertFalse(first["cancel_token"].cancelled)
+        with self.assertRaises(ValueError):
+            app_config.Settings(SUPERSEDE_POLICY="chat=everything")
+
+
+if __name__ == '__main__':
+    unittest.main()
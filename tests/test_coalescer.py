@@ -0,0 +1,120 @@
+import threading
+import time
+import unittest
+
+from src.coalescer import MessageCoalescer, is_plain_text
+
+
+def make_message(sender, body):
+    return {"sender": sender, "recipient": sender, "body": body, "timestamp": None}
+
+
+class TestMessageCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.dispatched = []
+        self.event = threading.Event()
+
+    def dispatch(self, message):
+        self.dispatched.append(dict(message))
+        self.event.set()
+
+    def wait_for(self, count, timeout=2):
+        deadline = time.monotonic() + timeout
+        while len(self.dispatched) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_is_plain_text(self):
+        self.assertTrue(is_plain_text("hello there"))
+        self.assertFalse(is_plain_text("/reset"))
+        self.assertFalse(is_plain_text("xx a cat"))
+        self.assertFalse(is_plain_text("show me;"))
+
+    def test_burst_is_merged_into_one_turn(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=100, max_hold_ms=1000)
+        coalescer.start()
+        try:
+            for body in ("hey", "so about yesterday", "what happened?"):
+                coalescer.submit(make_message("alice", body))
+            self.wait_for(1)
+            time.sleep(0.15)
+        finally:
+            coalescer.stop()
+        self.assertEqual(len(self.dispatched), 1)
+        self.assertEqual(self.dispatched[0]["body"], "hey\nso about yesterday\nwhat happened?")
+        self.assertEqual(coalescer.stats["coalesced"], 2)
+        self.assertEqual(coalescer.stats["turns"], 1)
+
+    def test_command_flushes_held_text_first(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=500, max_hold_ms=1000)
+        coalescer.start()
+        try:
+            coalescer.submit(make_message("bob", "hello"))
+            coalescer.submit(make_message("bob", "/reset"))
+        finally:
+            coalescer.stop()
+        self.assertEqual([m["body"] for m in self.dispatched], ["hello", "/reset"])
+
+    def test_text_after_command_is_not_merged_ahead_of_it(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=500, max_hold_ms=1000)
+        coalescer.start()
+        try:
+            coalescer.submit(make_message("bob", "hello"))
+            coalescer.submit(make_message("bob", "xx a cat"))
+            coalescer.submit(make_message("bob", "nice"))
+        finally:
+            coalescer.stop()
+        self.assertEqual([m["body"] for m in self.dispatched], ["hello", "xx a cat", "nice"])
+
+    def test_senders_are_independent(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=100, max_hold_ms=1000)
+        coalescer.start()
+        try:
+            coalescer.submit(make_message("alice", "one"))
+            coalescer.submit(make_message("bob", "two"))
+            self.wait_for(2)
+        finally:
+            coalescer.stop()
+        self.assertEqual(sorted(m["body"] for m in self.dispatched), ["one", "two"])
+
+    def test_accounts_keep_separate_turns(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=100, max_hold_ms=1000)
+        coalescer.start()
+        try:
+            for account, body in (("+15550000000", "hi A"), ("+15550000001", "hi B")):
+                message = make_message("alice", body)
+                message.update(account=account, conversation=f"{account}:alice")
+                coalescer.submit(message)
+            self.wait_for(2)
+        finally:
+            coalescer.stop()
+        self.assertEqual(sorted((m["account"], m["body"]) for m in self.dispatched),
+                         [("+15550000000", "hi A"), ("+15550000001", "hi B")])
+
+    def test_merges_into_queued_turn_until_worker_begins(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=100, max_hold_ms=1000)
+        queued = []
+        coalescer.dispatch = queued.append
+        coalescer.start()
+        try:
+            coalescer.submit(make_message("carol", "first"))
+            deadline = time.monotonic() + 2
+            while not queued and time.monotonic() < deadline:
+                time.sleep(0.005)
+            coalescer.submit(make_message("carol", "second"))
+            self.assertEqual(queued[0]["body"], "first\nsecond")
+            coalescer.begin(queued[0])
+            time.sleep(0.01)
+            coalescer.submit(make_message("carol", "third"))
+        finally:
+            coalescer.stop()
+        self.assertEqual([m["body"] for m in queued], ["first\nsecond", "third"])
+
+    def test_disabled_dispatches_immediately(self):
+        coalescer = MessageCoalescer(self.dispatch, window_ms=0)
+        coalescer.start()
+        coalescer.submit(make_message("dave", "hi"))
+        self.assertEqual(len(self.dispatched), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import dataclasses
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import config, image_generator
+
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env_path = os.path.join(self.temp_dir.name, ".env")
+        self.original = config.current()
+
+    def tearDown(self):
+        config._current = self.original
+        self.temp_dir.cleanup()
+
+    def write_env(self, text):
+        with open(self.env_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_values_are_typed_and_dotenv_wins(self):
+        self.write_env("DEFAULT_IMAGE_WIDTH=512\nDEFAULT_HIRES_FIX_ENABLED=True\nAPI_URL=http://from-dotenv\n")
+        settings = config.load_settings(self.env_path, environ={"API_URL": "http://from-env", "DEFAULT_CFG_SCALE": "3.5"})
+        self.assertEqual(settings.DEFAULT_IMAGE_WIDTH, 512)
+        self.assertIs(settings.DEFAULT_HIRES_FIX_ENABLED, True)
+        self.assertEqual(settings.DEFAULT_CFG_SCALE, 3.5)
+        self.assertEqual(settings.API_URL, "http://from-dotenv")
+        self.assertIsNone(settings.YOUR_SIGNAL_NUMBER)
+
+    def test_snapshot_is_immutable(self):
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            config.current().DEFAULT_SAMPLING_STEPS = 1
+
+    def test_invalid_values_are_rejected(self):
+        with self.assertRaises(ValueError):
+            config.load_settings(self.env_path, environ={"DEFAULT_SAMPLING_STEPS": "many"})
+        with self.assertRaises(ValueError):
+            config.load_settings(self.env_path, environ={"IMAGE_PRESETS": "{not json"})
+
+    def test_reload_swaps_snapshot_and_reports_changes(self):
+        self.write_env("DEFAULT_SAMPLING_STEPS=7\nJSON_RPC_PORT=9999\n")
+        before = config.current()
+        applied = []
+        with mock.patch.object(config, "_reload_callbacks", [lambda old, new: applied.append((old, new))]):
+            changed = config.reload(self.env_path)
+        after = config.current()
+        self.assertIsNot(before, after)
+        self.assertEqual(after.DEFAULT_SAMPLING_STEPS, 7)
+        self.assertIn("DEFAULT_SAMPLING_STEPS", changed)
+        self.assertIn("JSON_RPC_PORT", config.RESTART_REQUIRED.intersection(changed))
+        self.assertEqual(applied, [(before, after)])
+        # Work that captured the old snapshot keeps its values
+        self.assertEqual(before.DEFAULT_SAMPLING_STEPS, self.original.DEFAULT_SAMPLING_STEPS)
+
+    def test_failed_reload_keeps_previous_snapshot(self):
+        self.write_env("DEFAULT_IMAGE_HEIGHT=tall\n")
+        before = config.current()
+        with self.assertRaises(ValueError):
+            config.reload(self.env_path)
+        self.assertIs(config.current(), before)
+
+    def test_extra_signal_accounts(self):
+        settings = config.load_settings(self.env_path, environ={
+            "YOUR_SIGNAL_NUMBER": "+15550000000",
+            "SIGNAL_EXTRA_ACCOUNTS": "+15550000001@127.0.0.1:7584, +15550000002@10.0.0.2:7585",
+        })
+        self.assertEqual(settings.SIGNAL_ACCOUNTS[0], ("+15550000000", settings.SIGNAL_DAEMON_ADDRESS))
+        self.assertEqual(settings.SIGNAL_ACCOUNTS[2], ("+15550000002", "10.0.0.2:7585"))
+        with self.assertRaises(ValueError):
+            config.load_settings(self.env_path, environ={"SIGNAL_EXTRA_ACCOUNTS": "+15550000001@nowhere"})
+
+    def test_image_defaults_and_presets_follow_snapshot(self):
+        settings = config.load_settings(self.env_path, environ={
+            "DEFAULT_SAMPLING_STEPS": "12",
+            "IMAGE_PRESETS": '{"square": {"width": 1024, "height": 1024}}',
+        })
+        self.assertEqual(image_generator.default_generation_params(settings)["steps"], 12)
+        self.assertEqual(image_generator.get_preset("fast", settings)["steps"], 6)
+        self.assertEqual(image_generator.get_preset("square", settings), {"width": 1024, "height": 1024})
+        self.assertIsNone(image_generator.get_preset("square", self.original))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.dedup import EnvelopeDeduplicator
+
+
+class TestEnvelopeDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.temp_dir.name, "dedup.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make(self, **kwargs):
+        options = {"capacity": 100, "window_s": 60, "snapshot_path": self.snapshot_path, "snapshot_interval_s": 3600}
+        options.update(kwargs)
+        return EnvelopeDeduplicator(**options)
+
+    def test_second_delivery_is_suppressed(self):
+        dedup = self.make()
+        self.assertFalse(dedup.is_duplicate("alice", 1000))
+        self.assertTrue(dedup.is_duplicate("alice", 1000))
+        self.assertFalse(dedup.is_duplicate("bob", 1000))
+        self.assertEqual(dedup.stats["suppressed"], 1)
+
+    def test_missing_key_is_never_suppressed(self):
+        dedup = self.make()
+        self.assertFalse(dedup.is_duplicate("alice", None))
+        self.assertFalse(dedup.is_duplicate("alice", None))
+
+    def test_capacity_bounds_memory(self):
+        dedup = self.make(capacity=3)
+        for timestamp in range(10):
+            dedup.is_duplicate("alice", timestamp)
+        self.assertEqual(len(dedup), 3)
+        self.assertEqual(len(dedup._keys), 3)
+        self.assertFalse(dedup.is_duplicate("alice", 0))
+
+    def test_entries_expire_after_window(self):
+        dedup = self.make(window_s=10)
+        with mock.patch("src.dedup.time.time", return_value=1000.0):
+            dedup.is_duplicate("alice", 1)
+        with mock.patch("src.dedup.time.time", return_value=1011.0):
+            self.assertFalse(dedup.is_duplicate("alice", 1))
+
+    def test_snapshot_survives_restart(self):
+        dedup = self.make()
+        dedup.is_duplicate("alice", 1)
+        dedup.is_duplicate("bob", 2)
+        dedup.save()
+
+        restored = self.make()
+        restored.load()
+        self.assertTrue(restored.is_duplicate("alice", 1))
+        self.assertTrue(restored.is_duplicate("bob", 2))
+        self.assertFalse(restored.is_duplicate("carol", 3))
+
+    def test_corrupt_snapshot_is_ignored(self):
+        with open(self.snapshot_path, "w") as f:
+            f.write("not json")
+        dedup = self.make()
+        dedup.load()
+        self.assertEqual(len(dedup), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import threading
+import time
+import unittest
+
+from src.cancellation import CancelToken
+from src.image_batcher import ImageBatcher
+
+
+class TestImageBatcher(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.forge_free = threading.Event()
+        self.forge_free.set()
+
+    def fake_generate(self, prompts, params, traces=None, settings=None, cancel_token=None):
+        if prompts == ["busy"]:
+            self.forge_free.wait(5)
+            return ["busy.png"]
+        self.calls.append((list(prompts), params["width"]))
+        return [f"{prompt}-{i}.png" for i, prompt in enumerate(prompts)]
+
+    def run_concurrently(self, batcher, jobs):
+        """Submits jobs while Forge is busy with an earlier render, the way batch partners gather in practice."""
+        results = [None] * len(jobs)
+
+        def worker(index, prompt, params):
+            results[index] = batcher.generate(prompt, params, timeout=5)
+
+        self.forge_free.clear()
+        busy = batcher.submit("busy")
+        threads = [threading.Thread(target=worker, args=(index, *job)) for index, job in enumerate(jobs)]
+        for thread in threads:
+            thread.start()
+        while batcher.stats["jobs"] < len(jobs) + 1:
+            time.sleep(0.01)
+        self.forge_free.set()
+        busy.wait(5)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_compatible_jobs_share_a_batch(self):
+        batcher = ImageBatcher(generate_batch=self.fake_generate, max_batch_size=4, max_wait_ms=200)
+        batcher.start()
+        try:
+            results = self.run_concurrently(batcher, [("a cat", None)] * 3)
+        finally:
+            batcher.stop()
+        self.assertEqual(sorted(results), ["a cat-0.png", "a cat-1.png", "a cat-2.png"])
+        self.assertEqual([prompts for prompts, _ in self.calls], [["a cat"] * 3])
+
+    def test_different_prompts_are_never_batched(self):
+        # Forge's txt2img call takes one prompt string per batch; mixing prompts would leak them between users
+        batcher = ImageBatcher(generate_batch=self.fake_generate, max_batch_size=4, max_wait_ms=200)
+        batcher.start()
+        try:
+            results = self.run_concurrently(batcher, [("a cat", None), ("a dog", None), ("a cat", None)])
+        finally:
+            batcher.stop()
+        self.assertEqual(results[1], "a dog-0.png")
+        self.assertEqual(sorted(prompts for prompts, _ in self.calls), [["a cat", "a cat"], ["a dog"]])
+
+    def test_job_without_partners_is_not_held(self):
+        batcher = ImageBatcher(generate_batch=self.fake_generate, max_batch_size=4, max_wait_ms=5000)
+        batcher.start()
+        try:
+            started = time.monotonic()
+            self.assertEqual(batcher.generate("a unique prompt", timeout=5), "a unique prompt-0.png")
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            batcher.stop()
+
+    def test_incompatible_jobs_are_split(self):
+        batcher = ImageBatcher(generate_batch=self.fake_generate, max_batch_size=4, max_wait_ms=200)
+        batcher.start()
+        try:
+            results = self.run_concurrently(batcher, [("a", {"width": 512}), ("a", {"width": 768}), ("a", {"width": 512})])
+        finally:
+            batcher.stop()
+        self.assertEqual(results[1], "a-0.png")
+        self.assertEqual(sorted(len(prompts) for prompts, _ in self.calls), [1, 2])
+
+    def test_max_batch_size_is_respected(self):
+        batcher = ImageBatcher(generate_batch=self.fake_generate, max_batch_size=2, max_wait_ms=200)
+        batcher.start()
+        try:
+            self.run_concurrently(batcher, [("p", None)] * 5)
+        finally:
+            batcher.stop()
+        self.assertTrue(all(len(prompts) <= 2 for prompts, _ in self.calls))
+        self.assertEqual(sum(len(prompts) for prompts, _ in self.calls), 5)
+
+    def test_missing_batch_outputs_fall_back_to_single_submission(self):
+        def partial_generate(prompts, params, traces=None, settings=None, cancel_token=None):
+            if prompts == ["busy"]:
+                return self.fake_generate(prompts, params)
+            # Simulates Forge returning only the first image of a batch
+            self.calls.append((list(prompts), params["width"]))
+            return [f"{prompts[0]}-{len(self.calls)}.png"]
+
+        batcher = ImageBatcher(generate_batch=partial_generate, max_batch_size=2, max_wait_ms=200)
+        batcher.start()
+        try:
+            results = self.run_concurrently(batcher, [("x", None), ("x", None)])
+        finally:
+            batcher.stop()
+        self.assertEqual(sorted(results), ["x-1.png", "x-2.png"])
+        self.assertEqual(batcher.stats["fallback_jobs"], 1)
+
+    def test_cancelled_job_stops_waiting_behind_other_renders(self):
+        batcher = ImageBatcher(generate_batch=self.fake_generate, max_batch_size=4, max_wait_ms=200)
+        batcher.start()
+        try:
+            self.forge_free.clear()
+            busy = batcher.submit("busy")
+            started = time.monotonic()
+            self.assertIsNone(batcher.generate("late", timeout=5, cancel_token=CancelToken(deadline_s=0.3)))
+            self.assertLess(time.monotonic() - started, 1)
+            cancelled = CancelToken()
+            threading.Timer(0.2, cancelled.cancel).start()
+            self.assertIsNone(batcher.generate("dropped", timeout=5, cancel_token=cancelled))
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(batcher.stats["cancelled_jobs"], 2)
+            self.assertEqual(batcher._pending, [])
+            self.forge_free.set()
+            busy.wait(5)
+        finally:
+            self.forge_free.set()
+            batcher.stop()
+        self.assertEqual(self.calls, [])
+
+    def test_generate_without_start_runs_inline(self):
+        batcher = ImageBatcher(generate_batch=self.fake_generate)
+        self.assertEqual(batcher.generate("solo"), "solo-0.png")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from src import config as app_config
+from src import image_generator
+from benchmarks.fakes.forge import FakeForgeServer
+
+
+class TestPayloadTemplate(unittest.TestCase):
+    def test_build_payload_patches_only_named_fields(self):
+        data = image_generator.build_payload_data({"prompt": "a cat", "batch_size": 3, "steps": 7})
+        index = image_generator._FIELD_INDEX
+        self.assertEqual(data[index["prompt"]], "a cat")
+        self.assertEqual(data[index["batch_size"]], 3)
+        self.assertEqual(data[index["steps"]], 7)
+        changed = [i for i, (a, b) in enumerate(zip(data, image_generator._PAYLOAD_TEMPLATE)) if a != b]
+        self.assertEqual(sorted(changed), sorted([index["prompt"], index["batch_size"], index["steps"]]))
+
+    def test_build_payload_does_not_mutate_template(self):
+        before = list(image_generator._PAYLOAD_TEMPLATE)
+        image_generator.build_payload_data({"width": 64})
+        self.assertEqual(image_generator._PAYLOAD_TEMPLATE, before)
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaises(KeyError):
+            image_generator.build_payload_data({"not_a_field": 1})
+
+    def test_defaults_match_config(self):
+        params = image_generator.default_generation_params()
+        self.assertEqual(params["width"], image_generator.DEFAULT_IMAGE_WIDTH)
+        self.assertEqual(params["sampler_name"], image_generator.DEFAULT_SAMPLER_NAME)
+        self.assertEqual(set(params), set(image_generator.GENERATION_PARAM_FIELDS))
+
+
+class TestBatchSubmission(unittest.TestCase):
+    def setUp(self):
+        self.forge = FakeForgeServer(per_image_s=0.05).start()
+        self.settings = app_config.Settings(FORGE_API_URL=self.forge.url)
+
+    def tearDown(self):
+        self.forge.stop()
+
+    def test_batch_sends_one_prompt_string(self):
+        paths = image_generator.generate_images(["a cat", "a cat"], settings=self.settings)
+        try:
+            self.assertEqual(len(paths), 2)
+            self.assertTrue(all(paths))
+        finally:
+            for path in paths:
+                image_generator.cleanup_image(path)
+        self.assertEqual(self.forge.batch_sizes, [2])
+        self.assertIsInstance(self.forge.prompts[0], str)
+        self.assertTrue(self.forge.prompts[0].endswith("a cat"))
+
+    def test_different_prompts_cannot_share_a_batch(self):
+        with self.assertRaises(ValueError):
+            image_generator.generate_images(["a cat", "a dog"], settings=self.settings)
+        self.assertEqual(self.forge.prompts, [])
+
+
+class TestPresets(unittest.TestCase):
+    def test_builtin_presets_exist(self):
+        for name in ("fast", "quality", "portrait"):
+            self.assertIsNotNone(image_generator.get_preset(name))
+
+    def test_preset_lookup_is_case_insensitive_and_copied(self):
+        preset = image_generator.get_preset("FAST")
+        preset["steps"] = 999
+        self.assertNotEqual(image_generator.get_preset("fast")["steps"], 999)
+
+    def test_unknown_preset(self):
+        self.assertIsNone(image_generator.get_preset("nope"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from src import llm_client
+from src.memory import ConversationMemory, VectorIndex, np
+from benchmarks.fakes.openai_server import fake_embedding
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestVectorIndex(unittest.TestCase):
+    def test_search_returns_top_k_best_first(self):
+        index = VectorIndex(dim=2, capacity=1)
+        index.add([[1, 0], [0, 1], [1, 1]], ["x", "y", "xy"])
+        hits = index.search([[1, 0.1], [0, 1]], k=2)
+        self.assertEqual([row for score, row in hits[0]], [0, 2])
+        self.assertEqual([row for score, row in hits[1]], [1, 2])
+        self.assertAlmostEqual(hits[1][0][0], 1.0, places=5)
+        self.assertEqual(len(index), 3)  # grew past the initial capacity
+
+    def test_limit_excludes_newest_rows(self):
+        index = VectorIndex(dim=2)
+        index.add([[1, 0], [1, 0.01]], ["old", "new"])
+        self.assertEqual(index.search([1, 0.01], k=5, limit=1), [[(mock.ANY, 0)]])
+        self.assertEqual(index.search([1, 0], k=5, limit=0), [[]])
+
+    def test_save_and_load_round_trip(self):
+        index = VectorIndex(dim=3)
+        index.add([[3, 0, 0], [0, 2, 0]], ["first", "zweite ✓"])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.npz")
+            index.save(path)
+            loaded = VectorIndex.load(path)
+        self.assertEqual(loaded.texts, index.texts)
+        np.testing.assert_allclose(loaded.vectors, index.vectors)
+        loaded.add([[0, 0, 1]], ["third"])
+        self.assertEqual(loaded.search([0, 0, 1], k=1)[0][0][1], 2)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestConversationMemory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.calls = []
+
+        def embed(texts):
+            self.calls.append(list(texts))
+            return [fake_embedding(text) for text in texts]
+
+        self.memory = ConversationMemory(embed, directory=self.temp_dir.name, save_interval_s=3600)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_pending_turns_are_embedded_with_the_query(self):
+        self.memory.add_turn("alice", "my cat is called Biscuit", "What a lovely cat name")
+        self.memory.add_turn("alice", "I work as a baker", "Early mornings then")
+        snippets = self.memory.recall("alice", "what is my cat called", k=1)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(self.calls[0]), 3)
+        self.assertIn("Biscuit", snippets[0])
+        self.assertEqual(self.memory.recall("bob", "what is my cat called", k=1), [])
+
+    def test_recent_turns_and_low_scores_are_skipped(self):
+        self.memory.add_turn("alice", "my cat is called Biscuit", "Nice")
+        self.memory.add_turn("alice", "my cat sleeps a lot", "Cats do")
+        snippets = self.memory.recall("alice", "my cat", k=5, exclude_recent=1)
+        self.assertEqual(len(snippets), 1)
+        self.assertIn("Biscuit", snippets[0])
+        self.assertEqual(self.memory.recall("alice", "quantum chromodynamics", k=5, min_score=0.5), [])
+
+    def test_failed_embedding_keeps_turns_queued(self):
+        self.memory.add_turn("alice", "my cat is called Biscuit", "Nice")
+        with mock.patch.object(self.memory, "embed", side_effect=ConnectionError("down")):
+            with self.assertRaises(ConnectionError):
+                self.memory.recall("alice", "cat", k=1)
+        self.assertIn("Biscuit", self.memory.recall("alice", "what is my cat called", k=1)[0])
+
+    def test_queued_turns_are_capped_during_an_outage(self):
+        self.memory.max_pending_turns = 3
+        with mock.patch.object(self.memory, "embed", side_effect=ConnectionError("down")):
+            for i in range(5):
+                self.memory.add_turn("alice", f"message {i}", "ok")
+                with self.assertRaises(ConnectionError):
+                    self.memory.recall("alice", "cat", k=1)
+        self.assertEqual(self.memory.stats["dropped_turns"], 2)
+        self.memory.recall("alice", "cat", k=1)
+        self.assertEqual([len(texts) for texts in self.calls], [4])
+        self.assertIn("message 2", self.calls[0][0])
+
+    def test_save_persists_and_forget_removes(self):
+        self.memory.add_turn("alice", "my cat is called Biscuit", "Nice")
+        self.memory.recall("alice", "cat", k=1)
+        self.memory.save()
+        restored = ConversationMemory(self.memory.embed, directory=self.temp_dir.name)
+        self.assertIn("Biscuit", restored.recall("alice", "what is my cat called", k=1)[0])
+        restored.forget("alice")
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        self.assertEqual(restored.recall("alice", "what is my cat called", k=1), [])
+
+    def test_save_thread_writes_without_recalls(self):
+        self.memory.save_interval_s = 0
+        self.memory.add_turn("alice", "my cat is called Biscuit", "Nice")
+        self.memory.recall("alice", "cat", k=1)
+        with mock.patch.object(self.memory, "save", wraps=self.memory.save) as save:
+            self.memory.recall("alice", "cat", k=1)
+            save.assert_not_called()
+            self.memory.start()
+            for _ in range(40):
+                if os.listdir(self.temp_dir.name):
+                    break
+                time.sleep(0.05)
+            self.memory.stop()
+        self.assertTrue(os.listdir(self.temp_dir.name))
+        self.assertGreaterEqual(save.call_count, 2)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPromptWithMemory(unittest.TestCase):
+    def setUp(self):
+        self.queries = []
+
+        def embed(texts):
+            self.queries.append(texts[-1])
+            return [fake_embedding(t) for t in texts]
+
+        with mock.patch.object(llm_client.LLMClient, "_query_model_identifier", lambda client: None):
+            self.client = llm_client.LLMClient("http://127.0.0.1:1", detect_in_background=False)
+        self.client.memory = ConversationMemory(embed, directory="")
+
+    def test_prompt_size_stays_constant_as_history_grows(self):
+        client = self.client
+        client.add_system_message("alice", "persona")
+        client.conversations["alice"].append({"role": "user", "content": "my cat is called Biscuit"})
+        client.conversations["alice"].append({"role": "assistant", "content": "Lovely"})
+        client.memory.add_turn("alice", "my cat is called Biscuit", "Lovely")
+        for i in range(30):
+            client.conversations["alice"].append({"role": "user", "content": f"filler message {i}"})
+            client.conversations["alice"].append({"role": "assistant", "content": f"filler reply {i}"})
+            client.memory.add_turn("alice", f"filler message {i}", f"filler reply {i}")
+
+        settings = llm_client.app_config.current()
+        messages = client._build_messages("alice", "what is my cat called")
+        self.assertEqual(messages[0], {"role": "system", "content": "persona"})
+        self.assertIn("Biscuit", messages[1]["content"])
+        self.assertEqual(messages[-1], {"role": "user", "content": "what is my cat called"})
+        self.assertEqual(len(messages), 2 + settings.MEMORY_RECENT_MESSAGES + 1)
+
+    def test_failed_recall_sends_the_whole_history(self):
+        client = self.client
+        client.add_system_message("alice", "persona")
+        for i in range(20):
+            client.conversations["alice"].append({"role": "user", "content": f"message {i}"})
+            client.conversations["alice"].append({"role": "assistant", "content": f"reply {i}"})
+        with mock.patch.object(client.memory, "embed", side_effect=ConnectionError("down")):
+            messages = client._build_messages("alice", "what is my cat called")
+        self.assertEqual(messages, client.conversations["alice"] + [{"role": "user", "content": "what is my cat called"}])
+
+    def test_image_prompts_recall_with_the_users_request(self):
+        client = self.client
+        client.add_system_message("alice", "persona")
+        client.memory.add_turn("alice", "my cat is called Biscuit", "Lovely")
+        instruction = client.IMAGE_PROMPT_GENERATION_INSTRUCTION_PREFIX + "my cat; sleeping"
+        messages = client._build_messages("alice", instruction)
+        self.assertEqual(self.queries, [])
+        self.assertEqual(messages[-1], {"role": "user", "content": instruction})
+        messages = client._build_messages("alice", instruction, memory_query="my cat; sleeping")
+        self.assertEqual(self.queries, ["my cat; sleeping"])
+        self.assertIn("Biscuit", messages[-2]["content"])
+
+
+if __name__ == '__main__':
+    unittest.main()
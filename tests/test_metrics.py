@@ -0,0 +1,72 @@
+import unittest
+import urllib.request
+
+from src import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter_render(self):
+        counter = metrics.Counter("test_events_total", "Test events.", label_names=("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind="b")
+        text = "\n".join(counter.render())
+        self.assertIn("# TYPE signal_backend_test_events_total counter", text)
+        self.assertIn('signal_backend_test_events_total{kind="a"} 1', text)
+        self.assertIn('signal_backend_test_events_total{kind="b"} 2', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_latency_seconds", "Test latency.", label_names=("stage",), buckets=(0.1, 1))
+        histogram.observe(0.05, stage="x")
+        histogram.observe(0.5, stage="x")
+        histogram.observe(5, stage="x")
+        lines = histogram.render()
+        self.assertIn('signal_backend_test_latency_seconds_bucket{stage="x",le="0.1"} 1', lines)
+        self.assertIn('signal_backend_test_latency_seconds_bucket{stage="x",le="1"} 2', lines)
+        self.assertIn('signal_backend_test_latency_seconds_bucket{stage="x",le="+Inf"} 3', lines)
+        self.assertIn('signal_backend_test_latency_seconds_count{stage="x"} 3', lines)
+
+    def test_time_records_even_on_error(self):
+        histogram = metrics.Histogram("test_timed_seconds", "Timed.", label_names=("stage",))
+        with self.assertRaises(ValueError):
+            with histogram.time(stage="boom"):
+                raise ValueError("x")
+        self.assertEqual(histogram.count(stage="boom"), 1)
+
+    def test_record_error_uses_exception_type(self):
+        metrics.record_error("unit_test", KeyError("k"))
+        self.assertEqual(metrics.errors_total.value(stage="unit_test", type="KeyError"), 1)
+
+    def test_registered_stats_are_exported(self):
+        stats = {"widgets": 3}
+        metrics.register_stats("unit_test_component", stats)
+        self.assertIn("signal_backend_unit_test_component_widgets_total 3", metrics.render())
+
+    def test_remote_snapshots_are_added(self):
+        counter = metrics.Counter("test_remote_total", "Remote.", label_names=("kind",))
+        histogram = metrics.Histogram("test_remote_seconds", "Remote.", label_names=("stage",), buckets=(1,))
+        stats = {"jobs": 2}
+        metrics.register_stats("unit_test_remote", stats)
+        counter.inc(kind="a")
+        histogram.observe(0.5, stage="x")
+        remote = metrics.snapshot()
+        try:
+            metrics.merge_remote("unit-test-worker", remote)
+            text = metrics.render()
+        finally:
+            metrics._remote_snapshots.pop("unit-test-worker", None)
+        self.assertIn('signal_backend_test_remote_total{kind="a"} 2', text)
+        self.assertIn('signal_backend_test_remote_seconds_bucket{stage="x",le="1"} 2', text)
+        self.assertIn("signal_backend_unit_test_remote_jobs_total 4", text)
+
+    def test_http_endpoint(self):
+        self.assertTrue(metrics.start_metrics_server("127.0.0.1", 0))
+        try:
+            host, port = metrics._metrics_server.server_address
+            body = urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5).read().decode()
+            self.assertIn("signal_backend_message_stage_seconds", body)
+        finally:
+            metrics.stop_metrics_server()
+
+
+if __name__ == '__main__':
+    unittest.main()
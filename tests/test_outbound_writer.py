@@ -0,0 +1,140 @@
+import json
+import queue
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import metrics, signal_handler
+from src.outbound_writer import OutboundWriter
+
+
+def read_available(sock, timeout=0.2):
+    sock.settimeout(timeout)
+    chunks = []
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.timeout:
+        pass
+    return b"".join(chunks)
+
+
+class TestOutboundWriter(unittest.TestCase):
+    def setUp(self):
+        self.local, self.remote = socket.socketpair()
+        self.local.setblocking(False)
+
+    def tearDown(self):
+        self.local.close()
+        self.remote.close()
+
+    def test_queued_frames_go_out_in_one_write(self):
+        writer = OutboundWriter(self.local)
+        for i in range(5):
+            writer.append({"jsonrpc": "2.0", "method": "send", "params": {"message": f"héllo {i}"}, "id": i})
+        self.assertTrue(writer.flush())
+        self.assertEqual(writer.stats["writes"], 1)
+        lines = read_available(self.remote).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], list(range(5)))
+        self.assertEqual(json.loads(lines[0])["params"]["message"], "héllo 0")
+
+    def test_partial_write_resumes_without_losing_bytes(self):
+        self.local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        writer = OutboundWriter(self.local)
+        written = []
+        writer.append({"id": 1, "params": {"message": "x" * 1_000_000}}, on_written=lambda: written.append(1))
+        self.assertFalse(writer.flush())
+        self.assertGreater(writer.stats["partial_writes"], 0)
+        self.assertEqual(written, [])
+        received = bytearray()
+        while writer.pending:
+            received += read_available(self.remote, timeout=0.01)
+            writer.flush()
+        received += read_available(self.remote)
+        self.assertEqual(written, [1])
+        self.assertEqual(len(json.loads(received)["params"]["message"]), 1_000_000)
+
+
+class TestSendQueueLoop(unittest.TestCase):
+    def setUp(self):
+        self.local, self.remote = socket.socketpair()
+        self.local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.local.setblocking(False)
+        signal_handler.signal_socket = self.local
+        signal_handler.running = True
+        self.sender = threading.Thread(target=signal_handler.handle_send_queue_loop, daemon=True)
+
+    def tearDown(self):
+        if self.sender.is_alive():
+            signal_handler.send_queue.put((None,) * 6)
+            self.sender.join(timeout=5)
+        signal_handler.running = True
+        signal_handler.signal_socket = None
+        signal_handler.outbound_writers.clear()
+        signal_handler.pending_send_acks.clear()
+        self.local.close()
+        self.remote.close()
+
+    def test_backpressure_holds_messages_in_queue_until_daemon_reads(self):
+        with mock.patch.object(signal_handler, "SEND_BUFFER_HIGH_WATER_BYTES", 64 * 1024):
+            waits = signal_handler.outbound_stats["backpressure_waits"]
+            self.sender.start()
+            for i in range(200):
+                signal_handler.send_signal_message("+15551112222", f"{i} " + "y" * 4000)
+            time.sleep(1.2)
+            # One wait however long it lasts, not one per pass of the send loop
+            self.assertEqual(signal_handler.outbound_stats["backpressure_waits"], waits + 1)
+            # The daemon isn't reading: the buffer stops at the high-water mark and the rest stays queued
+            self.assertGreater(signal_handler.send_queue.qsize(), 0)
+            self.assertLess(sum(w.pending for w in signal_handler.outbound_writers.values()), 64 * 1024 + 8192)
+
+            received = bytearray()
+            deadline = time.monotonic() + 10
+            while received.count(b"\n") < 200 and time.monotonic() < deadline:
+                received += read_available(self.remote, timeout=0.05)
+        frames = [json.loads(line) for line in received.splitlines()]
+        self.assertEqual([int(f["params"]["message"].split()[0]) for f in frames], list(range(200)))
+        self.assertEqual(len({f["id"] for f in frames}), 200)
+
+    def test_full_send_queue_blocks_then_drops(self):
+        full_queue = queue.Queue(maxsize=2)
+        with mock.patch.object(signal_handler, "send_queue", full_queue), \
+                mock.patch.object(signal_handler, "SEND_QUEUE_PUT_TIMEOUT_S", 0.3):
+            for i in range(2):
+                signal_handler.send_signal_message("+15551112222", f"{i}")
+            dropped = metrics.errors_total.value(stage="send", type="queue_full")
+            started = time.monotonic()
+            signal_handler.send_signal_message("+15551112222", "dropped")
+            self.assertGreaterEqual(time.monotonic() - started, 0.25)
+            self.assertEqual(metrics.errors_total.value(stage="send", type="queue_full"), dropped + 1)
+
+            # The producer goes on as soon as the sender makes room
+            threading.Timer(0.1, full_queue.get).start()
+            started = time.monotonic()
+            signal_handler.send_signal_message("+15551112222", "queued")
+            self.assertLess(time.monotonic() - started, 0.25)
+            self.assertEqual(metrics.errors_total.value(stage="send", type="queue_full"), dropped + 1)
+            self.assertEqual([item[1] for item in list(full_queue.queue)], ["1", "queued"])
+
+    def test_buffered_replies_are_flushed_at_shutdown(self):
+        self.sender.start()
+        for i in range(50):
+            signal_handler.send_signal_message("+15551112222", f"{i} " + "z" * 4000)
+        signal_handler.send_queue.put((None,) * 6)
+        received = bytearray()
+        deadline = time.monotonic() + 5
+        while received.count(b"\n") < 50 and time.monotonic() < deadline:
+            received += read_available(self.remote, timeout=0.05)
+        self.sender.join(timeout=5)
+        self.assertFalse(self.sender.is_alive())
+        frames = [json.loads(line) for line in received.splitlines()]
+        self.assertEqual([int(f["params"]["message"].split()[0]) for f in frames], list(range(50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import config as app_config
+from src import metrics, signal_handler
+from src.llm_client import LLMClient
+from src.prewarm import PromptPrewarmer
+from benchmarks.fakes.openai_server import FakeOpenAIServer
+
+ENABLED = app_config.Settings(PREWARM_ENABLED=True, PREWARM_COOLDOWN_S=60.0, PREWARM_BUDGET_PER_MIN=10)
+
+
+class TestPromptPrewarmer(unittest.TestCase):
+    def setUp(self):
+        self.warmed = []
+        self.release = threading.Event()
+        self.release.set()
+        self.prewarmer = PromptPrewarmer(self.prewarm)
+        self.prewarmer.start()
+        patcher = mock.patch.object(app_config, "_current", ENABLED)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.prewarmer.stop)
+
+    def prewarm(self, conversation):
+        self.release.wait(5)
+        self.warmed.append(conversation)
+        return conversation != "small"
+
+    def test_disabled_by_default(self):
+        with mock.patch.object(app_config, "_current", app_config.Settings()):
+            self.assertFalse(self.prewarmer.submit("conv"))
+
+    def test_cooldown_and_busy(self):
+        self.assertTrue(self.prewarmer.submit("conv"))
+        self.assertTrue(self.prewarmer.before_request("conv"))
+        self.assertFalse(self.prewarmer.submit("conv"))
+        self.assertFalse(self.prewarmer.submit("other", busy=True))
+        self.assertEqual(self.prewarmer.stats["skipped_cooldown"], 1)
+        self.assertEqual(self.prewarmer.stats["skipped_busy"], 1)
+        # The warm flag is consumed by the first request
+        self.assertFalse(self.prewarmer.before_request("conv"))
+
+    def test_budget_is_shared_between_workers(self):
+        self.prewarmer.budget_share = 5
+        self.assertTrue(self.prewarmer.submit("a"))
+        self.assertTrue(self.prewarmer.submit("b"))
+        self.assertFalse(self.prewarmer.submit("c"))
+        self.assertEqual(self.prewarmer.stats["skipped_budget"], 1)
+
+    def test_skipped_prewarms_leave_the_budget_alone(self):
+        self.prewarmer.budget_share = 10
+        self.prewarmer.needed = lambda conversation: conversation != "new"
+        self.assertFalse(self.prewarmer.submit("new"))
+        self.assertTrue(self.prewarmer.submit("conv"))
+        while "conv" in self.prewarmer._in_flight:
+            time.sleep(0.01)
+        with mock.patch.object(app_config, "_current", app_config.Settings(
+                PREWARM_ENABLED=True, PREWARM_COOLDOWN_S=0.0, PREWARM_BUDGET_PER_MIN=10)):
+            self.assertFalse(self.prewarmer.submit("conv"))
+        self.assertEqual(self.prewarmer.stats["skipped_small"], 1)
+        self.assertEqual(self.prewarmer.stats["skipped_warm"], 1)
+        self.assertEqual(self.prewarmer.stats["skipped_budget"], 0)
+        self.assertEqual(self.warmed, ["conv"])
+
+    def test_request_waits_for_running_prewarm(self):
+        self.release.clear()
+        self.assertTrue(self.prewarmer.submit("conv"))
+        threading.Timer(0.2, self.release.set).start()
+        started = time.monotonic()
+        self.assertTrue(self.prewarmer.before_request("conv"))
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_nothing_to_warm(self):
+        self.assertTrue(self.prewarmer.submit("small"))
+        self.assertFalse(self.prewarmer.before_request("small"))
+        self.assertEqual(self.prewarmer.stats["skipped_small"], 1)
+
+
+class TestLLMClientPrewarm(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer(prompt_s_per_word=0.0005, cache_slots=4, completion_tokens=5).start()
+        self.client = LLMClient(self.server.url, detect_in_background=False)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_prewarm_caches_the_history_prefix(self):
+        self.assertFalse(self.client.prewarm("u1"))
+        self.client.send_request("long story " * 500, user_id="u1")
+        self.assertFalse(self.client.prewarm("u1", min_words=10_000))
+        self.assertFalse(self.client.needs_prewarm("u1", min_words=10_000))
+        self.assertTrue(self.client.needs_prewarm("u1", min_words=100))
+
+        before = metrics.first_token_seconds.count(prewarmed="true")
+        self.assertTrue(self.client.prewarm("u1", min_words=100))
+        self.assertEqual(self.server.requests[-1]["max_tokens"], 1)
+        self.assertEqual(self.server.requests[-1]["messages"], self.client.conversations["u1"])
+        cached = self.server.cached_words
+        self.client.send_request("and then?", user_id="u1", prewarmed=True)
+        self.assertGreaterEqual(self.server.cached_words - cached, 1000)
+        self.assertEqual(metrics.first_token_seconds.count(prewarmed="true"), before + 1)
+
+
+class TestTypingEvents(unittest.TestCase):
+    def envelope(self, action="STARTED", source="uuid-1"):
+        return {"params": {"envelope": {"sourceUuid": source, "sourceNumber": "+15551112222",
+                                        "typingMessage": {"action": action, "timestamp": 1}}}}
+
+    def test_parse_typing_event(self):
+        self.assertEqual(signal_handler.parse_typing_event(self.envelope()),
+                         {"sender": "uuid-1", "conversation": "uuid-1"})
+        self.assertEqual(signal_handler.parse_typing_event(self.envelope(), account="+15550000001")["conversation"],
+                         "+15550000001:uuid-1")
+        self.assertIsNone(signal_handler.parse_typing_event(self.envelope(action="STOPPED")))
+        self.assertIsNone(signal_handler.parse_typing_event(self.envelope(source="+15550000000"), account="+15550000000"))
+        self.assertIsNone(signal_handler.parse_incoming_message(self.envelope()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src import llm_client, signal_handler
+from src.readiness import ReadinessTracker
+
+
+class TestReadinessTracker(unittest.TestCase):
+    def test_ready_once_all_components_resolved(self):
+        tracker = ReadinessTracker()
+        tracker.begin("signal_cli", "llm_model", "forge")
+        tracker.ready("signal_cli")
+        tracker.failed("forge", "connection refused")
+        self.assertIsNone(tracker.ready_after)
+        tracker.ready("llm_model", "test-model")
+        self.assertIsNotNone(tracker.ready_after)
+        self.assertTrue(tracker.is_ready("llm_model"))
+        self.assertFalse(tracker.is_ready("forge"))
+        self.assertEqual(set(tracker.durations), {"signal_cli", "llm_model", "forge"})
+
+    def test_wait_blocks_until_reported(self):
+        tracker = ReadinessTracker()
+        threading.Timer(0.05, tracker.ready, args=("signal_cli",)).start()
+        self.assertFalse(tracker.wait("llm_model", timeout=0.01))
+        self.assertTrue(tracker.wait("signal_cli", timeout=2))
+
+
+class TestBackgroundModelDetection(unittest.TestCase):
+    def test_requests_wait_for_model_detection(self):
+        detection_started = threading.Event()
+        release_detection = threading.Event()
+
+        def slow_detection(client):
+            detection_started.set()
+            release_detection.wait(2)
+            client.model_identifier = "test-model"
+
+        with mock.patch.object(llm_client.LLMClient, "_query_model_identifier", slow_detection):
+            started = time.perf_counter()
+            client = llm_client.LLMClient("http://127.0.0.1:1")
+            self.assertLess(time.perf_counter() - started, 0.5)
+            self.assertTrue(detection_started.wait(2))
+            self.assertFalse(client.wait_until_ready(timeout=0.01))
+            release_detection.set()
+            self.assertTrue(client.wait_until_ready(timeout=2))
+            self.assertEqual(client.model_identifier, "test-model")
+
+
+class TestDaemonConnection(unittest.TestCase):
+    def tearDown(self):
+        if signal_handler.signal_socket:
+            signal_handler.signal_socket.close()
+            signal_handler.signal_socket = None
+        signal_handler.running = True
+
+    def test_connect_polls_until_daemon_listens(self):
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        def listen_later():
+            time.sleep(0.3)
+            server.bind(("127.0.0.1", port))
+            server.listen()
+
+        threading.Thread(target=listen_later, daemon=True).start()
+        try:
+            self.assertTrue(signal_handler.connect_socket_to_daemon(f"127.0.0.1:{port}", timeout=5))
+        finally:
+            server.close()
+
+    def test_extra_account_connects_and_reconnects_in_background(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        address = "127.0.0.1:%d" % server.getsockname()[1]
+        server.close()
+        thread = threading.Thread(target=signal_handler.maintain_extra_account, args=("+15550000002", address), daemon=True)
+        try:
+            thread.start()
+            time.sleep(0.3)
+            self.assertNotIn("+15550000002", signal_handler.extra_sockets)  # Not listening yet; keeps trying
+            server = socket.socket()
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(("127.0.0.1", int(address.rsplit(":", 1)[1])))
+            server.listen()
+            first = self.wait_for_socket("+15550000002")
+            signal_handler._close_extra_socket("+15550000002")  # What the reader does when the daemon goes away
+            second = self.wait_for_socket("+15550000002")
+            self.assertIsNot(first, second)
+        finally:
+            signal_handler.running = False
+            thread.join(timeout=5)
+            signal_handler._close_extra_socket("+15550000002")
+            server.close()
+        self.assertFalse(thread.is_alive())
+
+    def wait_for_socket(self, account):
+        deadline = time.monotonic() + 5
+        while account not in signal_handler.extra_sockets and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return signal_handler.extra_sockets[account]
+
+    def test_connect_gives_up_after_timeout(self):
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        self.assertFalse(signal_handler.connect_socket_to_daemon(f"127.0.0.1:{port}", timeout=0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import tracing
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "spans.jsonl")
+        self.patches = [
+            mock.patch.object(tracing, "TRACE_EXPORT_PATH", self.path),
+            mock.patch.object(tracing, "TRACE_EXPORT_MAX_BYTES", 2048),
+            mock.patch.object(tracing, "TRACE_EXPORT_BACKUPS", 2),
+            mock.patch.object(tracing, "_exporter", None),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        logger = logging.getLogger("signal_backend.spans")
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.temp_dir.cleanup()
+
+    def exported(self):
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_span_exports_opentelemetry_fields(self):
+        with tracing.start_span("signal.message", **{"signal.sender": "u1"}):
+            pass
+        span = self.exported()[0]
+        self.assertEqual(len(span["traceId"]), 32)
+        self.assertEqual(len(span["spanId"]), 16)
+        self.assertEqual(span["parentSpanId"], "")
+        self.assertEqual(span["name"], "signal.message")
+        self.assertGreaterEqual(span["endTimeUnixNano"], span["startTimeUnixNano"])
+        self.assertEqual(span["attributes"], {"signal.sender": "u1"})
+        self.assertEqual(span["status"]["code"], "STATUS_CODE_OK")
+        self.assertEqual(span["resource"]["service.name"], tracing.SERVICE_NAME)
+
+    def test_children_share_the_trace(self):
+        root = tracing.start_span("signal.message")
+        with tracing.start_span("llm.chat_completion", root):
+            pass
+        tracing.record_span("forge.queue", root, 10, 20)
+        root.end()
+        child, recorded, exported_root = self.exported()
+        self.assertEqual({child["traceId"], recorded["traceId"]}, {root.trace_id})
+        self.assertEqual(child["parentSpanId"], root.span_id)
+        self.assertEqual((recorded["startTimeUnixNano"], recorded["endTimeUnixNano"]), (10, 20))
+        self.assertEqual(exported_root["spanId"], root.span_id)
+
+    def test_errors_are_recorded_on_the_span(self):
+        with self.assertRaises(ValueError):
+            with tracing.start_span("forge.generate"):
+                raise ValueError("boom")
+        span = self.exported()[0]
+        self.assertEqual(span["status"], {"code": "STATUS_CODE_ERROR", "message": "boom"})
+        self.assertEqual(span["attributes"]["exception.type"], "ValueError")
+
+    def test_span_ends_only_once(self):
+        span = tracing.start_span("signal.send")
+        span.end()
+        span.end()
+        self.assertEqual(len(self.exported()), 1)
+
+    def test_export_file_rotates(self):
+        for _ in range(50):
+            tracing.start_span("signal.message", padding="x" * 100).end()
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+    def test_record_span_without_parent_is_noop(self):
+        self.assertIsNone(tracing.record_span("forge.queue", None, 1, 2))
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestMessageProfiler(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profiler = tracing.MessageProfiler(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_profiles_only_while_armed(self):
+        self.assertEqual(self.profiler.run("t0", sum, [1, 2]), 3)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+        self.profiler.arm(1)
+        self.assertEqual(self.profiler.run("t1", sum, [1, 2]), 3)
+        self.profiler.run("t2", sum, [1, 2])
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ["profile-t1.prof", "profile-t1.txt"])
+
+    def test_capture_stacks_lists_threads(self):
+        path = self.profiler.capture_stacks()
+        with open(path, encoding='utf-8') as f:
+            self.assertIn("MainThread", f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from src.message_types import message_kind
+from src import traffic_capture
+from src.traffic_capture import TrafficRecorder, read_capture, restore_bodies
+
+
+def make_frame(body):
+    return {"jsonrpc": "2.0", "method": "receive", "params": {"account": "+10000000000", "envelope": {
+        "sourceUuid": "u1", "sourceNumber": "+15550000001", "timestamp": 1,
+        "dataMessage": {"timestamp": 1, "message": body}}}}
+
+
+class TestTrafficCapture(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "capture.jsonl.gz")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def record(self, body_mode, bodies):
+        recorder = TrafficRecorder(self.path, body_mode)
+        recorder.open()
+        for index, body in enumerate(bodies):
+            recorder.record(make_frame(body), received_at=100.0 + index)
+        recorder.close()
+        return list(read_capture(self.path))
+
+    def test_presets_and_cancel_survive_redaction(self):
+        records = self.record("hash", ["/fast xx a cat", "/portrait hello there", "/cancel"])
+        data_message = records[0][1]["params"]["envelope"]["dataMessage"]
+        self.assertEqual((data_message["messageKind"], data_message["messagePreset"]), ("image_direct", "fast"))
+        self.assertEqual(data_message["messageLength"], len("xx a cat"))
+        bodies = [restore_bodies(frame)["params"]["envelope"]["dataMessage"]["message"] for _, frame in records]
+        self.assertTrue(bodies[0].startswith("/fast xx "))
+        self.assertTrue(bodies[1].startswith("/portrait "))
+        self.assertEqual([message_kind(body) for body in bodies], ["image_direct", "chat", "cancel"])
+
+    def test_keep_mode_round_trips_frames(self):
+        records = self.record("keep", ["hello", "xx a cat"])
+        self.assertEqual([t for t, _ in records], [100.0, 101.0])
+        self.assertEqual(records[1][1], make_frame("xx a cat"))
+
+    def test_hash_mode_hides_bodies_but_keeps_shape(self):
+        records = self.record("hash", ["my secret plan;"])
+        data_message = records[0][1]["params"]["envelope"]["dataMessage"]
+        self.assertTrue(data_message["message"].startswith("sha256:"))
+        self.assertNotIn("secret", data_message["message"])
+        self.assertEqual(data_message["messageKind"], "image_llm")
+        self.assertEqual(data_message["messageLength"], len("my secret plan;"))
+
+    def test_redacted_frames_are_restored_with_synthesized_bodies(self):
+        records = self.record("redact", ["hello there friend", "xx a cat", "/reset"])
+        bodies = [restore_bodies(frame)["params"]["envelope"]["dataMessage"]["message"] for _, frame in records]
+        self.assertEqual([message_kind(body) for body in bodies], ["chat", "image_direct", "reset"])
+        self.assertNotIn("messageKind", records[0][1]["params"]["envelope"]["dataMessage"])
+
+    def test_capture_survives_a_crash(self):
+        recorder = TrafficRecorder(self.path, "keep")
+        recorder.open()
+        for index in range(2000):
+            recorder.record(make_frame(f"message {index}"), received_at=float(index))
+        # A killed process never closes the file; whatever reached it is all there is
+        with open(self.path, "rb") as f:
+            data = f.read()
+        recorder.close()
+        crashed = os.path.join(self.temp_dir.name, "crashed.jsonl.gz")
+        for length in (len(data), len(data) - 7):
+            with open(crashed, "wb") as f:
+                f.write(data[:length])
+            times = [t for t, _ in read_capture(crashed)]
+            self.assertGreaterEqual(len(times), 2000 - traffic_capture.CAPTURE_FLUSH_RECORDS)
+            self.assertEqual(times, [float(index) for index in range(len(times))])
+
+    def test_recording_does_not_mutate_frame(self):
+        frame = make_frame("private")
+        recorder = TrafficRecorder(self.path, "hash")
+        recorder.open()
+        recorder.record(frame)
+        recorder.close()
+        self.assertEqual(frame["params"]["envelope"]["dataMessage"]["message"], "private")
+
+    def test_invalid_body_mode(self):
+        with self.assertRaises(ValueError):
+            TrafficRecorder(self.path, "encrypt")
+
+
+if __name__ == '__main__':
+    unittest.main()
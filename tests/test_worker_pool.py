@@ -0,0 +1,60 @@
+import os
+import queue
+import unittest
+from unittest import mock
+
+from src import signal_handler
+from src.worker_pool import WorkerPool, shard_for
+
+
+class TestSharding(unittest.TestCase):
+    def test_shard_is_stable_and_spreads_inside_a_worker(self):
+        senders = [f"user-{i}" for i in range(400)]
+        self.assertEqual([shard_for(s, 4) for s in senders], [shard_for(s, 4) for s in senders])
+        # Threads of worker process 0 out of 2 must all get senders, even though 4 threads share a factor with 2
+        in_worker = [s for s in senders if shard_for(s, 2) == 0]
+        self.assertEqual({shard_for(s, 4, stride=2) for s in in_worker}, {0, 1, 2, 3})
+
+
+class TestAccounts(unittest.TestCase):
+    def frame(self, account, source="+15551112222"):
+        return {"params": {"account": account, "envelope": {
+            "sourceNumber": source, "sourceUuid": "uuid-1", "timestamp": 1,
+            "dataMessage": {"message": "hello"},
+        }}}
+
+    def test_conversations_are_kept_per_account(self):
+        primary = signal_handler.parse_incoming_message(self.frame(signal_handler.YOUR_SIGNAL_NUMBER))
+        extra = signal_handler.parse_incoming_message(self.frame("+15559990000"), account="+15559990000")
+        self.assertEqual(primary["conversation"], "uuid-1")
+        self.assertEqual(extra["conversation"], "+15559990000:uuid-1")
+        self.assertEqual(extra["account"], "+15559990000")
+        # The account's own messages are never answered
+        self.assertIsNone(signal_handler.parse_incoming_message(self.frame("+15559990000", source="+15559990000"), account="+15559990000"))
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_replies_return_over_the_outbound_channel(self):
+        replies = queue.Queue()
+        controls = []
+        # Workers inherit the environment; an unreachable LLM server keeps model detection short
+        with mock.patch.dict(os.environ, {"API_URL": "http://127.0.0.1:1", "TRACE_EXPORT_PATH": "", "MEMORY_ENABLED": "False"}):
+            pool = WorkerPool(2, on_send=replies.put, on_control=lambda *args, **kwargs: controls.append(args)).start()
+        try:
+            senders = [f"sender-{i}" for i in range(4)]
+            for sender in senders:
+                pool.submit({"sender": sender, "recipient": sender, "body": "/presets", "account": "+15559990000",
+                             "conversation": sender, "timestamp": 1, "enqueued_at": 0.0, "enqueued_ns": 0, "span": None})
+            received = [replies.get(timeout=60) for _ in senders]
+        finally:
+            pool.stop()
+        self.assertEqual(sorted(item[0] for item in received), senders)
+        for recipient, text, attachments, enqueued_at, trace, account in received:
+            self.assertIn("Image presets", text)
+            self.assertEqual(account, "+15559990000")
+        self.assertEqual(pool.stats["replies"], 4)
+        self.assertEqual(pool.stats["restarts"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()